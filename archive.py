@@ -0,0 +1,112 @@
+"""
+arquivamento das partidas antigas em bancos SQLite mensais
+move as partidas mais velhas que o horizonte (ARCHIVE_AFTER_DAYS) da tabela
+principal pra archive/matches_YYYY_MM.db; as consultas do database.py anexam
+esses arquivos sozinhas quando o intervalo pedido precisa deles
+
+Como usar:
+    python archive.py                       # arquiva o que tiver mais de ARCHIVE_AFTER_DAYS dias
+    python archive.py --days 90
+    python archive.py --before 2024-06-01
+    python archive.py --list
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+import database
+
+ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', 180))
+
+# o par normalizado também vai junto, pro head-to-head achar as partidas arquivadas;
+# a chave de idempotência vai de registro (a conferência dos reenvios usa a match_keys, que fica)
+ARCHIVE_COLUMNS = f"{database.MATCH_COLUMNS}, pair_lo, pair_hi, idempotency_key"
+
+
+def _next_month(month: str) -> str:
+    year, mon = int(month[:4]), int(month[5:7])
+    return f"{year + 1:04d}-01" if mon == 12 else f"{year:04d}-{mon + 1:02d}"
+
+
+def _archive_month(month: str, cutoff: str) -> int:
+    """move as partidas do mês (até o cutoff) pro arquivo do mês numa transação só"""
+    path = database.archive_path(month)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    conn = database.get_db_connection()
+    try:
+        conn.execute('ATTACH DATABASE ? AS archive', (path,))
+        database.create_matches_table(conn.cursor(), 'archive')
+        conn.commit()
+
+        bounds = (month, min(_next_month(month), cutoff))
+        try:
+            # copia antes de apagar: se cair no meio, rodar de novo não perde nem duplica nada
+            conn.execute(f'''
+                INSERT OR IGNORE INTO archive.matches ({ARCHIVE_COLUMNS})
+                SELECT {ARCHIVE_COLUMNS} FROM main.matches
+                WHERE timestamp >= ? AND timestamp < ?
+            ''', bounds)
+            moved = conn.execute('DELETE FROM main.matches WHERE timestamp >= ? AND timestamp < ?',
+                                 bounds).rowcount
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    finally:
+        try:
+            conn.execute('DETACH DATABASE archive')
+        except sqlite3.OperationalError:
+            pass
+        conn.close()
+
+    return moved
+
+
+def archive_matches(before: Optional[str] = None, days: int = ARCHIVE_AFTER_DAYS) -> Dict[str, int]:
+    """arquiva as partidas com timestamp < before (padrão: agora - days); devolve {mês: partidas}"""
+    cutoff = before or (datetime.now() - timedelta(days=days)).isoformat()
+
+    conn = database.get_db_connection()
+    months = [row[0] for row in conn.execute('''
+        SELECT DISTINCT substr(timestamp, 1, 7) FROM matches
+        WHERE timestamp < ?
+        ORDER BY 1
+    ''', (cutoff,))]
+    conn.close()
+
+    # um mês por vez, pra não segurar o lock de escrita durante o arquivamento inteiro
+    return {month: _archive_month(month, cutoff) for month in months}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Arquiva partidas antigas em bancos mensais')
+    parser.add_argument('--db', default=database.DATABASE_PATH, help='arquivo do banco')
+    parser.add_argument('--days', type=int, default=ARCHIVE_AFTER_DAYS,
+                        help='arquiva partidas com mais de N dias')
+    parser.add_argument('--before', help='arquiva partidas antes dessa data (ISO 8601)')
+    parser.add_argument('--list', action='store_true', help='só lista os arquivos existentes')
+    args = parser.parse_args(argv)
+
+    database.DATABASE_PATH = args.db
+
+    if args.list:
+        for month, path in database.list_archives():
+            print(f"{month}  {path}  {os.path.getsize(path):,} bytes")
+        return 0
+
+    started = time.perf_counter()
+    moved = archive_matches(args.before, args.days)
+    for month, count in moved.items():
+        print(f"  {month}: {count:,} partidas -> {database.archive_path(month)}")
+    print(f"Arquivou {sum(moved.values()):,} partidas em {time.perf_counter() - started:.2f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,370 @@
+"""
+snapshots online do banco usando a API de backup incremental do SQLite
+copia poucas páginas por passo e dorme entre os passos, então o app continua
+gravando enquanto o backup roda; tem restore, compressão gzip opcional e um
+agendador que roda em thread no próprio app
+
+os arquivos mensais (archive/matches_YYYY_MM.db) vão junto, numa pasta
+<snapshot>.archive ao lado do snapshot, e voltam no restore
+
+Como usar:
+    python backup.py backup                      # snapshot em data/backups/
+    python backup.py backup --compress           # snapshot .db.gz
+    python backup.py list
+    python backup.py restore data/backups/tekken_stats_20250101_120000.db.gz
+    python backup.py schedule --interval 3600    # roda em primeiro plano
+"""
+
+import argparse
+import glob
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import List, Optional
+
+import database
+import leagues
+
+logger = logging.getLogger(__name__)
+
+BACKUP_DIR = os.getenv('BACKUP_DIR', 'data/backups')
+BACKUP_PAGES = int(os.getenv('BACKUP_PAGES', 64))
+BACKUP_SLEEP = float(os.getenv('BACKUP_SLEEP', 0.05))
+BACKUP_INTERVAL_SECONDS = int(os.getenv('BACKUP_INTERVAL_SECONDS', 0))  # 0 = sem agendamento
+BACKUP_KEEP = int(os.getenv('BACKUP_KEEP', 7))
+BACKUP_COMPRESS = os.getenv('BACKUP_COMPRESS', 'False').lower() == 'true'
+# sem WAL, cada gravação de outra conexão faz o SQLite recomeçar a cópia do zero
+BACKUP_MAX_RESTARTS = int(os.getenv('BACKUP_MAX_RESTARTS', 3))
+
+
+class BackupRestarted(Exception):
+    """a cópia recomeçou vezes demais por causa de gravações concorrentes"""
+
+
+def _copy_pages(source: sqlite3.Connection, target: sqlite3.Connection, pages: int, sleep: float,
+                max_restarts: Optional[int] = None):
+    """copia o banco em passos de `pages` páginas, dormindo entre os passos"""
+    state = {'remaining': None, 'restarts': 0}
+
+    def progress(status, remaining, total):
+        # se sobrou mais página do que no passo anterior, o SQLite recomeçou a cópia
+        if state['remaining'] is not None and remaining > state['remaining']:
+            state['restarts'] += 1
+            if max_restarts is not None and state['restarts'] > max_restarts:
+                raise BackupRestarted(f"backup recomeçou {state['restarts']} vezes")
+        state['remaining'] = remaining
+        # a pausa entre os passos deixa os escritores pegarem o lock
+        if remaining and sleep > 0:
+            time.sleep(sleep)
+
+    source.backup(target, pages=pages, progress=progress)
+
+
+def _snapshot(source: sqlite3.Connection, target: sqlite3.Connection, pages: int, sleep: float):
+    """
+    em WAL segura uma transação de leitura na origem: a cópia enxerga um retrato fixo
+    e os escritores seguem gravando no WAL. sem WAL tenta copiar entre as gravações e,
+    se recomeçar demais, segura o lock de leitura até o fim (as gravações esperam)
+    """
+    journal_mode = source.execute('PRAGMA journal_mode').fetchone()[0].lower()
+    if journal_mode != 'wal':
+        try:
+            _copy_pages(source, target, pages, sleep, BACKUP_MAX_RESTARTS)
+            return
+        except BackupRestarted as e:
+            logger.warning(f"{e}; copiando com lock de leitura")
+
+    source.execute('BEGIN')
+    try:
+        source.execute('SELECT count(*) FROM sqlite_master').fetchone()
+        _copy_pages(source, target, pages, sleep)
+    finally:
+        source.rollback()
+
+
+def league_backup_dir(key: str) -> str:
+    """pasta dos snapshots da liga; a padrão ('main') usa o BACKUP_DIR direto"""
+    if key == leagues.DEFAULT_LEAGUE:
+        return BACKUP_DIR
+    # os bancos das ligas têm todos o mesmo nome de arquivo: uma pasta por liga
+    return os.path.join(BACKUP_DIR, 'leagues', key)
+
+
+def _default_snapshot_path(compress: bool, directory: Optional[str] = None) -> str:
+    name = os.path.splitext(os.path.basename(database.get_database_path()))[0]
+    stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    return os.path.join(directory or BACKUP_DIR, f"{name}_{stamp}.db" + ('.gz' if compress else ''))
+
+
+def archive_snapshot_dir(snapshot: str) -> str:
+    """pasta com os arquivos mensais do snapshot ('x_20250101_120000.db.gz' -> 'x_20250101_120000.archive')"""
+    stem = snapshot[:-len('.gz')] if snapshot.endswith('.gz') else snapshot
+    return os.path.splitext(stem)[0] + '.archive'
+
+
+def _snapshot_file(source_path: str, raw_path: str, dest: str, pages: int, sleep: float):
+    """snapshot de um arquivo SQLite em `raw_path`, comprimido em `dest` quando os dois diferem"""
+    source = sqlite3.connect(source_path)
+    target = sqlite3.connect(raw_path)
+    try:
+        _snapshot(source, target, pages, sleep)
+    finally:
+        target.close()
+        source.close()
+
+    if dest != raw_path:
+        with open(raw_path, 'rb') as f_in, gzip.open(dest, 'wb') as f_out:
+            shutil.copyfileobj(f_in, f_out)
+        os.remove(raw_path)
+
+
+def backup_database(dest: Optional[str] = None, compress: bool = False,
+                    pages: int = BACKUP_PAGES, sleep: float = BACKUP_SLEEP) -> str:
+    """gera um snapshot consistente do banco atual e dos arquivos mensais e devolve o caminho"""
+    if dest is None:
+        dest = _default_snapshot_path(compress)
+    compress = compress or dest.endswith('.gz')
+    os.makedirs(os.path.dirname(dest) or '.', exist_ok=True)
+
+    started = time.perf_counter()
+    # grava em temporários e só renomeia no fim, nunca fica snapshot pela metade
+    partial = dest + '.partial'
+    raw_path = partial[:-len('.gz.partial')] + '.db.partial' if compress else partial
+    _snapshot_file(database.get_database_path(), raw_path, partial, pages, sleep)
+
+    # o banco principal vai antes: se o archive.py mover partidas no meio, elas saem
+    # repetidas (no principal e no arquivo) e o restore tira a cópia do principal
+    archive_dir = archive_snapshot_dir(dest)
+    archive_partial = archive_dir + '.partial'
+    shutil.rmtree(archive_partial, ignore_errors=True)
+    os.makedirs(archive_partial)
+    archives = database.list_archives()
+    for _, path in archives:
+        raw_archive = os.path.join(archive_partial, os.path.basename(path))
+        _snapshot_file(path, raw_archive, raw_archive + ('.gz' if compress else ''), pages, sleep)
+
+    shutil.rmtree(archive_dir, ignore_errors=True)
+    os.replace(archive_partial, archive_dir)
+    os.replace(partial, dest)
+    logger.info(f"Backup saved to {dest} ({os.path.getsize(dest):,} bytes, {len(archives)} archives "
+                f"in {time.perf_counter() - started:.2f}s)")
+    return dest
+
+
+def _restore_file(snapshot: str, target_path: str, pages: int, sleep: float):
+    """copia um snapshot (.db ou .db.gz) conferido por cima de `target_path`, em passos"""
+    temp_path = None
+    try:
+        if snapshot.endswith('.gz'):
+            fd, temp_path = tempfile.mkstemp(suffix='.db')
+            with os.fdopen(fd, 'wb') as f_out, gzip.open(snapshot, 'rb') as f_in:
+                shutil.copyfileobj(f_in, f_out)
+            source_path = temp_path
+        else:
+            source_path = snapshot
+
+        source = sqlite3.connect(source_path)
+        try:
+            result = source.execute('PRAGMA integrity_check').fetchone()[0]
+            if result != 'ok':
+                raise sqlite3.DatabaseError(f"Snapshot {snapshot} falhou no integrity_check: {result}")
+
+            os.makedirs(os.path.dirname(target_path) or '.', exist_ok=True)
+            target = sqlite3.connect(target_path)
+            try:
+                _copy_pages(source, target, pages, sleep)
+            finally:
+                target.close()
+        finally:
+            source.close()
+    finally:
+        if temp_path and os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def _restore_archives(archive_dir: str, pages: int, sleep: float) -> List[str]:
+    """restaura os arquivos mensais guardados com o snapshot; devolve os nomes restaurados"""
+    restored = []
+    for path in sorted(glob.glob(os.path.join(archive_dir, 'matches_*.db*'))):
+        name = os.path.basename(path)
+        name = name[:-len('.gz')] if name.endswith('.gz') else name
+        if not database.ARCHIVE_FILE_RE.match(name):
+            continue
+        _restore_file(path, os.path.join(database.get_archive_dir(), name), pages, sleep)
+        restored.append(name)
+    return restored
+
+
+def _drop_extra_archives(keep: List[str]):
+    """apaga os arquivos mensais que não estavam no snapshot (as partidas deles estão no banco restaurado)"""
+    for _, path in database.list_archives():
+        if os.path.basename(path) in keep:
+            continue
+        for suffix in ('', '-wal', '-shm', '-journal'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        logger.info(f"Removed archive {path} (not in the snapshot)")
+
+
+def _drop_archived_duplicates():
+    """
+    tira do banco principal as partidas que também estão num arquivo mensal: o
+    archive.py rodou no meio do backup (mesmo passo final do arquivamento)
+    """
+    conn = sqlite3.connect(database.get_database_path())
+    try:
+        for _, path in database.list_archives():
+            conn.execute('ATTACH DATABASE ? AS archive', (path,))
+            try:
+                removed = conn.execute(
+                    'DELETE FROM main.matches WHERE id IN (SELECT id FROM archive.matches)').rowcount
+                conn.commit()
+            finally:
+                conn.execute('DETACH DATABASE archive')
+            if removed:
+                logger.info(f"Removed {removed} matches already archived in {path}")
+    finally:
+        conn.close()
+
+
+def restore_database(snapshot: str, pages: int = BACKUP_PAGES, sleep: float = BACKUP_SLEEP):
+    """
+    restaura um snapshot (.db ou .db.gz) por cima do banco atual, também em passos,
+    junto com os arquivos mensais guardados na pasta <snapshot>.archive
+    """
+    _restore_file(snapshot, database.get_database_path(), pages, sleep)
+
+    archive_dir = archive_snapshot_dir(snapshot)
+    if os.path.isdir(archive_dir):
+        restored = _restore_archives(archive_dir, pages, sleep)
+        _drop_extra_archives(restored)
+        _drop_archived_duplicates()
+    elif database.list_archives():
+        # snapshot de antes dos arquivos irem junto: não dá pra saber quais valem
+        logger.warning(f"Snapshot {snapshot} has no archive copies; keeping the current archive files, "
+                       f"their matches may be missing from or repeated in the restored database")
+
+    # conexões, cache de jogadores e contadores em memória compartilhada ainda são do banco antigo
+    database.close_pools()
+    database.forget_database()
+    # o snapshot pode ser de antes das últimas migrações
+    database.init_db()
+    # os espectadores do stream ao vivo recarregam a página
+    database.notify_refresh()
+    logger.info(f"Database restored from {snapshot}")
+
+
+def list_backups(directory: Optional[str] = None) -> List[str]:
+    """snapshots do diretório de backup (padrão: BACKUP_DIR), do mais novo pro mais velho"""
+    directory = directory or BACKUP_DIR
+    files = glob.glob(os.path.join(directory, '*.db')) + glob.glob(os.path.join(directory, '*.db.gz'))
+    return sorted(files, key=os.path.getmtime, reverse=True)
+
+
+def prune_backups(keep: int = BACKUP_KEEP, directory: Optional[str] = None) -> List[str]:
+    """apaga os snapshots mais velhos (com os arquivos mensais), mantendo os `keep` mais recentes"""
+    removed = []
+    for path in list_backups(directory)[keep:]:
+        os.remove(path)
+        shutil.rmtree(archive_snapshot_dir(path), ignore_errors=True)
+        removed.append(path)
+    return removed
+
+
+class BackupScheduler:
+    """thread que tira um snapshot de cada liga a cada `interval` segundos e limpa os antigos"""
+
+    def __init__(self, interval: int = BACKUP_INTERVAL_SECONDS, keep: int = BACKUP_KEEP,
+                 compress: bool = BACKUP_COMPRESS):
+        self.interval = interval
+        self.keep = keep
+        self.compress = compress
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run_once(self):
+        # a thread não tem a liga da requisição (ContextVar): passa por todas explicitamente
+        for key in leagues.list_leagues():
+            path = leagues.league_path(key)
+            if not os.path.exists(path):
+                # liga configurada que ainda não tem banco
+                continue
+            directory = league_backup_dir(key)
+            with database.use_database(path):
+                try:
+                    backup_database(_default_snapshot_path(self.compress, directory), self.compress)
+                    prune_backups(self.keep, directory)
+                except (sqlite3.Error, OSError) as e:
+                    logger.error(f"Scheduled backup of league {key} failed: {e}")
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self.run_once()
+
+    def start(self):
+        if self.interval <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='backup-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+
+scheduler = BackupScheduler()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Backup online do banco do Tekken Stats')
+    parser.add_argument('--db', default=database.DATABASE_PATH, help='arquivo do banco')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_backup = sub.add_parser('backup', help='tira um snapshot agora')
+    p_backup.add_argument('--dest', help='arquivo de destino')
+    p_backup.add_argument('--compress', action='store_true', help='comprime com gzip')
+
+    p_restore = sub.add_parser('restore', help='restaura um snapshot')
+    p_restore.add_argument('snapshot')
+
+    sub.add_parser('list', help='lista os snapshots')
+
+    p_schedule = sub.add_parser('schedule', help='tira snapshots periódicos em primeiro plano')
+    p_schedule.add_argument('--interval', type=int, default=BACKUP_INTERVAL_SECONDS or 3600)
+    p_schedule.add_argument('--keep', type=int, default=BACKUP_KEEP)
+    p_schedule.add_argument('--compress', action='store_true')
+
+    args = parser.parse_args(argv)
+    database.DATABASE_PATH = args.db
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.command == 'backup':
+        print(backup_database(args.dest, args.compress))
+    elif args.command == 'restore':
+        restore_database(args.snapshot)
+    elif args.command == 'list':
+        for path in list_backups():
+            print(f"{path}  {os.path.getsize(path):,} bytes")
+    elif args.command == 'schedule':
+        runner = BackupScheduler(args.interval, args.keep, args.compress)
+        try:
+            while True:
+                runner.run_once()
+                time.sleep(args.interval)
+        except KeyboardInterrupt:
+            pass
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
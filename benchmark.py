@@ -0,0 +1,234 @@
+"""
+suite de benchmarks das consultas do banco, dos cálculos do utils.py e das rotas
+cada escala ganha um banco próprio gerado com seed fixa (generate_data.py),
+então os números são comparáveis entre commits
+
+Como usar:
+    python benchmark.py                                  # escalas 10k, 100k e 1M
+    python benchmark.py --scales 10000 --repeat 5
+    python benchmark.py --only "api|calculate" --output bench.json
+    python benchmark.py --scales 10000 --compare bench_antes.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import re
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+from typing import Callable, Dict, List
+
+import columnar
+import database
+import generate_data
+import utils
+
+DEFAULT_SCALES = [10000, 100000, 1000000]
+BENCH_DIR = 'data/bench'
+
+ROUTES = [
+    '/',
+    '/matchups',
+    '/players',
+    '/player/player000000',
+    '/character-stats',
+    '/api/stats',
+    '/api/used-characters',
+    '/api/character-usage',
+    '/api/dashboard',
+    '/api/head-to-head/player000000/player000001',
+    '/api/players/search?q=jin',
+    '/render/jin',
+]
+
+
+def time_call(func: Callable, repeat: int) -> Dict:
+    """roda func repeat vezes; a primeira rodada (fria) fica separada"""
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        runs.append(time.perf_counter() - start)
+
+    return {
+        'runs': repeat,
+        'first_s': round(runs[0], 6),
+        'min_s': round(min(runs), 6),
+        'median_s': round(statistics.median(runs), 6),
+        'mean_s': round(statistics.mean(runs), 6),
+    }
+
+
+def database_targets(players: List[Dict]) -> Dict[str, Callable]:
+    stats = database.get_character_stats()
+    top = [char for char, _, _ in sorted(stats, key=lambda x: x[1], reverse=True)[:2]]
+    char1, char2 = (top + ['Jin', 'Kazuya'])[:2]
+
+    return {
+        'get_all_matches': database.get_all_matches,
+        'get_all_players': database.get_all_players,
+        'get_character_stats': database.get_character_stats,
+        'get_character_counters': lambda: database.get_character_counters([char1, char2]),
+        'get_matchup_stats': lambda: database.get_matchup_stats(char1, char2),
+        'get_player_by_id': lambda: database.get_player_by_id(players[0]['id'] if players else ''),
+    }
+
+
+def utils_targets(matches: List[Dict], players: List[Dict]) -> Dict[str, Callable]:
+    player_id = players[0]['id'] if players else ''
+    return {
+        'calculate_stats': lambda: utils.calculate_stats(matches),
+        'calculate_matchup_stats': lambda: utils.calculate_matchup_stats(matches),
+        'calculate_player_stats': lambda: utils.calculate_player_stats(player_id, matches, players),
+        'get_used_characters': lambda: utils.get_used_characters(matches),
+        'get_used_character_stats': lambda: utils.get_used_character_stats(matches),
+    }
+
+
+def columnar_targets(snapshot_path: str) -> Dict[str, Callable]:
+    def with_snapshot(func):
+        # inclui o mmap: é o custo de partida a frio das análises
+        def call():
+            with columnar.load_snapshot(snapshot_path) as snapshot:
+                func(snapshot)
+        return call
+
+    return {
+        'export_snapshot': lambda: columnar.export_snapshot(snapshot_path),
+        'character_stats': with_snapshot(columnar.character_stats),
+        'matchup_stats': with_snapshot(columnar.matchup_stats),
+    }
+
+
+def route_targets(client) -> Dict[str, Callable]:
+    def hit(path):
+        def call():
+            response = client.get(path)
+            if response.status_code >= 500:
+                raise RuntimeError(f"{path} retornou {response.status_code}")
+            response.close()
+        return call
+
+    return {path: hit(path) for path in ROUTES}
+
+
+def run_scale(scale: int, players: int, seed: int, repeat: int, only, regenerate: bool) -> List[Dict]:
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    db_path = os.path.join(BENCH_DIR, f"bench_{scale}_{players}_{seed}.db")
+    database.DATABASE_PATH = db_path
+
+    if regenerate or not os.path.exists(db_path):
+        generate_data.reset_database(db_path)
+        summary = generate_data.populate(scale, players, seed)
+        print(f"  gerou {scale:,} partidas em {summary['seconds']}s")
+
+    # só o banco e as rotas: sem as threads de backup, manutenção e relatórios
+    # (ensure_app_ready) disputando o banco com as medições
+    import tekkenapp
+    database.init_db()
+    tekkenapp._app_ready = True
+    client = tekkenapp.create_app({'DATABASE_PATH': db_path}).test_client()
+
+    player_list = database.get_all_players()
+    matches = database.get_all_matches()
+
+    snapshot_path = os.path.splitext(db_path)[0] + '.col'
+    if not os.path.exists(snapshot_path) or os.path.getmtime(snapshot_path) < os.path.getmtime(db_path):
+        columnar.export_snapshot(snapshot_path)
+
+    groups = [
+        ('database', database_targets(player_list)),
+        ('utils', utils_targets(matches, player_list)),
+        ('columnar', columnar_targets(snapshot_path)),
+        ('route', route_targets(client)),
+    ]
+
+    results = []
+    for group, targets in groups:
+        for name, func in targets.items():
+            full_name = f"{group}:{name}"
+            if only and not only.search(full_name):
+                continue
+            timing = time_call(func, repeat)
+            results.append({'scale': scale, 'group': group, 'name': name, **timing})
+            print(f"  {full_name:<45} median {timing['median_s'] * 1000:>10.2f} ms")
+
+    return results
+
+
+def collect_meta(args) -> Dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        'commit': commit,
+        'date': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'seed': args.seed,
+        'players': args.players,
+        'repeat': args.repeat,
+    }
+
+
+def compare(results: List[Dict], baseline_file: str):
+    """imprime a razão entre a mediana atual e a de um JSON anterior"""
+    with open(baseline_file, 'r') as f:
+        baseline = json.load(f)
+
+    previous = {(r['scale'], r['group'], r['name']): r for r in baseline['results']}
+    print(f"\nComparando com {baseline_file} (commit {baseline['meta'].get('commit')}):")
+    for r in results:
+        old = previous.get((r['scale'], r['group'], r['name']))
+        if not old or not old['median_s']:
+            continue
+        ratio = r['median_s'] / old['median_s']
+        print(f"  {r['scale']:>9,} {r['group']}:{r['name']:<40} {ratio:>6.2f}x")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks do Tekken Stats')
+    parser.add_argument('--scales', default=','.join(str(s) for s in DEFAULT_SCALES),
+                        help='quantidades de partidas separadas por vírgula')
+    parser.add_argument('--players', type=int, default=200, help='jogadores por banco')
+    parser.add_argument('--seed', type=int, default=generate_data.DEFAULT_SEED)
+    parser.add_argument('--repeat', type=int, default=3, help='rodadas por alvo')
+    parser.add_argument('--only', help='regex pra filtrar alvos (ex: "route:/api")')
+    parser.add_argument('--regenerate', action='store_true', help='gera os bancos de novo')
+    parser.add_argument('--output', help='arquivo JSON de saída (padrão: stdout)')
+    parser.add_argument('--compare', help='JSON de uma execução anterior pra comparar')
+    args = parser.parse_args(argv)
+
+    scales = [int(s) for s in args.scales.split(',') if s.strip()]
+    only = re.compile(args.only) if args.only else None
+
+    results = []
+    for scale in scales:
+        print(f"Escala {scale:,} partidas:")
+        results.extend(run_scale(scale, args.players, args.seed, args.repeat, only, args.regenerate))
+
+    output = {'meta': collect_meta(args), 'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=2)
+        print(f"\nResultados salvos em {args.output}")
+    else:
+        print(json.dumps(output, indent=2))
+
+    if args.compare:
+        compare(results, args.compare)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,355 @@
+"""
+snapshot binário colunar das partidas pra análises sobre o histórico inteiro
+consultar o SQLite e montar um dict por partida custa caro com milhões de
+linhas; aqui as partidas vão pra um arquivo de colunas com largura fixa, que
+é mapeado na memória (mmap) sem cópia: com NumPy as colunas viram ndarrays,
+sem ele viram memoryviews. os cálculos de estatística rodam direto nas colunas
+
+formato (little-endian):
+    cabeçalho  HEADER_STRUCT: magic, versão, linhas, tamanho do JSON de nomes
+    nomes      JSON {"characters": [...], "players": [...]} (completado até 8 bytes)
+    colunas    na ordem de COLUMNS, cada uma alinhada em 8 bytes
+
+Como usar:
+    python columnar.py export                  # data/matches.col a partir do banco
+    python columnar.py stats                   # estatísticas a partir do snapshot
+    python columnar.py stats --start 2024-01-01 --end 2024-07-01
+"""
+
+import argparse
+import bisect
+import json
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import time
+from array import array
+from collections import Counter
+from datetime import datetime
+from itertools import compress
+from typing import Dict, Iterable, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    # numpy é opcional, sem ele as colunas são memoryviews e as contagens usam Counter
+    np = None
+
+import database
+from utils import TEKKEN_CHARS, stats_from_totals
+
+COLUMNAR_FILE = os.getenv('COLUMNAR_FILE', 'matches.col')  # ao lado do banco
+
+MAGIC = b'TKCOLS\x00\x00'
+FORMAT_VERSION = 1
+HEADER_STRUCT = struct.Struct('<8sIIQQ')  # magic, versão, reservado, linhas, bytes do JSON
+
+# (nome, typecode do array, dtype do numpy)
+COLUMNS = (
+    ('timestamp', 'q', '<i8'),   # milissegundos desde a epoch
+    ('id', 'q', '<i8'),
+    ('p1_char', 'B', 'u1'),      # índice em characters
+    ('p2_char', 'B', 'u1'),
+    ('winner', 'B', 'u1'),       # WINNER_P1, WINNER_P2 ou WINNER_UNKNOWN
+    ('p1_player', 'I', '<u4'),   # índice em players, NO_PLAYER sem jogador
+    ('p2_player', 'I', '<u4'),
+)
+
+WINNER_P1 = 0
+WINNER_P2 = 1
+WINNER_UNKNOWN = 2
+NO_PLAYER = 0xFFFFFFFF
+MAX_CHARACTERS = 255
+
+EXPORT_CHUNK_ROWS = 65536
+
+
+def get_snapshot_path() -> str:
+    """arquivo colunar do banco em uso (cada liga tem o seu)"""
+    return os.path.join(os.path.dirname(database.get_database_path()) or '.', COLUMNAR_FILE)
+
+
+def _to_millis(timestamp: str) -> int:
+    return int(datetime.fromisoformat(timestamp).timestamp() * 1000)
+
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+def export_snapshot(path: Optional[str] = None, start: Optional[str] = None,
+                    end: Optional[str] = None) -> Dict:
+    """
+    grava as partidas (em ordem cronológica) no arquivo colunar; memória constante:
+    cada coluna vai pra um arquivo temporário em blocos e no fim tudo é juntado
+    """
+    path = path or get_snapshot_path()
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    started = time.perf_counter()
+
+    characters = {char: i for i, char in enumerate(TEKKEN_CHARS)}
+    players = {}
+    rows = 0
+
+    temp_dir = tempfile.mkdtemp(dir=os.path.dirname(path) or '.')
+    try:
+        column_files = {name: open(os.path.join(temp_dir, name), 'wb') for name, _, _ in COLUMNS}
+        buffers = {name: array(typecode) for name, typecode, _ in COLUMNS}
+
+        def flush():
+            for name, buffer in buffers.items():
+                buffer.tofile(column_files[name])
+                del buffer[:]
+
+        def char_index(char):
+            index = characters.get(char)
+            if index is None:
+                if len(characters) >= MAX_CHARACTERS:
+                    raise ValueError(f"Mais de {MAX_CHARACTERS} personagens, não cabe em 1 byte")
+                index = characters[char] = len(characters)
+            return index
+
+        def player_index(player_id):
+            if not player_id:
+                return NO_PLAYER
+            index = players.get(player_id)
+            if index is None:
+                index = players[player_id] = len(players)
+            return index
+
+        for match in database.iter_matches(start, end, batch_size=EXPORT_CHUNK_ROWS):
+            p1_char = match['player1_char']
+            p2_char = match['player2_char']
+            winner_char = match['winner_char']
+            buffers['timestamp'].append(_to_millis(match['timestamp']))
+            buffers['id'].append(match['id'])
+            buffers['p1_char'].append(char_index(p1_char))
+            buffers['p2_char'].append(char_index(p2_char))
+            buffers['winner'].append(WINNER_P1 if winner_char == p1_char
+                                     else WINNER_P2 if winner_char == p2_char else WINNER_UNKNOWN)
+            buffers['p1_player'].append(player_index(match.get('player1_id')))
+            buffers['p2_player'].append(player_index(match.get('player2_id')))
+            rows += 1
+            if rows % EXPORT_CHUNK_ROWS == 0:
+                flush()
+        flush()
+        for f in column_files.values():
+            f.close()
+
+        names = json.dumps({'characters': list(characters), 'players': list(players)}).encode()
+        partial = path + '.partial'
+        with open(partial, 'wb') as out:
+            out.write(HEADER_STRUCT.pack(MAGIC, FORMAT_VERSION, 0, rows, len(names)))
+            out.write(names)
+            for name, _, _ in COLUMNS:
+                out.write(b'\0' * (_align(out.tell()) - out.tell()))
+                with open(os.path.join(temp_dir, name), 'rb') as f:
+                    shutil.copyfileobj(f, out)
+        # nunca deixa um snapshot pela metade no lugar do anterior
+        os.replace(partial, path)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    return {
+        'path': path,
+        'rows': rows,
+        'bytes': os.path.getsize(path),
+        'seconds': round(time.perf_counter() - started, 3),
+    }
+
+
+class ColumnarMatches:
+    """partidas do arquivo colunar mapeadas na memória; as colunas são atributos"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, _, rows, names_size = HEADER_STRUCT.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self._mmap.close()
+            raise ValueError(f"{path} não é um snapshot colunar (versão {FORMAT_VERSION})")
+
+        names = json.loads(self._mmap[HEADER_STRUCT.size:HEADER_STRUCT.size + names_size])
+        self.characters = names['characters']
+        self.players = names['players']
+        self.rows = rows
+
+        self._view = memoryview(self._mmap)
+        offset = HEADER_STRUCT.size + names_size
+        for name, typecode, dtype in COLUMNS:
+            offset = _align(offset)
+            size = rows * array(typecode).itemsize
+            if np is not None:
+                column = np.frombuffer(self._mmap, dtype=dtype, count=rows, offset=offset)
+            else:
+                column = self._view[offset:offset + size].cast(typecode)
+            setattr(self, name, column)
+            offset += size
+
+    def __len__(self):
+        return self.rows
+
+    def row_range(self, start: Optional[str] = None, end: Optional[str] = None) -> Tuple[int, int]:
+        """linhas [lo, hi) do intervalo (busca binária, as partidas estão em ordem cronológica)"""
+        lo = bisect.bisect_left(self.timestamp, _to_millis(start)) if start else 0
+        hi = bisect.bisect_left(self.timestamp, _to_millis(end)) if end else self.rows
+        return lo, hi
+
+    def close(self):
+        # as colunas (memoryviews) precisam ser soltas antes do mmap
+        for name, _, _ in COLUMNS:
+            column = getattr(self, name, None)
+            if isinstance(column, memoryview):
+                column.release()
+            setattr(self, name, None)
+        self._view.release()
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def load_snapshot(path: Optional[str] = None) -> ColumnarMatches:
+    return ColumnarMatches(path or get_snapshot_path())
+
+
+def _count(values: Iterable, size: int):
+    """contagem por índice (bincount no numpy, Counter sem ele)"""
+    if np is not None:
+        return np.bincount(values, minlength=size)
+    counts = [0] * size
+    for index, count in Counter(values).items():
+        counts[index] = count
+    return counts
+
+
+def character_totals(snapshot: ColumnarMatches, start: Optional[str] = None,
+                     end: Optional[str] = None) -> Dict:
+    """mesmo formato do database.get_character_totals()"""
+    lo, hi = snapshot.row_range(start, end)
+    p1, p2, winner = snapshot.p1_char[lo:hi], snapshot.p2_char[lo:hi], snapshot.winner[lo:hi]
+    size = len(snapshot.characters)
+
+    if np is not None:
+        matches = _count(p1, size) + _count(p2, size)
+        wins = _count(p1[winner == WINNER_P1], size) + _count(p2[winner == WINNER_P2], size)
+    else:
+        p1_counts, p2_counts = _count(p1, size), _count(p2, size)
+        matches = [a + b for a, b in zip(p1_counts, p2_counts)]
+        # compress/map ficam em C, sem laço Python por linha
+        p1_wins = _count(compress(p1, map(WINNER_P1.__eq__, winner)), size)
+        p2_wins = _count(compress(p2, map(WINNER_P2.__eq__, winner)), size)
+        wins = [a + b for a, b in zip(p1_wins, p2_wins)]
+
+    characters = {
+        char: {'matches': int(matches[i]), 'wins': int(wins[i])}
+        for i, char in enumerate(snapshot.characters)
+        if matches[i]
+    }
+    return {'total_matches': hi - lo, 'characters': characters}
+
+
+def character_stats(snapshot: ColumnarMatches, start: Optional[str] = None,
+                    end: Optional[str] = None) -> Dict:
+    """mesmo formato do utils.calculate_stats()"""
+    return stats_from_totals(character_totals(snapshot, start, end)['characters'])
+
+
+def matchup_stats(snapshot: ColumnarMatches, start: Optional[str] = None,
+                  end: Optional[str] = None) -> Dict:
+    """mesmo formato do utils.calculate_matchup_stats()"""
+    lo, hi = snapshot.row_range(start, end)
+    p1, p2, winner = snapshot.p1_char[lo:hi], snapshot.p2_char[lo:hi], snapshot.winner[lo:hi]
+    size = len(snapshot.characters)
+
+    # uma contagem por (p1, p2, vencedor): no máximo size * size * 3 chaves
+    if np is not None:
+        keys = (p1.astype(np.int64) * size + p2) * 3 + winner
+        counts = np.bincount(keys, minlength=size * size * 3)
+        combos = ((int(k) // 3 // size, int(k) // 3 % size, int(k) % 3, int(counts[k]))
+                  for k in np.flatnonzero(counts))
+    else:
+        combos = ((a, b, w, count) for (a, b, w), count in Counter(zip(p1, p2, winner)).items())
+
+    matchups = {}
+    for a, b, flag, count in combos:
+        char_a, char_b = snapshot.characters[a], snapshot.characters[b]
+        winner_char = char_a if flag == WINNER_P1 else char_b if flag == WINNER_P2 else None
+        # mesma chave do calculate_matchup_stats: nomes em ordem alfabética
+        char1, char2 = sorted((char_a, char_b))
+        key = f"{char1}_vs_{char2}"
+        entry = matchups.setdefault(key, {'char1': char1, 'char2': char2,
+                                          'char1_wins': 0, 'char2_wins': 0, 'total': 0})
+        entry['total'] += count
+        if winner_char == char1:
+            entry['char1_wins'] += count
+        else:
+            entry['char2_wins'] += count
+
+    for m in matchups.values():
+        m['char1_winrate'] = f"{(m['char1_wins'] / m['total']) * 100:.1f}%"
+        m['char2_winrate'] = f"{(m['char2_wins'] / m['total']) * 100:.1f}%"
+
+    return matchups
+
+
+def _rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss vem em KB no Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Snapshot colunar das partidas (mmap)')
+    parser.add_argument('--db', default=database.DATABASE_PATH, help='arquivo do banco')
+    parser.add_argument('--file', help='arquivo colunar (padrão: matches.col ao lado do banco)')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_export = sub.add_parser('export', help='gera o snapshot a partir do banco')
+    p_export.add_argument('--start', help='só partidas a partir dessa data (ISO 8601)')
+    p_export.add_argument('--end', help='só partidas antes dessa data (ISO 8601)')
+
+    p_stats = sub.add_parser('stats', help='estatísticas de personagem a partir do snapshot')
+    p_stats.add_argument('--start')
+    p_stats.add_argument('--end')
+    p_stats.add_argument('--matchups', action='store_true', help='mostra os confrontos mais jogados')
+
+    args = parser.parse_args(argv)
+    database.DATABASE_PATH = args.db
+
+    if args.command == 'export':
+        database.init_db()
+        summary = export_snapshot(args.file, args.start, args.end)
+        print(f"Exportou {summary['rows']:,} partidas ({summary['bytes']:,} bytes) "
+              f"em {summary['seconds']}s -> {summary['path']}")
+        return 0
+
+    started = time.perf_counter()
+    with load_snapshot(args.file) as snapshot:
+        totals = character_totals(snapshot, args.start, args.end)
+        ranked = sorted(totals['characters'].items(), key=lambda x: x[1]['matches'], reverse=True)
+        for char, counts in ranked:
+            print(f"  {char:<15} {counts['matches']:>10,} partidas  {counts['wins'] / counts['matches']:>6.1%}")
+        if args.matchups:
+            top = sorted(matchup_stats(snapshot, args.start, args.end).values(),
+                         key=lambda m: m['total'], reverse=True)[:10]
+            for m in top:
+                print(f"  {m['char1']} vs {m['char2']}: {m['total']:,} ({m['char1_winrate']} / {m['char2_winrate']})")
+    print(f"{totals['total_matches']:,} partidas em {time.perf_counter() - started:.3f}s "
+          f"(numpy: {'sim' if np is not None else 'não'}, RSS máx: {_rss_mb()} MB)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
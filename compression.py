@@ -0,0 +1,166 @@
+"""
+compressão das respostas HTML/JSON do Tekken Stats Tracker
+negocia gzip (e brotli quando o módulo tá instalado) pelo Accept-Encoding,
+calcula ETag do payload e guarda as versões comprimidas num cache LRU
+pra que requisições repetidas não precisem comprimir de novo
+"""
+
+import gzip
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    # brotli é opcional, sem ele só oferecemos gzip
+    brotli = None
+
+COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', 500))
+COMPRESS_LEVEL = int(os.getenv('COMPRESS_LEVEL', 6))
+COMPRESS_CACHE_BYTES = int(os.getenv('COMPRESS_CACHE_BYTES', 8 * 1024 * 1024))
+
+COMPRESSIBLE_MIMETYPES = {
+    'text/html',
+    'text/css',
+    'text/plain',
+    'text/csv',
+    'application/json',
+    'application/javascript',
+}
+
+
+class CompressedPayloadCache:
+    """cache LRU de payloads comprimidos indexado por (etag, encoding), limitado em bytes"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Tuple[str, str]) -> Optional[bytes]:
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return payload
+
+    def put(self, key: Tuple[str, str], payload: bytes):
+        if len(payload) > self.max_bytes:
+            return
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+
+            self._entries[key] = payload
+            self._size += len(payload)
+
+            # descarta os menos usados até caber no limite
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+payload_cache = CompressedPayloadCache(COMPRESS_CACHE_BYTES)
+
+
+def available_encodings():
+    """encodings suportados em ordem de preferência do servidor"""
+    if brotli is not None:
+        return ['br', 'gzip']
+    return ['gzip']
+
+
+def compress_payload(data: bytes, encoding: str) -> bytes:
+    """comprime o payload no encoding pedido"""
+    if encoding == 'br':
+        # qualidade do brotli vai de 0 a 11, a do gzip de 1 a 9
+        return brotli.compress(data, quality=min(11, COMPRESS_LEVEL + 2))
+    return gzip.compress(data, compresslevel=COMPRESS_LEVEL)
+
+
+def compute_etag(data: bytes) -> str:
+    """etag forte a partir do conteúdo não comprimido"""
+    return hashlib.sha1(data).hexdigest()
+
+
+def _is_compressible(response) -> bool:
+    if response.status_code != 200:
+        return False
+    # respostas em streaming (SSE, exports) e arquivos estáticos passam direto
+    if response.is_streamed or response.direct_passthrough:
+        return False
+    if 'Content-Encoding' in response.headers:
+        return False
+    return response.mimetype in COMPRESSIBLE_MIMETYPES
+
+
+def compress_response(response):
+    """hook after_request: aplica ETag e compressão negociada"""
+    if not _is_compressible(response):
+        return response
+
+    data = response.get_data()
+    etag = compute_etag(data)
+
+    response.vary.add('Accept-Encoding')
+
+    encoding = None
+    if len(data) >= COMPRESS_MIN_SIZE:
+        encoding = request.accept_encodings.best_match(available_encodings())
+
+    # cada representação tem seu próprio etag
+    variant_etag = f"{etag}-{encoding}" if encoding else etag
+    response.set_etag(variant_etag)
+
+    if request.if_none_match.contains(variant_etag):
+        response.status_code = 304
+        response.set_data(b'')
+        response.headers.pop('Content-Length', None)
+        return response
+
+    if encoding is None:
+        return response
+
+    key = (etag, encoding)
+    compressed = payload_cache.get(key)
+    if compressed is None:
+        compressed = compress_payload(data, encoding)
+        payload_cache.put(key, compressed)
+
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    response.headers['Content-Length'] = str(len(compressed))
+
+    return response
+
+
+def init_compression(app):
+    """registra a compressão no app Flask"""
+    app.after_request(compress_response)
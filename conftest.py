@@ -0,0 +1,30 @@
+"""
+fixtures comuns dos testes: banco temporário já migrado e cliente do app
+sem as threads de segundo plano. o que for de um arquivo só (SHARED_STATS,
+tamanho do cache de jogadores, partidas de exemplo) fica no próprio arquivo
+"""
+
+import pytest
+
+import database
+import tekkenapp
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """banco novo e migrado só pro teste; devolve o caminho"""
+    path = str(tmp_path / 'tekken_stats.db')
+    monkeypatch.setattr(database, 'DATABASE_PATH', path)
+    monkeypatch.setattr(database, 'ARCHIVE_DIR', None)
+    database.init_db()
+    yield path
+    database.close_pools()
+
+
+@pytest.fixture
+def client(db, monkeypatch):
+    """cliente de teste de um app criado no banco do teste"""
+    # sem agendadores: nada de backup/manutenção/relatórios rodando durante o teste
+    monkeypatch.setattr(tekkenapp, '_app_ready', True)
+    app = tekkenapp.create_app({'TESTING': True, 'DATABASE_PATH': db})
+    return app.test_client()
@@ -0,0 +1,218 @@
+"""
+importação em massa de partidas a partir de CSV
+lê o CSV linha a linha direto do arquivo/stream da requisição, valida os
+personagens contra TEKKEN_CHARS e grava em transações grandes, sem nunca
+carregar o arquivo inteiro na memória
+
+colunas aceitas (mesmos formatos do import_from_json):
+    player1_char, player2_char, winner_char   (formato novo)
+    player1, player2, winner                  (formato antigo)
+    id, timestamp                             (opcionais)
+    idempotency_key                           (opcional, reenvio da linha não duplica)
+    player1_id, player2_id, winner_id         (opcionais, jogadores da partida)
+
+Como usar:
+    python csv_import.py partidas.csv
+    python csv_import.py partidas.csv --batch-size 20000 --db data/tekken_stats.db
+"""
+
+import argparse
+import csv
+import sqlite3
+import sys
+import time
+from datetime import datetime
+from typing import Dict, Optional, TextIO, Tuple
+
+import database
+from utils import TEKKEN_CHARS
+
+BATCH_SIZE = 5000
+MAX_REPORTED_ERRORS = 20
+
+_VALID_CHARS = frozenset(TEKKEN_CHARS)
+
+
+def parse_row(row: Dict) -> Tuple[Optional[Dict], Optional[str]]:
+    """converte uma linha do CSV no formato do banco; devolve (partida, erro)"""
+    p1_char = (row.get('player1_char') or row.get('player1') or '').strip()
+    p2_char = (row.get('player2_char') or row.get('player2') or '').strip()
+    winner_char = (row.get('winner_char') or row.get('winner') or '').strip()
+
+    for char in (p1_char, p2_char):
+        if char not in _VALID_CHARS:
+            return None, f"personagem desconhecido: {char!r}"
+    if winner_char not in (p1_char, p2_char):
+        return None, f"vencedor {winner_char!r} não jogou a partida"
+
+    match = {
+        'player1': p1_char,
+        'player2': p2_char,
+        'winner': winner_char,
+        'player1_char': p1_char,
+        'player2_char': p2_char,
+        'winner_char': winner_char,
+    }
+
+    timestamp = (row.get('timestamp') or '').strip()
+    if timestamp:
+        try:
+            match['timestamp'] = datetime.fromisoformat(timestamp).isoformat()
+        except ValueError:
+            return None, f"timestamp inválido: {timestamp!r}"
+
+    p1_id = (row.get('player1_id') or '').strip()
+    p2_id = (row.get('player2_id') or '').strip()
+    winner_id = (row.get('winner_id') or '').strip()
+    if p1_id or p2_id or winner_id:
+        if not (p1_id and p2_id) or p1_id == p2_id:
+            return None, 'player1_id e player2_id precisam ser dois jogadores diferentes'
+        if winner_id and winner_id not in (p1_id, p2_id):
+            return None, f"winner_id {winner_id!r} não jogou a partida"
+        match['player1_id'] = p1_id
+        match['player2_id'] = p2_id
+        match['winner_id'] = winner_id or (p1_id if winner_char == p1_char else p2_id)
+
+    idempotency_key = (row.get('idempotency_key') or '').strip()
+    if idempotency_key:
+        match['idempotency_key'] = idempotency_key
+
+    match_id = (row.get('id') or '').strip()
+    if match_id:
+        try:
+            match['id'] = int(match_id)
+        except ValueError:
+            return None, f"id inválido: {match_id!r}"
+
+    return match, None
+
+
+class ImportReport:
+    """contadores do import, com uma amostra das linhas rejeitadas"""
+
+    def __init__(self):
+        self.rows = 0
+        self.inserted = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.errors = []
+        self.started = time.perf_counter()
+
+    def reject(self, line: int, reason: str):
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'error': reason})
+
+    def as_dict(self) -> Dict:
+        elapsed = time.perf_counter() - self.started
+        return {
+            'rows': self.rows,
+            'inserted': self.inserted,
+            'duplicates': self.duplicates,
+            'rejected': self.rejected,
+            'errors': self.errors,
+            'seconds': round(elapsed, 3),
+            'rows_per_sec': round(self.rows / elapsed) if elapsed > 0 else None,
+        }
+
+
+def _flush(batch, report: ImportReport):
+    """
+    grava o lote numa transação; se algum id já existir (ou alguma chave de
+    idempotência vier com outros dados), cai pra linha a linha
+    """
+    try:
+        inserted = database.add_matches([match for _, match in batch])
+        report.inserted += inserted
+        # chaves de idempotência já gravadas (lote reenviado) não contam como erro
+        report.duplicates += len(batch) - inserted
+    except (sqlite3.IntegrityError, database.IdempotencyKeyConflict):
+        for line, match in batch:
+            try:
+                _, created = database.insert_match(match)
+                if created:
+                    report.inserted += 1
+                else:
+                    report.duplicates += 1
+            except sqlite3.IntegrityError as e:
+                report.reject(line, f"conflito ao gravar: {e}")
+            except database.IdempotencyKeyConflict:
+                report.reject(line, f"chave de idempotência já usada com outra partida: {match['idempotency_key']}")
+
+
+def import_matches_csv(stream: TextIO, batch_size: int = BATCH_SIZE, progress=None,
+                       idempotency_key: Optional[str] = None) -> Dict:
+    """
+    importa partidas de um stream de texto CSV e devolve o relatório
+    com idempotency_key cada linha ganha a chave '<chave>:<linha>' (se não tiver a
+    própria), então reenviar o mesmo arquivo depois de uma falha não duplica nada
+    """
+    report = ImportReport()
+    reader = csv.DictReader(stream)
+
+    if not reader.fieldnames:
+        report.reject(1, 'arquivo vazio ou sem cabeçalho')
+        return report.as_dict()
+
+    columns = set(reader.fieldnames)
+    if not ({'player1_char', 'player2_char', 'winner_char'} <= columns
+            or {'player1', 'player2', 'winner'} <= columns):
+        report.reject(1, 'cabeçalho precisa de player1_char, player2_char, winner_char '
+                         '(ou player1, player2, winner)')
+        return report.as_dict()
+
+    batch = []
+
+    for row in reader:
+        report.rows += 1
+        line = reader.line_num
+        match, error = parse_row(row)
+        if error:
+            report.reject(line, error)
+            continue
+
+        if idempotency_key:
+            match.setdefault('idempotency_key', f"{idempotency_key}:{line}")
+        batch.append((line, match))
+
+        if len(batch) >= batch_size:
+            _flush(batch, report)
+            batch = []
+            if progress:
+                progress(report)
+
+    if batch:
+        _flush(batch, report)
+
+    return report.as_dict()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Importa partidas de um CSV')
+    parser.add_argument('file', help='arquivo CSV')
+    parser.add_argument('--db', default=database.DATABASE_PATH, help='arquivo do banco')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='linhas por transação')
+    parser.add_argument('--idempotency-key', help='chave do import: rodar de novo com a mesma chave não duplica')
+    args = parser.parse_args(argv)
+
+    database.DATABASE_PATH = args.db
+    database.init_db()
+
+    def progress(report):
+        rate = report.as_dict()['rows_per_sec'] or 0
+        print(f"  {report.rows:,} linhas lidas, {report.inserted:,} gravadas ({rate:,} linhas/s)")
+
+    with open(args.file, 'r', encoding='utf-8', newline='') as f:
+        result = import_matches_csv(f, args.batch_size, progress, args.idempotency_key)
+
+    print(f"Importou {result['inserted']:,} de {result['rows']:,} linhas em {result['seconds']}s "
+          f"({result['rows_per_sec'] or 0:,} linhas/s), {result['duplicates']:,} já importadas, "
+          f"{result['rejected']:,} rejeitadas")
+    for error in result['errors']:
+        print(f"  linha {error['line']}: {error['error']}")
+
+    return 0 if result['inserted'] or result['duplicates'] or not result['rows'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
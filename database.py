@@ -4,30 +4,53 @@ cuida de todas as operações de banco de dados pra partidas e jogadores
 """
 
 import sqlite3
+import hashlib
 import json
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar, Token
 from datetime import datetime
-from typing import List, Dict, Optional, Tuple
+from typing import Callable, List, Dict, Iterator, Optional, Tuple
+import glob
+import heapq
+import logging
 import os
+import re
+import threading
+import time
+
+from player_cache import MISS, player_caches
+import shared_stats
 
 DATABASE_PATH = 'data/tekken_stats.db'
 
-def get_db_connection():
-    """cria e retorna uma conexão com o banco"""
-    # garante que o diretório existe
-    os.makedirs('data', exist_ok=True)
+logger = logging.getLogger(__name__)
 
-    conn = sqlite3.connect(DATABASE_PATH)
-    conn.row_factory = sqlite3.Row  # retorna as linhas como dicionários
-    return conn
+# banco da liga da requisição atual (leagues.py); None = DATABASE_PATH
+_active_database = ContextVar('active_database', default=None)
 
-def init_db():
-    """inicializa o banco com as tabelas necessárias"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
+# conexões ociosas guardadas por arquivo de banco (0 = abre e fecha toda vez)
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 8))
 
-    # cria tabela de partidas
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS matches (
+# partidas antigas vão pra um arquivo SQLite por mês (ver archive.py)
+# None = pasta archive/ ao lado do DATABASE_PATH
+ARCHIVE_DIR = None
+ARCHIVE_FILE_RE = re.compile(r'^matches_(\d{4})_(\d{2})\.db$')
+# limite padrão do SQLite de bancos anexados numa conexão (SQLITE_LIMIT_ATTACHED)
+ARCHIVE_ATTACH_LIMIT = 10
+
+# acima disso o clear_all_matches troca o DELETE por DROP + CREATE da tabela
+CLEAR_DROP_THRESHOLD = 10000
+
+# eventos de partida guardados pro /api/stream dos outros processos (ver live_stream.py)
+STREAM_EVENTS_KEEP = int(os.getenv('STREAM_EVENTS_KEEP', 10000))
+
+MATCH_COLUMNS = ('id, timestamp, player1, player2, winner, '
+                 'player1_char, player2_char, winner_char, '
+                 'player1_id, player2_id, winner_id')
+
+# DDL da tabela de partidas, reaproveitada nos arquivos mensais ({schema} = 'archive.' etc)
+MATCHES_TABLE_SQL = '''
+        CREATE TABLE IF NOT EXISTS {schema}matches (
             id INTEGER PRIMARY KEY,
             timestamp TEXT NOT NULL,
             player1 TEXT NOT NULL,
@@ -38,7 +61,268 @@ def init_db():
             winner_char TEXT NOT NULL,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
-    ''')
+    '''
+
+MATCHES_INDEX_SQL = [
+    '''
+        CREATE INDEX IF NOT EXISTS {schema}idx_matches_timestamp
+        ON matches(timestamp)
+    ''',
+    '''
+        CREATE INDEX IF NOT EXISTS {schema}idx_matches_characters
+        ON matches(player1_char, player2_char)
+    ''',
+]
+
+# colunas de partida que vieram depois da versão 1 (migração 3); pair_lo/pair_hi
+# guardam o par de jogadores em ordem, então A x B e B x A caem na mesma chave
+MATCH_PLAYER_COLUMNS = [
+    ('player1_id', 'TEXT'),
+    ('player2_id', 'TEXT'),
+    ('winner_id', 'TEXT'),
+    ('pair_lo', 'TEXT'),
+    ('pair_hi', 'TEXT'),
+]
+
+MATCHES_PAIR_INDEX_SQL = '''
+        CREATE INDEX IF NOT EXISTS {schema}idx_matches_pair
+        ON matches(pair_lo, pair_hi, timestamp)
+    '''
+
+# chave de idempotência mandada pelo cliente: reenviar a mesma partida/lote não duplica nada
+MATCHES_IDEMPOTENCY_INDEX_SQL = '''
+        CREATE UNIQUE INDEX IF NOT EXISTS {schema}idx_matches_idempotency
+        ON matches(idempotency_key) WHERE idempotency_key IS NOT NULL
+    '''
+
+# IDs de partida reservados por processo a cada ida na tabela id_sequence (hi/lo)
+ID_BLOCK_SIZE = int(os.getenv('ID_BLOCK_SIZE', 100))
+
+# funções chamadas a cada statement executado (métricas, profiling)
+# com a lista vazia as conexões são sqlite3 puras, sem custo nenhum
+_statement_observers = []
+
+# funções chamadas com cada conexão nova (ex: instalar trace/progress handlers)
+_connection_hooks = []
+
+# conexões dedicadas só pra ler o PRAGMA data_version de cada banco
+_version_connections = {}
+_version_lock = threading.Lock()
+
+# pool de conexões por arquivo; a geração muda quando observers/hooks mudam,
+# aí as conexões antigas (sem o trace/progress novo) são descartadas ao voltar
+_pools = {}
+_pool_lock = threading.Lock()
+_pool_generation = 0
+
+def get_database_path() -> str:
+    """arquivo do banco em uso: o da liga da requisição ou o DATABASE_PATH"""
+    return _active_database.get() or DATABASE_PATH
+
+def set_active_database(path: Optional[str]) -> Token:
+    """troca o banco do contexto atual; devolve o token pro reset_active_database"""
+    return _active_database.set(path)
+
+def reset_active_database(token: Token):
+    _active_database.reset(token)
+
+@contextmanager
+def use_database(path: Optional[str]):
+    """roda o bloco com outro arquivo de banco (vale só pra thread/contexto atual)"""
+    token = set_active_database(path)
+    try:
+        yield path or DATABASE_PATH
+    finally:
+        reset_active_database(token)
+
+def _bump_pool_generation():
+    global _pool_generation
+    with _pool_lock:
+        _pool_generation += 1
+
+def add_statement_observer(observer):
+    """
+    registra observer(sql, params, elapsed, phase, conn) chamado em cada execute/fetch;
+    conn é a conexão que rodou o statement (com os arquivos mensais que ela tiver anexado)
+    """
+    if observer not in _statement_observers:
+        _statement_observers.append(observer)
+        _bump_pool_generation()
+
+def remove_statement_observer(observer):
+    if observer in _statement_observers:
+        _statement_observers.remove(observer)
+        _bump_pool_generation()
+
+def add_connection_hook(hook):
+    """registra hook(conn) chamado logo depois de abrir cada conexão"""
+    if hook not in _connection_hooks:
+        _connection_hooks.append(hook)
+        _bump_pool_generation()
+
+def remove_connection_hook(hook):
+    if hook in _connection_hooks:
+        _connection_hooks.remove(hook)
+        _bump_pool_generation()
+
+def _notify_observers(sql, params, elapsed, phase, conn):
+    for observer in list(_statement_observers):
+        observer(sql, params, elapsed, phase, conn)
+
+class _ObservedCursor(sqlite3.Cursor):
+    """cursor que mede o tempo de execute e fetch e avisa os observers"""
+
+    _last_sql = None
+    _last_params = None
+
+    def execute(self, sql, parameters=()):
+        self._last_sql, self._last_params = sql, parameters
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            _notify_observers(sql, parameters, time.perf_counter() - start, 'execute', self.connection)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._last_sql, self._last_params = sql, None
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            _notify_observers(sql, None, time.perf_counter() - start, 'execute', self.connection)
+
+    def _timed_fetch(self, fetch, *args):
+        # o sqlite produz as linhas sob demanda, então o fetch também custa
+        start = time.perf_counter()
+        try:
+            return fetch(*args)
+        finally:
+            if self._last_sql is not None:
+                _notify_observers(self._last_sql, self._last_params, time.perf_counter() - start, 'fetch',
+                                  self.connection)
+
+    def fetchone(self):
+        return self._timed_fetch(super().fetchone)
+
+    def fetchmany(self, size=None):
+        if size is None:
+            return self._timed_fetch(super().fetchmany)
+        return self._timed_fetch(super().fetchmany, size)
+
+    def fetchall(self):
+        return self._timed_fetch(super().fetchall)
+
+class _ObservedConnection(sqlite3.Connection):
+    """conexão que cria cursores observados, inclusive nos atalhos conn.execute"""
+
+    def cursor(self, factory=_ObservedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+class _PooledConnection(sqlite3.Connection):
+    """close() devolve a conexão pro pool do arquivo em vez de fechar"""
+
+    _pool_path = None
+    _pool_generation = None
+
+    def close(self):
+        if not _release_connection(self):
+            sqlite3.Connection.close(self)
+
+class _ObservedPooledConnection(_PooledConnection, _ObservedConnection):
+    pass
+
+def _release_connection(conn) -> bool:
+    """guarda a conexão no pool; False = pool cheio ou conexão de outra geração"""
+    if DB_POOL_SIZE <= 0 or conn._pool_path is None:
+        return False
+    try:
+        # nunca devolve uma transação aberta pro próximo
+        if conn.in_transaction:
+            conn.rollback()
+    except sqlite3.Error:
+        return False
+
+    with _pool_lock:
+        if conn._pool_generation != _pool_generation:
+            return False
+        idle = _pools.setdefault(conn._pool_path, [])
+        if len(idle) >= DB_POOL_SIZE:
+            return False
+        idle.append(conn)
+        return True
+
+def close_pools():
+    """fecha as conexões ociosas de todos os bancos (ex: arquivo apagado, depois de um fork)"""
+    global _pool_generation
+    with _pool_lock:
+        idle = [conn for conns in _pools.values() for conn in conns]
+        _pools.clear()
+        # as que estão em uso fecham de verdade quando voltarem
+        _pool_generation += 1
+    for conn in idle:
+        sqlite3.Connection.close(conn)
+
+def get_db_connection():
+    """pega uma conexão com o banco (do pool quando tiver uma livre)"""
+    path = get_database_path()
+
+    with _pool_lock:
+        idle = _pools.get(path)
+        conn = idle.pop() if idle else None
+    if conn is not None:
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    # garante que o diretório existe
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    factory = _ObservedPooledConnection if _statement_observers else _PooledConnection
+    # a conexão pode ser usada por outra thread depois de voltar pro pool
+    conn = sqlite3.connect(path, factory=factory, check_same_thread=False)
+    conn._pool_path = path
+    conn._pool_generation = _pool_generation
+    conn.row_factory = sqlite3.Row  # retorna as linhas como dicionários
+
+    for hook in _connection_hooks:
+        hook(conn)
+
+    return conn
+
+def get_data_version() -> int:
+    """token que muda sempre que outra conexão grava no banco (usado pelos caches)"""
+    path = get_database_path()
+    with _version_lock:
+        conn = _version_connections.get(path)
+        if conn is None:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            # o data_version só é comparável na mesma conexão, por isso ela fica aberta
+            conn = sqlite3.connect(path, check_same_thread=False)
+            _version_connections[path] = conn
+        return conn.execute('PRAGMA data_version').fetchone()[0]
+
+def get_data_token() -> Tuple[str, int]:
+    """(banco, data_version): chave dos caches que não podem misturar ligas"""
+    return get_database_path(), get_data_version()
+
+def close_version_connections():
+    """fecha as conexões do data_version (reabertas sob demanda)"""
+    with _version_lock:
+        for conn in _version_connections.values():
+            conn.close()
+        _version_connections.clear()
+
+# ==================== MIGRAÇÕES ====================
+
+def _migration_001_initial(cursor):
+    """tabelas de partidas e jogadores com os índices de partida"""
+    # cria tabela de partidas
+    cursor.execute(MATCHES_TABLE_SQL.format(schema=''))
 
     # cria tabela de jogadores
     cursor.execute('''
@@ -53,36 +337,424 @@ def init_db():
     ''')
 
     # cria índices pra consultas mais rápidas
+    for sql in MATCHES_INDEX_SQL:
+        cursor.execute(sql.format(schema=''))
+
+def _migration_002_players_fts(cursor):
+    """índice de busca de jogadores (FTS5 com prefixos; sem FTS5, índice NOCASE no nome)"""
+    try:
+        # external content: o texto fica só em players, o FTS guarda o índice
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS players_fts USING fts5(
+                id, name, main_char, region,
+                content='players', content_rowid='rowid',
+                tokenize='unicode61 remove_diacritics 2',
+                prefix='2 3 4'
+            )
+        ''')
+    except sqlite3.OperationalError as e:
+        # SQLite compilado sem FTS5: search_players cai pro LIKE por prefixo
+        logger.warning(f"FTS5 unavailable ({e}), player search will use LIKE")
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_players_name_nocase
+            ON players(name COLLATE NOCASE)
+        ''')
+        return
+
+    # triggers mantêm o índice em dia com add/update/delete_player (e add_players)
     cursor.execute('''
-        CREATE INDEX IF NOT EXISTS idx_matches_timestamp
-        ON matches(timestamp)
+        CREATE TRIGGER IF NOT EXISTS players_fts_insert AFTER INSERT ON players BEGIN
+            INSERT INTO players_fts(rowid, id, name, main_char, region)
+            VALUES (new.rowid, new.id, new.name, new.main_char, new.region);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS players_fts_delete AFTER DELETE ON players BEGIN
+            INSERT INTO players_fts(players_fts, rowid, id, name, main_char, region)
+            VALUES ('delete', old.rowid, old.id, old.name, old.main_char, old.region);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS players_fts_update AFTER UPDATE ON players BEGIN
+            INSERT INTO players_fts(players_fts, rowid, id, name, main_char, region)
+            VALUES ('delete', old.rowid, old.id, old.name, old.main_char, old.region);
+            INSERT INTO players_fts(rowid, id, name, main_char, region)
+            VALUES (new.rowid, new.id, new.name, new.main_char, new.region);
+        END
     ''')
 
+    # indexa os jogadores que já existiam
+    cursor.execute("INSERT INTO players_fts(players_fts) VALUES ('rebuild')")
+
+def _add_match_player_columns(cursor, schema: str = 'main'):
+    """acrescenta as colunas de jogador e o índice do par (também nos arquivos mensais antigos)"""
+    existing = {row[1] for row in cursor.execute(f'PRAGMA {schema}.table_info(matches)').fetchall()}
+    for name, decl in MATCH_PLAYER_COLUMNS:
+        if name not in existing:
+            cursor.execute(f'ALTER TABLE {schema}.matches ADD COLUMN {name} {decl}')
+    cursor.execute(MATCHES_PAIR_INDEX_SQL.format(schema=f'{schema}.'))
+
+def _migration_003_match_players(cursor):
+    """IDs dos jogadores na partida + índice do par pro head-to-head"""
+    _add_match_player_columns(cursor)
+
+def _add_idempotency_column(cursor, schema: str = 'main'):
+    existing = {row[1] for row in cursor.execute(f'PRAGMA {schema}.table_info(matches)').fetchall()}
+    if 'idempotency_key' not in existing:
+        cursor.execute(f'ALTER TABLE {schema}.matches ADD COLUMN idempotency_key TEXT')
+    cursor.execute(MATCHES_IDEMPOTENCY_INDEX_SQL.format(schema=f'{schema}.'))
+
+def _migration_004_match_ids(cursor):
+    """sequência de IDs de partida (hi/lo) + chave de idempotência com índice único parcial"""
     cursor.execute('''
-        CREATE INDEX IF NOT EXISTS idx_matches_characters
-        ON matches(player1_char, player2_char)
+        CREATE TABLE IF NOT EXISTS id_sequence (
+            name TEXT PRIMARY KEY,
+            next_id INTEGER NOT NULL
+        )
     ''')
+    # continua depois dos IDs antigos (milissegundos do momento da gravação)
+    cursor.execute('''
+        INSERT OR IGNORE INTO id_sequence (name, next_id)
+        SELECT 'matches', IFNULL(MAX(id), 0) + 1 FROM matches
+    ''')
+    _add_idempotency_column(cursor)
 
-    conn.commit()
-    conn.close()
-    print(f"Database initialized at {DATABASE_PATH}")
+def _migration_005_match_events(cursor):
+    """fila de eventos das partidas gravadas (match_id NULL = recarregar tudo)"""
+    # AUTOINCREMENT: o seq nunca volta atrás, nem depois de apagar a fila inteira
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS match_events (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            match_id INTEGER
+        )
+    ''')
 
-# ==================== OPERAÇÕES DE PARTIDA ====================
+def _migration_006_match_keys(cursor):
+    """chaves de idempotência numa tabela própria, que o archive.py não move"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS match_keys (
+            idempotency_key TEXT PRIMARY KEY,
+            match_id INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_match_keys_match ON match_keys(match_id)')
+    cursor.execute('''
+        INSERT OR IGNORE INTO match_keys (idempotency_key, match_id)
+        SELECT idempotency_key, id FROM matches WHERE idempotency_key IS NOT NULL
+    ''')
 
-def add_match(match_data: Dict) -> int:
-    """adiciona uma nova partida no banco"""
+def _migration_007_match_key_payload(cursor):
+    """hash da partida junto da chave de idempotência (NULL nas chaves antigas: não confere)"""
+    existing = {row[1] for row in cursor.execute('PRAGMA table_info(match_keys)').fetchall()}
+    if 'payload_hash' not in existing:
+        cursor.execute('ALTER TABLE match_keys ADD COLUMN payload_hash TEXT')
+
+def create_matches_table(cursor, schema: str = 'main'):
+    """cria a tabela de partidas no formato atual (usado no clear e nos arquivos mensais)"""
+    prefix = f'{schema}.'
+    cursor.execute(MATCHES_TABLE_SQL.format(schema=prefix))
+    for sql in MATCHES_INDEX_SQL:
+        cursor.execute(sql.format(schema=prefix))
+    _add_match_player_columns(cursor, schema)
+    _add_idempotency_column(cursor, schema)
+
+# (versão, descrição, função); só acrescentar no fim, nunca mudar uma que já rodou.
+# usar IF NOT EXISTS: bancos de antes do versionamento já têm as tabelas da versão 1
+MIGRATIONS = [
+    (1, 'tabelas de partidas e jogadores', _migration_001_initial),
+    (2, 'busca de jogadores (FTS5)', _migration_002_players_fts),
+    (3, 'jogadores da partida e índice do par', _migration_003_match_players),
+    (4, 'sequência de IDs e chave de idempotência', _migration_004_match_ids),
+    (5, 'fila de eventos do stream ao vivo', _migration_005_match_events),
+    (6, 'chaves de idempotência fora da tabela de partidas', _migration_006_match_keys),
+    (7, 'hash da partida nas chaves de idempotência', _migration_007_match_key_payload),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+# bancos já migrados neste processo (init_db vira no-op depois da primeira vez)
+_initialized_paths = set()
+_init_lock = threading.Lock()
+
+def get_schema_version(conn=None) -> int:
+    """versão gravada em schema_migrations (0 = banco novo ou de antes do versionamento)"""
+    own = conn is None
+    conn = conn or get_db_connection()
+    try:
+        return conn.execute('SELECT MAX(version) FROM schema_migrations').fetchone()[0] or 0
+    except sqlite3.OperationalError:
+        return 0
+    finally:
+        if own:
+            conn.close()
+
+def migrate() -> int:
+    """aplica as migrações pendentes; devolve quantas rodaram"""
     conn = get_db_connection()
-    cursor = conn.cursor()
+    try:
+        # caminho rápido: banco em dia, nenhuma DDL
+        if get_schema_version(conn) >= SCHEMA_VERSION:
+            return 0
+
+        # WAL deixa leitores e escritores trabalharem juntos; auto_vacuum incremental permite
+        # devolver páginas livres aos poucos (maintenance.py). o auto_vacuum só pega em banco
+        # novo, antes da primeira tabela; nos antigos use: python maintenance.py --enable-incremental-vacuum
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('PRAGMA journal_mode = WAL')
+
+        # BEGIN IMMEDIATE: outro worker migrando ao mesmo tempo espera aqui
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INTEGER PRIMARY KEY,
+                    description TEXT NOT NULL,
+                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            current = get_schema_version(conn)
+            cursor = conn.cursor()
+            applied = 0
+            for version, description, migration in MIGRATIONS:
+                if version <= current:
+                    continue
+                migration(cursor)
+                cursor.execute('INSERT INTO schema_migrations (version, description) VALUES (?, ?)',
+                               (version, description))
+                logger.info(f"Applied migration {version}: {description}")
+                applied += 1
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+    finally:
+        conn.close()
+
+    return applied
 
-    # gera timestamp se não tiver
-    timestamp = match_data.get('timestamp', datetime.now().isoformat())
-    match_id = match_data.get('id', int(datetime.now().timestamp() * 1000))
+def init_db():
+    """inicializa o banco com as tabelas necessárias (roda só as migrações pendentes)"""
+    path = get_database_path()
+    # o arquivo pode ter sido apagado (reset do generate_data, testes)
+    if path in _initialized_paths and os.path.exists(path):
+        return
+
+    with _init_lock:
+        if path in _initialized_paths and os.path.exists(path):
+            return
+        if migrate():
+            logger.info(f"Database initialized at {path} (schema version {SCHEMA_VERSION})")
+        _initialized_paths.add(path)
+
+def forget_database(path: Optional[str] = None):
+    """
+    esquece o que este processo guardou do banco (arquivo trocado por baixo: restore,
+    reset): migrações, bloco de IDs, cache de jogadores e contadores compartilhados
+    """
+    path = path or get_database_path()
+    with _init_lock:
+        _initialized_paths.discard(path)
+    with _id_lock:
+        _id_blocks.pop(path, None)
+    cache = player_caches.get(path)
+    if cache:
+        cache.clear()
+    invalidate_shared_stats(path)
+
+# ==================== ARQUIVOS MENSAIS ====================
+
+def get_archive_dir() -> str:
+    """pasta dos arquivos mensais de partidas antigas"""
+    return ARCHIVE_DIR or os.path.join(os.path.dirname(get_database_path()) or '.', 'archive')
+
+def archive_path(month: str) -> str:
+    """caminho do arquivo de um mês ('2024-03' -> archive/matches_2024_03.db)"""
+    return os.path.join(get_archive_dir(), f"matches_{month.replace('-', '_')}.db")
+
+def list_archives(start: Optional[str] = None, end: Optional[str] = None) -> List[Tuple[str, str]]:
+    """(mês, caminho) dos arquivos que cruzam o intervalo [start, end), do mais velho pro mais novo"""
+    archives = []
+    for path in glob.glob(os.path.join(get_archive_dir(), 'matches_*.db')):
+        found = ARCHIVE_FILE_RE.match(os.path.basename(path))
+        if not found:
+            continue
+        year, month = int(found.group(1)), int(found.group(2))
+        month_start = f"{year:04d}-{month:02d}"
+        month_end = f"{year + 1:04d}-01" if month == 12 else f"{year:04d}-{month + 1:02d}"
+        # timestamps ISO comparados como texto: '2024-03' <= '2024-03-15T...' < '2024-04'
+        if (start and month_end <= start) or (end and month_start >= end):
+            continue
+        archives.append((month_start, path))
+    return sorted(archives)
+
+def _archive_chunks(start: Optional[str] = None, end: Optional[str] = None) -> List[Tuple[bool, List[str]]]:
+    """
+    divide os arquivos necessários em grupos que cabem no limite de ATTACH;
+    o primeiro grupo também inclui a tabela principal
+    """
+    paths = [path for _, path in list_archives(start, end)]
+    if not paths:
+        return [(True, [])]
+    return [(i == 0, paths[i:i + ARCHIVE_ATTACH_LIMIT])
+            for i in range(0, len(paths), ARCHIVE_ATTACH_LIMIT)]
+
+# arquivos mensais que já têm as colunas atuais (os criados antes da migração 3 não têm)
+_upgraded_archives = set()
+
+@contextmanager
+def _attached(include_main: bool, archives: List[str]):
+    """conexão com os arquivos anexados e a lista de tabelas de partidas pra consultar"""
+    conn = get_db_connection()
+    try:
+        tables = ['main.matches'] if include_main else []
+        for i, path in enumerate(archives):
+            conn.execute(f"ATTACH DATABASE ? AS archive{i}", (path,))
+            if path not in _upgraded_archives:
+                _add_match_player_columns(conn.cursor(), f'archive{i}')
+                conn.commit()
+                _upgraded_archives.add(path)
+            tables.append(f"archive{i}.matches")
+        yield conn, tables
+    finally:
+        # a conexão volta pro pool limpa, sem os arquivos anexados
+        if conn.in_transaction:
+            conn.rollback()
+        for i in range(len(archives)):
+            try:
+                conn.execute(f"DETACH DATABASE archive{i}")
+            except sqlite3.OperationalError:
+                pass
+        conn.close()
+
+def _iter_chunk(include_main, archives, where, params, order, batch_size) -> Iterator[Dict]:
+    with _attached(include_main, archives) as (conn, tables):
+        # cada ramo filtra sozinho (usa o índice de timestamp de cada arquivo)
+        sql = '\n            UNION ALL\n'.join(
+            f"SELECT {MATCH_COLUMNS} FROM {table} {where}" for table in tables)
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f"{sql}\n            ORDER BY {order}", list(params) * len(tables))
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield dict(row)
+        finally:
+            # quem parou no meio (LIMIT em Python) não pode devolver pro pool um SELECT aberto
+            cursor.close()
+
+def _select_matches(start: Optional[str] = None, end: Optional[str] = None,
+                    character: Optional[str] = None, descending: bool = False,
+                    batch_size: int = 1000, pair: Optional[Tuple[str, str]] = None) -> Iterator[Dict]:
+    """partidas da tabela principal + arquivos que o intervalo precisar, ordenadas por timestamp"""
+    conditions = []
+    params = []
+
+    # par de jogadores já normalizado (lo, hi): usa o índice idx_matches_pair
+    if pair:
+        conditions.append('pair_lo = ? AND pair_hi = ?')
+        params.extend(pair)
+
+    # timestamps são ISO 8601, então comparar como texto respeita a ordem
+    if start:
+        conditions.append('timestamp >= ?')
+        params.append(start)
+    if end:
+        conditions.append('timestamp < ?')
+        params.append(end)
+    if character:
+        conditions.append('(player1_char = ? OR player2_char = ?)')
+        params.extend([character, character])
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    order = 'timestamp DESC' if descending else 'timestamp'
+
+    chunks = [_iter_chunk(include_main, archives, where, params, order, batch_size)
+              for include_main, archives in _archive_chunks(start, end)]
+    if len(chunks) == 1:
+        return chunks[0]
+    # mais arquivos do que cabem numa conexão: junta os grupos já ordenados
+    return heapq.merge(*chunks, key=lambda match: match['timestamp'], reverse=descending)
+
+def _sum_over_tables(queries: List[Tuple[str, tuple]], start: Optional[str] = None,
+                     end: Optional[str] = None) -> List[List[int]]:
+    """roda cada consulta de contagem ({table} no FROM) em todas as tabelas e soma as colunas"""
+    totals = [None] * len(queries)
+    for include_main, archives in _archive_chunks(start, end):
+        with _attached(include_main, archives) as (conn, tables):
+            cursor = conn.cursor()
+            for i, (sql, params) in enumerate(queries):
+                for table in tables:
+                    row = tuple(cursor.execute(sql.format(table=table), params).fetchone())
+                    totals[i] = list(row) if totals[i] is None else [a + b for a, b in zip(totals[i], row)]
+    return totals
 
-    cursor.execute('''
-        INSERT INTO matches (id, timestamp, player1, player2, winner,
-                           player1_char, player2_char, winner_char)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (
+# ==================== OPERAÇÕES DE PARTIDA ====================
+
+INSERT_MATCH_SQL = '''
+    INSERT INTO matches (id, timestamp, player1, player2, winner,
+                         player1_char, player2_char, winner_char,
+                         player1_id, player2_id, winner_id, pair_lo, pair_hi, idempotency_key)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(idempotency_key) WHERE idempotency_key IS NOT NULL DO NOTHING
+'''
+
+# blocos de IDs já reservados por este processo, por arquivo de banco: {path: [próximo, fim)}
+_id_blocks = {}
+_id_lock = threading.Lock()
+
+def _reserve_id_block(size: int) -> int:
+    """reserva `size` IDs na id_sequence (transação curta, conexão própria); devolve o primeiro"""
+    conn = get_db_connection()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        # pula IDs gravados por fora da sequência (id explícito no CSV/JSON, generate_data)
+        conn.execute('''
+            UPDATE id_sequence
+            SET next_id = MAX(next_id, (SELECT IFNULL(MAX(id), 0) + 1 FROM matches)) + ?
+            WHERE name = 'matches'
+        ''', (size,))
+        next_id = conn.execute("SELECT next_id FROM id_sequence WHERE name = 'matches'").fetchone()[0]
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return next_id - size
+
+def allocate_match_ids(count: int = 1) -> List[int]:
+    """
+    IDs novos de partida, crescentes e sem colisão entre processos: cada processo
+    reserva um bloco de ID_BLOCK_SIZE na id_sequence e distribui em memória
+    (entre workers a ordem é por bloco, não global)
+    """
+    path = get_database_path()
+    ids = []
+    with _id_lock:
+        block = _id_blocks.setdefault(path, [0, 0])
+        while len(ids) < count:
+            if block[0] >= block[1]:
+                size = max(ID_BLOCK_SIZE, count - len(ids))
+                block[0] = _reserve_id_block(size)
+                block[1] = block[0] + size
+            take = min(count - len(ids), block[1] - block[0])
+            ids.extend(range(block[0], block[0] + take))
+            block[0] += take
+    return ids
+
+def _discard_id_block():
+    """joga fora o bloco reservado (um id dele já foi usado por fora da sequência)"""
+    with _id_lock:
+        _id_blocks.pop(get_database_path(), None)
+
+def _match_row(match_data: Dict, match_id: int, timestamp: str) -> Tuple:
+    """valores do INSERT_MATCH_SQL; o par só é gravado quando os dois jogadores são conhecidos"""
+    p1_id = match_data.get('player1_id') or None
+    p2_id = match_data.get('player2_id') or None
+    pair_lo, pair_hi = sorted((p1_id, p2_id)) if p1_id and p2_id else (None, None)
+    return (
         match_id,
         timestamp,
         match_data['player1'],
@@ -90,40 +762,210 @@ def add_match(match_data: Dict) -> int:
         match_data['winner'],
         match_data['player1_char'],
         match_data['player2_char'],
-        match_data['winner_char']
-    ))
-
-    conn.commit()
-    last_id = cursor.lastrowid
-    conn.close()
-
-    return last_id
+        match_data['winner_char'],
+        p1_id,
+        p2_id,
+        match_data.get('winner_id') or None,
+        pair_lo,
+        pair_hi,
+        match_data.get('idempotency_key') or None
+    )
+
+def _shared_stats_writer():
+    """
+    lock dos contadores compartilhados (shared_stats.py) durante a gravação: quem
+    remonta os contadores do banco espera o commit + record, nada é contado duas vezes
+    """
+    stats = shared_stats.get_store(get_database_path())
+    return stats.locked() if stats else nullcontext()
+
+def invalidate_shared_stats(path: Optional[str] = None):
+    """faz os contadores compartilhados serem remontados do banco na próxima leitura"""
+    stats = shared_stats.get_store(path or get_database_path())
+    if stats:
+        stats.invalidate()
+
+def _record_match_events(cursor, match_ids: List[Optional[int]]):
+    """
+    põe as partidas na fila do stream ao vivo, na mesma transação da gravação;
+    os processos com clientes SSE leem a fila quando o data_version muda
+    """
+    cursor.executemany('INSERT INTO match_events (match_id) VALUES (?)', [(i,) for i in match_ids])
+    # a fila só precisa cobrir quem está atrasado alguns segundos
+    cursor.execute('DELETE FROM match_events WHERE seq <= (SELECT MAX(seq) FROM match_events) - ?',
+                   (STREAM_EVENTS_KEEP,))
+
+def notify_refresh():
+    """avisa os clientes do stream ao vivo que as estatísticas mudaram por inteiro (delete, clear, restore)"""
+    conn = get_db_connection()
+    try:
+        _record_match_events(conn.cursor(), [None])
+        conn.commit()
+    finally:
+        conn.close()
+
+def get_last_event_seq() -> int:
+    """seq do último evento da fila (0 = vazia)"""
+    conn = get_db_connection()
+    try:
+        return conn.execute('SELECT IFNULL(MAX(seq), 0) FROM match_events').fetchone()[0]
+    finally:
+        conn.close()
+
+def get_match_events(after_seq: int, limit: int) -> List[Dict]:
+    """
+    eventos depois de `after_seq`, em ordem: {'seq', 'match'} com match None pros de
+    recarregar tudo (ou se a partida já foi apagada ou arquivada)
+    """
+    conn = get_db_connection()
+    try:
+        rows = conn.execute('''
+            SELECT e.seq, m.id, m.timestamp, m.player1_char, m.player2_char, m.winner_char
+            FROM match_events e LEFT JOIN matches m ON m.id = e.match_id
+            WHERE e.seq > ?
+            ORDER BY e.seq
+            LIMIT ?
+        ''', (after_seq, limit)).fetchall()
+    finally:
+        conn.close()
+
+    keys = ('id', 'timestamp', 'player1_char', 'player2_char', 'winner_char')
+    # partida apagada antes de alguém ler o evento também vira recarregar tudo
+    return [{'seq': seq, 'match': dict(zip(keys, match)) if match[0] is not None else None}
+            for seq, *match in rows]
+
+class IdempotencyKeyConflict(Exception):
+    """chave de idempotência já usada por outra partida (reenvio só vale com os mesmos dados)"""
+
+    def __init__(self, key: str):
+        super().__init__(f"Idempotency key {key!r} was already used for a different match")
+        self.key = key
+
+
+# o timestamp fica de fora: no /add é a hora do servidor, muda a cada reenvio
+PAYLOAD_HASH_FIELDS = ('player1', 'player2', 'winner', 'player1_char', 'player2_char', 'winner_char',
+                       'player1_id', 'player2_id', 'winner_id')
+
+def _payload_hash(match_data: Dict) -> str:
+    """hash dos dados da partida guardado com a chave de idempotência"""
+    payload = [match_data.get(field) or None for field in PAYLOAD_HASH_FIELDS]
+    return hashlib.sha256(json.dumps(payload, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+def _existing_keys(cursor, keys: List[str]) -> Dict[str, Tuple[int, Optional[str]]]:
+    """
+    {chave: (id, hash)} das chaves de idempotência que já estão gravadas; vem da
+    match_keys, que continua com as chaves das partidas que já foram pros arquivos mensais
+    """
+    found = {}
+    # em pedaços pra não passar do limite de parâmetros do SQLite
+    for i in range(0, len(keys), 500):
+        chunk = keys[i:i + 500]
+        placeholders = ','.join('?' * len(chunk))
+        for key, match_id, payload_hash in cursor.execute(
+                f"SELECT idempotency_key, match_id, payload_hash FROM match_keys "
+                f"WHERE idempotency_key IN ({placeholders})", chunk):
+            found[key] = (match_id, payload_hash)
+    return found
+
+def _insert_matches(matches: List[Dict]) -> Tuple[List[int], int]:
+    """
+    grava as partidas numa transação só, pulando as chaves de idempotência que já
+    existem (ou repetidas no lote); devolve (id de cada partida, quantas foram gravadas).
+    chave conhecida com outros dados levanta IdempotencyKeyConflict e nada é gravado
+    """
+    now = datetime.now()
+    # IDs alocados antes de pegar o lock de escrita (a reserva usa outra conexão)
+    new_ids = iter(allocate_match_ids(sum(1 for m in matches if m.get('id') is None)))
+    ids = [m['id'] if m.get('id') is not None else next(new_ids) for m in matches]
+    keys = [m.get('idempotency_key') or None for m in matches]
 
-def get_all_matches() -> List[Dict]:
-    """pega todas as partidas do banco"""
     conn = get_db_connection()
     cursor = conn.cursor()
+    with _shared_stats_writer() as stats:
+        try:
+            # lock de escrita antes de conferir as chaves: ninguém grava a mesma chave no meio
+            cursor.execute('BEGIN IMMEDIATE')
+            seen = _existing_keys(cursor, [key for key in keys if key]) if any(keys) else {}
+            rows = []
+            new_keys = []
+            for match_data, match_id, key in zip(matches, ids, keys):
+                payload_hash = _payload_hash(match_data) if key else None
+                if key in seen:
+                    stored_hash = seen[key][1]
+                    # chaves de antes da migração 7 não têm hash: valem como reenvio
+                    if stored_hash is not None and stored_hash != payload_hash:
+                        raise IdempotencyKeyConflict(key)
+                    continue
+                if key:
+                    seen[key] = (match_id, payload_hash)
+                    new_keys.append((key, match_id, payload_hash))
+                rows.append(_match_row(match_data, match_id, match_data.get('timestamp', now.isoformat())))
+            if rows:
+                cursor.executemany(INSERT_MATCH_SQL, rows)
+                cursor.executemany('INSERT INTO match_keys (idempotency_key, match_id, payload_hash) '
+                                   'VALUES (?, ?, ?)', new_keys)
+                _record_match_events(cursor, [row[0] for row in rows])
+            conn.commit()
+        except (sqlite3.Error, IdempotencyKeyConflict):
+            # desfaz o lote inteiro e libera o lock de escrita na hora (ex: id duplicado)
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+        if stats and rows:
+            stats.record(row[5:8] for row in rows)
+
+    # partida repetida devolve o id da que já estava gravada
+    return [seen[key][0] if key else match_id for match_id, key in zip(ids, keys)], len(rows)
+
+def _insert_with_retry(matches: List[Dict]) -> Tuple[List[int], int]:
+    try:
+        return _insert_matches(matches)
+    except sqlite3.IntegrityError as e:
+        # um id do bloco já tinha sido gravado por fora da sequência: bloco novo e mais uma tentativa
+        if 'matches.id' not in str(e) or all(m.get('id') is not None for m in matches):
+            raise
+        _discard_id_block()
+        return _insert_matches(matches)
+
+def insert_match(match_data: Dict) -> Tuple[int, bool]:
+    """
+    grava a partida; devolve (id, gravou). com idempotency_key repetida e os mesmos
+    dados não grava e devolve o id antigo; com outros dados levanta IdempotencyKeyConflict
+    """
+    ids, inserted = _insert_with_retry([match_data])
+    return ids[0], inserted > 0
 
-    cursor.execute('''
-        SELECT id, timestamp, player1, player2, winner,
-               player1_char, player2_char, winner_char
-        FROM matches
-        ORDER BY timestamp DESC
-    ''')
-
-    matches = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-
-    return matches
+def add_match(match_data: Dict) -> int:
+    """adiciona uma nova partida no banco"""
+    return insert_match(match_data)[0]
+
+def add_matches(matches: List[Dict]) -> int:
+    """
+    adiciona várias partidas numa transação só (bem mais rápido que add_match em loop);
+    devolve quantas foram gravadas (lote reenviado com as mesmas chaves grava 0)
+    """
+    if not matches:
+        return 0
+    return _insert_with_retry(matches)[1]
+
+def get_all_matches(start: Optional[str] = None, end: Optional[str] = None) -> List[Dict]:
+    """pega todas as partidas do banco (e dos arquivos mensais que o intervalo pedir)"""
+    return list(_select_matches(start, end, descending=True))
+
+def iter_matches(start: Optional[str] = None, end: Optional[str] = None,
+                 character: Optional[str] = None, batch_size: int = 1000) -> Iterator[Dict]:
+    """percorre as partidas em ordem cronológica direto do cursor, em lotes (memória constante)"""
+    yield from _select_matches(start, end, character, batch_size=batch_size)
 
 def get_match_by_id(match_id: int) -> Optional[Dict]:
     """pega uma partida específica pelo ID"""
     conn = get_db_connection()
     cursor = conn.cursor()
 
-    cursor.execute('''
-        SELECT id, timestamp, player1, player2, winner,
-               player1_char, player2_char, winner_char
+    cursor.execute(f'''
+        SELECT {MATCH_COLUMNS}
         FROM matches
         WHERE id = ?
     ''', (match_id,))
@@ -131,7 +973,18 @@ def get_match_by_id(match_id: int) -> Optional[Dict]:
     row = cursor.fetchone()
     conn.close()
 
-    return dict(row) if row else None
+    if row:
+        return dict(row)
+
+    # não tá na tabela principal: procura nos arquivos mensais, do mais novo pro mais velho
+    for _, path in reversed(list_archives()):
+        with _attached(False, [path]) as (conn, tables):
+            row = conn.execute(f"SELECT {MATCH_COLUMNS} FROM {tables[0]} WHERE id = ?",
+                               (match_id,)).fetchone()
+        if row:
+            return dict(row)
+
+    return None
 
 def delete_match(match_id: int) -> bool:
     """deleta uma partida pelo ID"""
@@ -139,11 +992,24 @@ def delete_match(match_id: int) -> bool:
     cursor = conn.cursor()
 
     cursor.execute('DELETE FROM matches WHERE id = ?', (match_id,))
-
     deleted = cursor.rowcount > 0
+    # a chave sai junto (mesmo com a partida num arquivo mensal): reenviar grava de novo
+    cursor.execute('DELETE FROM match_keys WHERE match_id = ?', (match_id,))
     conn.commit()
     conn.close()
 
+    if not deleted:
+        for _, path in reversed(list_archives()):
+            with _attached(False, [path]) as (conn, tables):
+                deleted = conn.execute(f"DELETE FROM {tables[0]} WHERE id = ?", (match_id,)).rowcount > 0
+                conn.commit()
+            if deleted:
+                break
+
+    if deleted:
+        invalidate_shared_stats()
+        notify_refresh()
+
     return deleted
 
 def clear_all_matches():
@@ -151,10 +1017,36 @@ def clear_all_matches():
     conn = get_db_connection()
     cursor = conn.cursor()
 
-    cursor.execute('DELETE FROM matches')
-
-    conn.commit()
-    conn.close()
+    # tabela grande: DROP + CREATE numa transação só é bem mais rápido que apagar linha a linha
+    # (as páginas liberadas voltam pro disco no incremental_vacuum do maintenance.py)
+    large = cursor.execute('SELECT 1 FROM matches LIMIT 1 OFFSET ?',
+                           (CLEAR_DROP_THRESHOLD,)).fetchone() is not None
+
+    with _shared_stats_writer() as stats:
+        try:
+            if large:
+                # DDL não abre transação sozinho no sqlite3 do Python
+                cursor.execute('BEGIN IMMEDIATE')
+                cursor.execute('DROP TABLE matches')
+                create_matches_table(cursor)
+            else:
+                cursor.execute('DELETE FROM matches')
+            cursor.execute('DELETE FROM match_keys')
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+        # as partidas arquivadas também
+        for _, path in list_archives():
+            os.remove(path)
+
+        if stats:
+            stats.reset()
+
+    notify_refresh()
 
 # ==================== OPERAÇÕES DE JOGADOR ====================
 
@@ -163,25 +1055,75 @@ def add_player(player_data: Dict) -> str:
     conn = get_db_connection()
     cursor = conn.cursor()
 
-    cursor.execute('''
-        INSERT INTO players (id, name, main_char, rank, region)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (
-        player_data['id'],
-        player_data['name'],
-        player_data.get('main_char', ''),
-        player_data.get('rank', ''),
-        player_data.get('region', '')
-    ))
-
-    conn.commit()
+    try:
+        cursor.execute('''
+            INSERT INTO players (id, name, main_char, rank, region)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (
+            player_data['id'],
+            player_data['name'],
+            player_data.get('main_char', ''),
+            player_data.get('rank', ''),
+            player_data.get('region', '')
+        ))
+        conn.commit()
+    except sqlite3.Error:
+        # ID repetido (sqlite3.IntegrityError) sobe pra quem chamou; a conexão volta limpa
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
     player_id = player_data['id']
-    conn.close()
+
+    # write-through: o cache já enxerga o jogador novo
+    cache = player_caches.get(get_database_path())
+    if cache:
+        cache.put({'id': player_id, 'name': player_data['name'],
+                   'main_char': player_data.get('main_char', ''),
+                   'rank': player_data.get('rank', ''),
+                   'region': player_data.get('region', '')})
 
     return player_id
 
+def add_players(players: List[Dict]) -> int:
+    """adiciona vários jogadores numa transação só"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    try:
+        cursor.executemany('''
+            INSERT INTO players (id, name, main_char, rank, region)
+            VALUES (?, ?, ?, ?, ?)
+        ''', [(
+            player_data['id'],
+            player_data['name'],
+            player_data.get('main_char', ''),
+            player_data.get('rank', ''),
+            player_data.get('region', '')
+        ) for player_data in players])
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    # carga em massa: mais barato recarregar a lista inteira na próxima leitura
+    cache = player_caches.get(get_database_path())
+    if cache:
+        cache.clear()
+
+    return len(players)
+
 def get_all_players() -> List[Dict]:
     """pega todos os jogadores do banco"""
+    cache = player_caches.get(get_database_path())
+    # lido antes do SELECT: uma gravação no meio só faz a próxima leitura recarregar
+    version = get_data_version() if cache else None
+    players = cache.all_players(version) if cache else None
+    if players is not None:
+        return players
+
     conn = get_db_connection()
     cursor = conn.cursor()
 
@@ -194,10 +1136,19 @@ def get_all_players() -> List[Dict]:
     players = [dict(row) for row in cursor.fetchall()]
     conn.close()
 
+    if cache:
+        cache.fill(players, version)
+
     return players
 
 def get_player_by_id(player_id: str) -> Optional[Dict]:
     """pega um jogador específico pelo ID"""
+    cache = player_caches.get(get_database_path())
+    if cache:
+        player = cache.get(player_id, get_data_version())
+        if player is not MISS:
+            return player
+
     conn = get_db_connection()
     cursor = conn.cursor()
 
@@ -210,6 +1161,9 @@ def get_player_by_id(player_id: str) -> Optional[Dict]:
     row = cursor.fetchone()
     conn.close()
 
+    if row and cache:
+        cache.put(dict(row))
+
     return dict(row) if row else None
 
 def update_player(player_id: str, player_data: Dict) -> bool:
@@ -233,6 +1187,16 @@ def update_player(player_id: str, player_data: Dict) -> bool:
     conn.commit()
     conn.close()
 
+    cache = player_caches.get(get_database_path())
+    if cache:
+        if updated:
+            cache.put({'id': player_id, 'name': player_data['name'],
+                       'main_char': player_data.get('main_char', ''),
+                       'rank': player_data.get('rank', ''),
+                       'region': player_data.get('region', '')})
+        else:
+            cache.discard(player_id)
+
     return updated
 
 def delete_player(player_id: str) -> bool:
@@ -246,69 +1210,290 @@ def delete_player(player_id: str) -> bool:
     conn.commit()
     conn.close()
 
+    cache = player_caches.get(get_database_path())
+    if cache:
+        cache.discard(player_id)
+
     return deleted
 
-# ==================== CONSULTAS DE ESTATÍSTICAS ====================
+# acima de tantos resultados a busca não ordena por relevância (bm25 em 100k linhas é lento)
+SEARCH_RANK_LIMIT = 1000
 
-def get_character_stats() -> List[Tuple[str, int, int]]:
-    """pega estatísticas agregadas de cada personagem"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
+def _has_players_fts(conn) -> bool:
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'players_fts'").fetchone() is not None
 
-    # pega todos os personagens que jogaram
-    cursor.execute('''
-        SELECT DISTINCT player1_char as character FROM matches
-        UNION
-        SELECT DISTINCT player2_char as character FROM matches
-    ''')
+def search_players(query: str, limit: int = 10) -> List[Dict]:
+    """busca jogadores por prefixo no nome, ID, main e região (autocomplete)"""
+    # só letras/números: o resto quebraria a sintaxe do MATCH
+    tokens = re.findall(r'\w+', query)
+    if not tokens:
+        return []
 
-    characters = [row['character'] for row in cursor.fetchall()]
+    conn = get_db_connection()
+    try:
+        if _has_players_fts(conn):
+            # autocomplete: as palavras já digitadas são exatas, só a última é prefixo
+            # ("player 12" -> "player" "12"*); expandir todas por prefixo é bem mais caro
+            match = ' '.join([f'"{token}"' for token in tokens[:-1]] + [f'"{tokens[-1]}"*'])
+
+            # prefixo muito amplo ("p"): devolve os primeiros sem ranquear
+            found = conn.execute('''
+                SELECT COUNT(*) FROM (
+                    SELECT 1 FROM players_fts WHERE players_fts MATCH ? LIMIT ?
+                )
+            ''', (match, SEARCH_RANK_LIMIT + 1)).fetchone()[0]
+            # nome pesa mais no ranking
+            order = 'ORDER BY bm25(players_fts, 5.0, 10.0, 1.0, 0.5)' if found <= SEARCH_RANK_LIMIT else ''
+
+            rows = conn.execute(f'''
+                SELECT p.id, p.name, p.main_char, p.rank, p.region
+                FROM players_fts
+                JOIN players p ON p.rowid = players_fts.rowid
+                WHERE players_fts MATCH ?
+                {order}
+                LIMIT ?
+            ''', (match, limit)).fetchall()
+        else:
+            prefix = query.strip().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            rows = conn.execute('''
+                SELECT id, name, main_char, rank, region
+                FROM players
+                WHERE name LIKE ? ESCAPE '\\' OR id LIKE ? ESCAPE '\\'
+                ORDER BY name
+                LIMIT ?
+            ''', (prefix, prefix, limit)).fetchall()
+    finally:
+        conn.close()
+
+    return [dict(row) for row in rows]
+
+# ==================== CONSULTAS DE ESTATÍSTICAS ====================
 
-    stats = []
+def get_character_stats(start: Optional[str] = None, end: Optional[str] = None) -> List[Tuple[str, int, int]]:
+    """pega estatísticas agregadas de cada personagem"""
+    # pega todos os personagens que jogaram (em todas as tabelas do intervalo)
+    characters = set()
+    for include_main, archives in _archive_chunks(start, end):
+        with _attached(include_main, archives) as (conn, tables):
+            for table in tables:
+                rows = conn.execute(f'''
+                    SELECT DISTINCT player1_char as character FROM {table}
+                    UNION
+                    SELECT DISTINCT player2_char as character FROM {table}
+                ''').fetchall()
+                characters.update(row['character'] for row in rows)
+
+    characters = sorted(characters)
+    queries = []
     for char in characters:
         # conta as partidas
-        cursor.execute('''
-            SELECT COUNT(*) as count FROM matches
+        queries.append(('''
+            SELECT COUNT(*) as count FROM {table}
             WHERE player1_char = ? OR player2_char = ?
-        ''', (char, char))
-        matches = cursor.fetchone()['count']
-
+        ''', (char, char)))
         # conta as vitórias
-        cursor.execute('''
-            SELECT COUNT(*) as count FROM matches
+        queries.append(('''
+            SELECT COUNT(*) as count FROM {table}
             WHERE winner_char = ?
-        ''', (char,))
-        wins = cursor.fetchone()['count']
-
-        stats.append((char, matches, wins))
+        ''', (char,)))
+
+    totals = _sum_over_tables(queries, start, end) if queries else []
+
+    return [(char, totals[2 * i][0], totals[2 * i + 1][0]) for i, char in enumerate(characters)]
+
+def get_character_totals(start: Optional[str] = None, end: Optional[str] = None) -> Dict:
+    """
+    partidas e vitórias de todos os personagens em duas consultas agregadas
+    (mesma contagem do calculate_stats: mirror match conta duas partidas e uma vitória)
+    """
+    total_matches = 0
+    characters = {}
+    conditions = []
+    params = []
+    if start:
+        conditions.append('timestamp >= ?')
+        params.append(start)
+    if end:
+        conditions.append('timestamp < ?')
+        params.append(end)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+
+    for include_main, archives in _archive_chunks(start, end):
+        with _attached(include_main, archives) as (conn, tables):
+            for table in tables:
+                total_matches += conn.execute(f'SELECT COUNT(*) FROM {table} {where}', params).fetchone()[0]
+                for row in conn.execute(f'''
+                    SELECT character, COUNT(*) AS matches FROM (
+                        SELECT player1_char AS character FROM {table} {where}
+                        UNION ALL
+                        SELECT player2_char AS character FROM {table} {where}
+                    )
+                    GROUP BY character
+                ''', params * 2):
+                    characters.setdefault(row['character'], {'matches': 0, 'wins': 0})['matches'] += row['matches']
+                for row in conn.execute(f'''
+                    SELECT winner_char AS character, COUNT(*) AS wins
+                    FROM {table} {where}
+                    GROUP BY winner_char
+                ''', params):
+                    characters.setdefault(row['character'], {'matches': 0, 'wins': 0})['wins'] += row['wins']
+
+    return {'total_matches': total_matches, 'characters': characters}
+
+def get_matchup_totals(start: Optional[str] = None, end: Optional[str] = None,
+                       pinned: Optional[Callable[[], None]] = None) -> Dict[Tuple[str, str], int]:
+    """
+    partidas por (personagem vencedor, personagem perdedor). com `pinned`, a leitura
+    da tabela principal roda numa transação aberta antes: pinned() é chamado com ela
+    já fixa (WAL), e o que for gravado depois não entra no resultado (shared_stats.rebuild)
+    """
+    conditions = []
+    params = []
+    if start:
+        conditions.append('timestamp >= ?')
+        params.append(start)
+    if end:
+        conditions.append('timestamp < ?')
+        params.append(end)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+
+    totals = {}
+    for include_main, archives in _archive_chunks(start, end):
+        with _attached(include_main, archives) as (conn, tables):
+            if include_main and pinned:
+                # a primeira leitura dentro da transação fixa o retrato do banco
+                conn.execute('BEGIN')
+                conn.execute('SELECT 1 FROM main.matches LIMIT 1').fetchall()
+                pinned()
+                pinned = None
+            for table in tables:
+                for row in conn.execute(f'''
+                    SELECT winner_char,
+                           CASE WHEN winner_char = player1_char THEN player2_char ELSE player1_char END AS loser_char,
+                           COUNT(*) AS matches
+                    FROM {table} {where}
+                    GROUP BY 1, 2
+                ''', params):
+                    key = (row['winner_char'], row['loser_char'])
+                    totals[key] = totals.get(key, 0) + row['matches']
+    return totals
+
+def get_shared_character_totals() -> Optional[Dict]:
+    """
+    get_character_totals() servido da memória compartilhada (SHARED_STATS=true),
+    sem consultar o banco; None com os contadores desligados. com o bloco
+    indisponível (escritor morto no meio, remontagem em andamento) lê do banco
+    """
+    stats = shared_stats.get_store(get_database_path())
+    if stats is None:
+        return None
+    totals = stats.character_totals(get_matchup_totals)
+    return totals if totals is not None else get_character_totals()
+
+def get_shared_totals() -> Optional[Tuple[Dict, Dict[Tuple[str, str], int]]]:
+    """
+    (get_character_totals(), {(vencedor, perdedor): partidas}) da memória compartilhada
+    numa leitura só; None com os contadores desligados ou indisponíveis (sem cair no banco)
+    """
+    stats = shared_stats.get_store(get_database_path())
+    return stats.totals(get_matchup_totals) if stats else None
+
+def get_character_counters(characters: List[str]) -> Dict[str, Dict]:
+    """pega vitórias e partidas só dos personagens pedidos (usado nos deltas ao vivo)"""
+    characters = list(dict.fromkeys(characters))
+
+    # conta cada lado separado pra bater com calculate_stats em mirror match
+    totals = _sum_over_tables([('''
+            SELECT COALESCE(SUM(player1_char = ?), 0) + COALESCE(SUM(player2_char = ?), 0) as matches,
+                   COALESCE(SUM(winner_char = ?), 0) as wins
+            FROM {table}
+            WHERE player1_char = ? OR player2_char = ?
+        ''', (char, char, char, char, char)) for char in characters])
+
+    return {char: {'matches': total[0], 'wins': total[1]} for char, total in zip(characters, totals)}
+
+def count_matches() -> int:
+    """total de partidas, com as arquivadas"""
+    (total,), = _sum_over_tables([('SELECT COUNT(*) FROM {table}', ())])
+    return total
+
+def get_head_to_head(player_a: str, player_b: str, start: Optional[str] = None,
+                     end: Optional[str] = None, recent: int = 20) -> Dict:
+    """
+    retrospecto entre dois jogadores: totais, quebra por personagem e últimas partidas
+    tudo pelo índice (pair_lo, pair_hi, timestamp), então o custo depende só do histórico do par
+    """
+    pair = tuple(sorted((player_a, player_b)))
+    conditions = ['pair_lo = ? AND pair_hi = ?']
+    params = list(pair)
+    if start:
+        conditions.append('timestamp >= ?')
+        params.append(start)
+    if end:
+        conditions.append('timestamp < ?')
+        params.append(end)
+    where = ' AND '.join(conditions)
+
+    characters = {}
+    for include_main, archives in _archive_chunks(start, end):
+        with _attached(include_main, archives) as (conn, tables):
+            for table in tables:
+                rows = conn.execute(f'''
+                    SELECT CASE WHEN player1_id = ? THEN player1_char ELSE player2_char END AS a_char,
+                           CASE WHEN player1_id = ? THEN player2_char ELSE player1_char END AS b_char,
+                           COUNT(*) AS matches,
+                           COALESCE(SUM(winner_id = ?), 0) AS a_wins
+                    FROM {table}
+                    WHERE {where}
+                    GROUP BY a_char, b_char
+                ''', [player_a, player_a, player_a] + params).fetchall()
+                for row in rows:
+                    entry = characters.setdefault((row['a_char'], row['b_char']), {'matches': 0, 'wins': 0})
+                    entry['matches'] += row['matches']
+                    entry['wins'] += row['a_wins']
+
+    breakdown = sorted(({
+        'player1_char': a_char,
+        'player2_char': b_char,
+        'matches': entry['matches'],
+        'player1_wins': entry['wins'],
+        'player2_wins': entry['matches'] - entry['wins'],
+    } for (a_char, b_char), entry in characters.items()),
+        key=lambda x: (-x['matches'], x['player1_char'], x['player2_char']))
+
+    total = sum(entry['matches'] for entry in breakdown)
+    a_wins = sum(entry['player1_wins'] for entry in breakdown)
+
+    # mais recentes primeiro; para de ler assim que tiver `recent` partidas
+    recent_matches = []
+    if recent > 0:
+        for match in _select_matches(start, end, descending=True, batch_size=recent, pair=pair):
+            recent_matches.append(match)
+            if len(recent_matches) >= recent:
+                break
 
-    conn.close()
-    return stats
+    return {
+        'total_matches': total,
+        'player1_wins': a_wins,
+        'player2_wins': total - a_wins,
+        'characters': breakdown,
+        'recent_matches': recent_matches,
+    }
 
 def get_matchup_stats(char1: str, char2: str) -> Dict:
     """pega estatísticas de confronto direto entre dois personagens"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    # conta vitórias do char1
-    cursor.execute('''
-        SELECT COUNT(*) as count FROM matches
+    matchup = '''
+        SELECT COUNT(*) as count FROM {table}
         WHERE ((player1_char = ? AND player2_char = ?) OR
                (player1_char = ? AND player2_char = ?))
           AND winner_char = ?
-    ''', (char1, char2, char2, char1, char1))
-    char1_wins = cursor.fetchone()['count']
-
-    # conta vitórias do char2
-    cursor.execute('''
-        SELECT COUNT(*) as count FROM matches
-        WHERE ((player1_char = ? AND player2_char = ?) OR
-               (player1_char = ? AND player2_char = ?))
-          AND winner_char = ?
-    ''', (char1, char2, char2, char1, char2))
-    char2_wins = cursor.fetchone()['count']
-
-    conn.close()
+    '''
+    # vitórias do char1 e do char2
+    (char1_wins,), (char2_wins,) = _sum_over_tables([
+        (matchup, (char1, char2, char2, char1, char1)),
+        (matchup, (char1, char2, char2, char1, char2)),
+    ])
 
     return {
         'char1_wins': char1_wins,
@@ -331,20 +1516,16 @@ def import_from_json(matches_file: str = 'data/matches.json',
 
         print(f"Importing {len(matches)} matches...")
         imported = 0
-        import time
-        for i, match in enumerate(matches):
+        skipped = 0
+        for match in matches:
             try:
                 # lida com formato antigo e novo do JSON
                 # formato antigo: player1, player2, winner (sem sufixo _char)
                 # formato novo: player1, player2, winner + player1_char, player2_char, winner_char
 
-                # gera ID único se estiver faltando ou duplicado (id=0)
-                match_id = match.get('id', 0)
-                if match_id == 0 or match_id is None:
-                    match_id = int(time.time() * 1000) + i  # garante IDs únicos
-
+                # sem ID (ou id=0): pega um da sequência, sem risco de colidir
                 match_data = {
-                    'id': match_id,
+                    'id': match.get('id') or None,
                     'timestamp': match.get('timestamp', datetime.now().isoformat()),
                     'player1': match.get('player1', ''),
                     'player2': match.get('player2', ''),
@@ -352,15 +1533,23 @@ def import_from_json(matches_file: str = 'data/matches.json',
                     # usa campos _char se existir, senão usa os campos base (pra compatibilidade)
                     'player1_char': match.get('player1_char', match.get('player1', '')),
                     'player2_char': match.get('player2_char', match.get('player2', '')),
-                    'winner_char': match.get('winner_char', match.get('winner', ''))
+                    'winner_char': match.get('winner_char', match.get('winner', '')),
+                    'idempotency_key': match.get('idempotency_key')
                 }
-
-                add_match(match_data)
-                imported += 1
+                if not match_data['id'] and not match_data['idempotency_key'] and match.get('timestamp'):
+                    # partida sem ID: rodar o import de novo não pode duplicar
+                    match_data['idempotency_key'] = (f"json:{match['timestamp']}:{match_data['player1_char']}:"
+                                                     f"{match_data['player2_char']}:{match_data['winner_char']}")
+
+                _, created = insert_match(match_data)
+                if created:
+                    imported += 1
+                else:
+                    skipped += 1
             except Exception as e:
                 print(f"Error importing match {match.get('id')}: {e}")
 
-        print(f"Successfully imported {imported} matches")
+        print(f"Successfully imported {imported} matches ({skipped} already imported)")
     else:
         print(f"No matches file found at {matches_file}")
 
@@ -0,0 +1,127 @@
+"""
+cache de fragmentos renderizados dos templates Jinja
+os blocos caros (tabelas com loops) ficam guardados já em HTML, com chave
+formada pela versão dos dados + nome do fragmento + parâmetros, então
+enquanto o banco não muda o HTML é servido sem rodar os loops de novo
+
+uso no template:
+    {% cache 'matchup_rows', request.script_root %} ... {% endcache %}
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from jinja2 import nodes
+from jinja2.ext import Extension
+
+FRAGMENT_CACHE_BYTES = int(os.getenv('FRAGMENT_CACHE_BYTES', 4 * 1024 * 1024))
+
+
+class FragmentCache:
+    """cache LRU de fragmentos HTML limitado pelo tamanho total em bytes"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _entry_size(html: str) -> int:
+        # aproximação barata, evita encodar o fragmento só pra medir
+        return len(html) * 2
+
+    def get(self, key: Tuple) -> Optional[str]:
+        with self._lock:
+            html = self._entries.get(key)
+            if html is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return html
+
+    def put(self, key: Tuple, html: str):
+        size = self._entry_size(html)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= self._entry_size(old)
+
+            self._entries[key] = html
+            self._size += size
+
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= self._entry_size(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+class FragmentCacheExtension(Extension):
+    """tag {% cache nome, params... %} ... {% endcache %}"""
+
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        # sem cache configurado o bloco é renderizado normalmente
+        environment.extend(fragment_cache=None, fragment_cache_version=lambda: 0)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+
+        args = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        call = self.call_method('_render_fragment', [nodes.List(args)])
+        return nodes.CallBlock(call, [], [], body).set_lineno(lineno)
+
+    def _render_fragment(self, key_parts, caller):
+        cache = self.environment.fragment_cache
+        if cache is None:
+            return caller()
+
+        key = (self.environment.fragment_cache_version(),) + tuple(repr(part) for part in key_parts)
+
+        html = cache.get(key)
+        if html is None:
+            html = caller()
+            cache.put(key, html)
+        return html
+
+
+fragment_cache = FragmentCache(FRAGMENT_CACHE_BYTES)
+
+
+def init_fragment_cache(app, version_func):
+    """liga a tag {% cache %} no Jinja do app usando version_func como versão dos dados"""
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    if FRAGMENT_CACHE_BYTES > 0:
+        app.jinja_env.fragment_cache = fragment_cache
+    app.jinja_env.fragment_cache_version = version_func
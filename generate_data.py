@@ -0,0 +1,135 @@
+"""
+gerador de dados sintéticos e reproduzíveis pro Tekken Stats Tracker
+preenche o banco com N partidas e P jogadores sorteados de TEKKEN_CHARS,
+TEKKEN_RANKS e REGIONS; a mesma seed sempre gera os mesmos dados
+
+Como usar:
+    python generate_data.py --matches 100000 --players 500
+    python generate_data.py --matches 1000000 --db data/bench.db --reset --seed 7
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List
+
+import database
+from utils import TEKKEN_CHARS, TEKKEN_RANKS, REGIONS
+
+DEFAULT_SEED = 42
+BATCH_SIZE = 10000
+
+# data fixa pra seed gerar sempre os mesmos timestamps
+BASE_TIME = datetime(2024, 1, 1)
+
+
+def generate_players(count: int, rng: random.Random) -> List[Dict]:
+    """gera jogadores com main, rank e região aleatórios"""
+    return [{
+        'id': f"player{i:06d}",
+        'name': f"Player {i}",
+        'main_char': rng.choice(TEKKEN_CHARS),
+        'rank': rng.choice(TEKKEN_RANKS),
+        'region': rng.choice(REGIONS),
+    } for i in range(count)]
+
+
+def generate_matches(count: int, players: List[Dict], rng: random.Random,
+                     span_days: int = 365) -> Iterator[Dict]:
+    """gera partidas no mesmo formato da rota /add, espalhadas em span_days"""
+    # personagens populares aparecem mais, como numa base real
+    weights = [1.0 / (1 + i * 0.1) for i in range(len(TEKKEN_CHARS))]
+    chars = TEKKEN_CHARS[:]
+    rng.shuffle(chars)
+
+    step_ms = max(1, span_days * 86400 * 1000 // max(count, 1))
+    base_id = int(BASE_TIME.timestamp() * 1000)
+
+    for i in range(count):
+        p1_char, p2_char = rng.choices(chars, weights=weights, k=2)
+        winner_char = p1_char if rng.random() < 0.5 else p2_char
+
+        match = {
+            'id': base_id + i,
+            'timestamp': (BASE_TIME + timedelta(milliseconds=i * step_ms)).isoformat(),
+            'player1': p1_char,
+            'player2': p2_char,
+            'winner': winner_char,
+            'player1_char': p1_char,
+            'player2_char': p2_char,
+            'winner_char': winner_char,
+        }
+
+        if len(players) >= 2:
+            p1, p2 = rng.sample(players, 2)
+            match['player1_id'] = p1['id']
+            match['player2_id'] = p2['id']
+            match['winner_id'] = p1['id'] if winner_char == p1_char else p2['id']
+
+        yield match
+
+
+def populate(matches: int, players: int, seed: int = DEFAULT_SEED, batch_size: int = BATCH_SIZE) -> Dict:
+    """preenche o banco atual (database.DATABASE_PATH) e devolve um resumo"""
+    rng = random.Random(seed)
+    database.init_db()
+
+    start = time.perf_counter()
+    player_list = generate_players(players, rng)
+    if player_list:
+        database.add_players(player_list)
+
+    batch = []
+    for match in generate_matches(matches, player_list, rng):
+        batch.append(match)
+        if len(batch) >= batch_size:
+            database.add_matches(batch)
+            batch = []
+    if batch:
+        database.add_matches(batch)
+
+    elapsed = time.perf_counter() - start
+    return {
+        'matches': matches,
+        'players': players,
+        'seed': seed,
+        'seconds': round(elapsed, 3),
+        'rows_per_sec': round(matches / elapsed) if elapsed > 0 else None,
+    }
+
+
+def reset_database(path: str):
+    """apaga o arquivo do banco (e os arquivos auxiliares do SQLite)"""
+    # conexões abertas continuariam apontando pro arquivo apagado
+    database.close_pools()
+    database.close_version_connections()
+    for suffix in ('', '-wal', '-shm', '-journal'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    database.forget_database(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Gera dados sintéticos pro Tekken Stats')
+    parser.add_argument('--matches', type=int, default=10000, help='quantidade de partidas')
+    parser.add_argument('--players', type=int, default=200, help='quantidade de jogadores')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help='seed do gerador')
+    parser.add_argument('--db', default=database.DATABASE_PATH, help='arquivo do banco')
+    parser.add_argument('--reset', action='store_true', help='apaga o banco antes de gerar')
+    args = parser.parse_args(argv)
+
+    database.DATABASE_PATH = args.db
+    if args.reset:
+        reset_database(args.db)
+
+    summary = populate(args.matches, args.players, args.seed)
+    print(f"Gerou {summary['matches']:,} partidas e {summary['players']:,} jogadores "
+          f"em {summary['seconds']}s ({summary['rows_per_sec']:,} linhas/s) -> {args.db}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,37 @@
+"""
+configuração do gunicorn pro Tekken Stats (só POSIX: pip install gunicorn)
+o master carrega o app uma vez (preload, ver wsgi.py) e faz o fork dos workers;
+cada worker refaz o que não atravessa o fork (thread do log, pool de conexões,
+caches chaveados pelo data_version, agendadores) e pede as WARMUP_PATHS pra
+si mesmo antes de atender a primeira requisição de verdade
+
+Como usar:
+    gunicorn -c gunicorn.conf.py
+"""
+
+import multiprocessing
+import os
+
+wsgi_app = 'wsgi:app'
+bind = f"{os.getenv('FLASK_HOST', '127.0.0.1')}:{os.getenv('FLASK_PORT', 5000)}"
+
+# SQLite tem um escritor por vez: mais processos não aumentam as gravações
+workers = int(os.getenv('WEB_CONCURRENCY', min(multiprocessing.cpu_count() * 2 + 1, 8)))
+# threads por worker: cada cliente do /api/stream (SSE) segura uma enquanto estiver conectado
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 8))
+# no máximo metade delas com SSE: o resto continua atendendo as páginas (lido no import do app)
+os.environ.setdefault('STREAM_MAX_CLIENTS', str(max(threads // 2, 1)))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 60))
+graceful_timeout = 30
+preload_app = True
+
+
+def post_fork(server, worker):
+    import tekkenapp
+    tekkenapp.after_fork()
+
+
+def post_worker_init(worker):
+    import tekkenapp
+    tekkenapp.warm_worker(worker.wsgi)
@@ -0,0 +1,189 @@
+"""
+ligas: um arquivo SQLite por liga
+cada liga tem o próprio banco em data/leagues/<liga>/tekken_stats.db (com os
+arquivos mensais e o pool de conexões dele); a liga vem do prefixo da URL,
+/league/<liga>/..., e as rotas do app continuam as mesmas. a liga 'main' é o
+DATABASE_PATH de sempre, usado quando a URL não tem prefixo
+
+consultas entre ligas rodam em paralelo, uma thread por liga, e o resultado
+é juntado no fim (fan_out + merge_character_totals)
+
+Como usar:
+    python leagues.py create eu
+    python leagues.py list
+"""
+
+import argparse
+import logging
+import os
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from flask import abort, g, has_request_context, request
+
+import database
+
+logger = logging.getLogger(__name__)
+
+LEAGUES_DIR = os.getenv('LEAGUES_DIR', 'data/leagues')
+# ligas conhecidas além das que já têm banco em LEAGUES_DIR (ex: LEAGUES=eu,na,br)
+LEAGUES = [key.strip() for key in os.getenv('LEAGUES', '').split(',') if key.strip()]
+LEAGUE_FANOUT_WORKERS = int(os.getenv('LEAGUE_FANOUT_WORKERS', 4))
+
+DEFAULT_LEAGUE = 'main'
+LEAGUE_KEY_RE = re.compile(r'^[a-z0-9][a-z0-9_-]{0,31}$')
+LEAGUE_PREFIX = '/league/'
+DATABASE_FILE = 'tekken_stats.db'
+
+
+def league_path(key: str) -> str:
+    """arquivo do banco da liga"""
+    if key == DEFAULT_LEAGUE:
+        return database.DATABASE_PATH
+    if not LEAGUE_KEY_RE.match(key):
+        raise ValueError(f"Liga inválida: {key}")
+    return os.path.join(LEAGUES_DIR, key, DATABASE_FILE)
+
+
+def league_exists(key: str) -> bool:
+    if key == DEFAULT_LEAGUE:
+        return True
+    if not LEAGUE_KEY_RE.match(key):
+        return False
+    return key in LEAGUES or os.path.exists(league_path(key))
+
+
+def list_leagues() -> List[str]:
+    """'main' primeiro, depois as ligas configuradas e as que têm banco no disco"""
+    keys = {key for key in LEAGUES if LEAGUE_KEY_RE.match(key)}
+    if os.path.isdir(LEAGUES_DIR):
+        for key in os.listdir(LEAGUES_DIR):
+            if LEAGUE_KEY_RE.match(key) and os.path.exists(league_path(key)):
+                keys.add(key)
+    keys.discard(DEFAULT_LEAGUE)
+    return [DEFAULT_LEAGUE] + sorted(keys)
+
+
+def create_league(key: str) -> str:
+    """cria o banco da liga (roda as migrações) e devolve o caminho"""
+    path = league_path(key)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with database.use_database(path):
+        database.init_db()
+    return path
+
+
+def current_league() -> Optional[str]:
+    """liga da requisição atual (None fora de requisição ou sem prefixo /league/)"""
+    if not has_request_context():
+        return None
+    return g.get('league')
+
+
+class LeagueMiddleware:
+    """
+    move o prefixo /league/<liga> do PATH_INFO pro SCRIPT_NAME: as rotas não mudam
+    e o url_for/request.script_root já geram os links dentro da mesma liga
+    """
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if path.startswith(LEAGUE_PREFIX):
+            key, _, rest = path[len(LEAGUE_PREFIX):].partition('/')
+            if key:
+                environ['tekken.league'] = key
+                environ['SCRIPT_NAME'] = f"{environ.get('SCRIPT_NAME', '')}{LEAGUE_PREFIX}{key}"
+                environ['PATH_INFO'] = '/' + rest
+        return self.wsgi_app(environ, start_response)
+
+
+def init_leagues(app):
+    """liga o roteamento por liga no app: cada requisição usa o banco da liga do prefixo"""
+    app.wsgi_app = LeagueMiddleware(app.wsgi_app)
+
+    @app.before_request
+    def _select_league():
+        key = g.league = request.environ.get('tekken.league')
+        if key is None:
+            return
+        if not league_exists(key):
+            abort(404)
+        # o banco vale até o teardown (inclusive pros streams com stream_with_context)
+        g.league_token = database.set_active_database(league_path(key))
+        database.init_db()
+
+    @app.teardown_request
+    def _release_league(exc=None):
+        token = g.pop('league_token', None)
+        if token is not None:
+            try:
+                database.reset_active_database(token)
+            except ValueError:
+                # teardown num contexto diferente (ex: fim de stream); o contexto some junto
+                pass
+
+
+def fan_out(func: Callable, leagues: Optional[List[str]] = None,
+            workers: int = LEAGUE_FANOUT_WORKERS) -> Dict[str, object]:
+    """roda func() no banco de cada liga em paralelo; devolve {liga: resultado}"""
+    keys = leagues if leagues is not None else list_leagues()
+    if not keys:
+        return {}
+
+    def run(key):
+        with database.use_database(league_path(key)):
+            database.init_db()
+            return func()
+
+    # o SQLite solta o GIL durante a consulta, então as ligas rodam de fato em paralelo
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(keys))),
+                            thread_name_prefix='league-fanout') as pool:
+        return dict(zip(keys, pool.map(run, keys)))
+
+
+def merge_character_totals(results: Dict[str, Dict]) -> Dict:
+    """soma os get_character_totals() de várias ligas"""
+    merged = {'total_matches': 0, 'characters': {}}
+    for totals in results.values():
+        merged['total_matches'] += totals['total_matches']
+        for char, counts in totals['characters'].items():
+            entry = merged['characters'].setdefault(char, {'matches': 0, 'wins': 0})
+            entry['matches'] += counts['matches']
+            entry['wins'] += counts['wins']
+    return merged
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Ligas do Tekken Stats (um banco por liga)')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_create = sub.add_parser('create', help='cria o banco de uma liga')
+    p_create.add_argument('league')
+
+    sub.add_parser('list', help='lista as ligas')
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.command == 'create':
+        try:
+            print(create_league(args.league))
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            return 1
+    elif args.command == 'list':
+        for key in list_leagues():
+            path = league_path(key)
+            size = f"{os.path.getsize(path):,} bytes" if os.path.exists(path) else 'sem banco ainda'
+            print(f"{key}  {path}  {size}")
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
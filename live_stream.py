@@ -0,0 +1,297 @@
+"""
+stream de estatísticas ao vivo via server-sent events (SSE)
+cada cliente conectado em /api/stream ganha uma fila própria e recebe
+só os deltas das partidas novas, sem precisar recalcular tudo no reload
+
+as partidas entram na fila match_events do banco (database.py) na mesma
+transação da gravação; cada processo com clientes conectados tem uma thread
+que confere o data_version a cada STREAM_POLL_SECONDS e repassa os eventos
+novos, então quem está num worker vê as partidas gravadas em qualquer outro
+"""
+
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import database
+import leagues
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_SECONDS = 15
+MAX_QUEUED_EVENTS = 100
+
+STREAM_POLL_SECONDS = float(os.getenv('STREAM_POLL_SECONDS', 0.5))
+# acima disso numa leitura só o cliente recarrega a página em vez de aplicar delta por delta
+STREAM_MAX_BATCH = int(os.getenv('STREAM_MAX_BATCH', 50))
+# clientes SSE por processo (0 = sem limite); cada um segura uma thread do worker
+STREAM_MAX_CLIENTS = int(os.getenv('STREAM_MAX_CLIENTS', 0))
+
+
+def format_sse(data: Dict, event: Optional[str] = None, event_id: Optional[str] = None) -> str:
+    """formata uma mensagem no protocolo text/event-stream"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event is not None:
+        lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'))}")
+    return '\n'.join(lines) + '\n\n'
+
+
+def _batch_counters(matches: List[Dict]) -> Tuple[int, Dict[str, Dict], Dict[Tuple[str, str], Tuple[int, int]]]:
+    """
+    total de partidas e contadores dos personagens e confrontos tocados pelo lote: da
+    memória compartilhada (SHARED_STATS) sem consultar o banco, ou num conjunto de
+    consultas só pro lote inteiro
+    """
+    characters = list(dict.fromkeys(char for m in matches for char in (m['player1_char'], m['player2_char'])))
+    # mesma chave ordenada usada em calculate_matchup_stats
+    pairs = list(dict.fromkeys(tuple(sorted((m['player1_char'], m['player2_char']))) for m in matches))
+
+    shared = database.get_shared_totals()
+    if shared is not None:
+        totals, matchups = shared
+        counters = {char: totals['characters'].get(char, {'matches': 0, 'wins': 0}) for char in characters}
+        wins = {(char1, char2): (matchups.get((char1, char2), 0), matchups.get((char2, char1), 0))
+                for char1, char2 in pairs}
+        return totals['total_matches'], counters, wins
+
+    wins = {}
+    for char1, char2 in pairs:
+        counts = database.get_matchup_stats(char1, char2)
+        wins[(char1, char2)] = (counts['char1_wins'], counts['char2_wins'])
+    return database.count_matches(), database.get_character_counters(characters), wins
+
+
+def build_match_deltas(matches: List[Dict]) -> List[Dict]:
+    """
+    delta de cada partida nova: a partida e os contadores que ela mudou, em valores
+    atuais (aplicar o mesmo delta duas vezes não muda nada, o replay pode repetir)
+    """
+    total_matches, counters, wins = _batch_counters(matches)
+
+    deltas = []
+    for match in matches:
+        characters = []
+        for char in dict.fromkeys((match['player1_char'], match['player2_char'])):
+            counter = counters[char]
+            win_rate = (counter['wins'] / counter['matches']) * 100 if counter['matches'] else 0
+            characters.append({
+                'character': char,
+                'wins': counter['wins'],
+                'matches': counter['matches'],
+                'usage': counter['matches'],
+                'winRate': f"{win_rate:.1f}%"
+            })
+
+        char1, char2 = sorted([match['player1_char'], match['player2_char']])
+        char1_wins, char2_wins = wins[(char1, char2)]
+        if char1 == char2:
+            # em mirror match as duas contagens são a mesma partida
+            char2_wins = 0
+        total = char1_wins + char2_wins
+
+        deltas.append({
+            'match': {key: match[key] for key in ('id', 'timestamp', 'player1_char', 'player2_char', 'winner_char')},
+            'total_matches': total_matches,
+            'characters': characters,
+            'matchup': {
+                'key': f"{char1}_vs_{char2}",
+                'char1': char1,
+                'char2': char2,
+                'char1_wins': char1_wins,
+                'char2_wins': char2_wins,
+                'total': total,
+                'char1_winrate': f"{(char1_wins / total) * 100:.1f}%" if total else '0%',
+                'char2_winrate': f"{(char2_wins / total) * 100:.1f}%" if total else '0%'
+            }
+        })
+    return deltas
+
+
+def read_events(last_seq: int) -> Tuple[int, List[Tuple[int, str]]]:
+    """
+    mensagens SSE dos eventos da fila do banco depois de `last_seq`, no banco em uso;
+    devolve (último seq lido, [(seq, mensagem)])
+    """
+    events = database.get_match_events(last_seq, STREAM_MAX_BATCH + 1)
+    if not events:
+        if last_seq <= database.get_last_event_seq():
+            return last_seq, []
+        # seq maior que o da fila: banco restaurado ou trocado desde o último evento
+    elif (events[0]['seq'] == last_seq + 1 and len(events) <= STREAM_MAX_BATCH
+          and all(e['match'] is not None for e in events)):
+        # contadores lidos uma vez pro lote todo, fora das requisições
+        deltas = build_match_deltas([e['match'] for e in events])
+        return events[-1]['seq'], [(e['seq'], format_sse(delta, 'match', str(e['seq'])))
+                                   for e, delta in zip(events, deltas)]
+
+    # delete, clear, restore, lote grande ou eventos que já saíram da fila
+    # (o seq não tem buraco): mais barato o cliente recarregar
+    last_seq = database.get_last_event_seq()
+    return last_seq, [(last_seq, format_sse({'seq': last_seq}, 'refresh', str(last_seq)))]
+
+
+class EventBroker:
+    """distribui eventos pra todos os clientes SSE conectados"""
+
+    def __init__(self, path: Optional[str] = None, max_queued: int = MAX_QUEUED_EVENTS):
+        # banco que a thread de leitura acompanha (None = DATABASE_PATH)
+        self.path = path
+        self.max_queued = max_queued
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._feed = None
+
+    def subscribe(self) -> queue.Queue:
+        q = queue.Queue(maxsize=self.max_queued)
+        with self._lock:
+            self._subscribers.add(q)
+            # a thread só roda enquanto tiver alguém conectado neste processo
+            if self._feed is None:
+                self._feed = threading.Thread(target=self._run_feed, name='sse-feed', daemon=True)
+                self._feed.start()
+        return q
+
+    def unsubscribe(self, q: queue.Queue):
+        with self._lock:
+            self._subscribers.discard(q)
+
+    def has_subscribers(self) -> bool:
+        with self._lock:
+            return bool(self._subscribers)
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+    def publish(self, data: Dict, event: Optional[str] = None, event_id: Optional[str] = None):
+        """envia o evento pra todas as filas; clientes lentos demais são desconectados"""
+        seq = int(event_id) if event_id is not None and event_id.isdigit() else 0
+        self._send(seq, format_sse(data, event, event_id))
+
+    def _send(self, seq: int, message: str):
+        with self._lock:
+            subscribers = list(self._subscribers)
+
+        for q in subscribers:
+            try:
+                q.put_nowait((seq, message))
+            except queue.Full:
+                # cliente não tá consumindo, derruba pra não acumular memória
+                self.unsubscribe(q)
+                try:
+                    q.put_nowait(None)
+                except queue.Full:
+                    pass
+
+    def forward(self, last_seq: int) -> int:
+        """publica os eventos da fila do banco depois de `last_seq`; devolve o último seq lido"""
+        last_seq, messages = read_events(last_seq)
+        for seq, message in messages:
+            self._send(seq, message)
+        return last_seq
+
+    def _run_feed(self):
+        with database.use_database(self.path):
+            version = last_seq = None
+            while True:
+                with self._lock:
+                    if not self._subscribers:
+                        self._feed = None
+                        return
+                try:
+                    if last_seq is None:
+                        # começa do fim da fila: quem conectou agora não recebe partidas antigas
+                        version = database.get_data_version()
+                        last_seq = database.get_last_event_seq()
+                    elif database.get_data_version() != version:
+                        # lê o data_version antes: o que for gravado durante a leitura aparece na próxima volta
+                        version = database.get_data_version()
+                        last_seq = self.forward(last_seq)
+                except sqlite3.Error as e:
+                    logger.warning(f"Live stream feed failed: {e}")
+                time.sleep(STREAM_POLL_SECONDS)
+
+    def replay(self, last_event_id: int) -> Tuple[int, List[str]]:
+        """o que o cliente perdeu desde `last_event_id` (Last-Event-ID da reconexão)"""
+        try:
+            with database.use_database(self.path):
+                last_seq, messages = read_events(last_event_id)
+        except sqlite3.Error as e:
+            logger.warning(f"Live stream replay failed: {e}")
+            return 0, []
+        return last_seq, [message for _, message in messages]
+
+    def stream(self, q: Optional[queue.Queue] = None, last_event_id: Optional[int] = None,
+               heartbeat: int = HEARTBEAT_SECONDS) -> Iterator[str]:
+        """
+        gerador usado pela resposta SSE de um cliente (q = fila já inscrita com open_client);
+        com `last_event_id` manda antes os eventos da fila que o cliente perdeu
+        """
+        if q is None:
+            q = self.subscribe()
+        try:
+            # retry diz pro EventSource quanto esperar antes de reconectar
+            yield 'retry: 3000\n\n'
+            # inscrito antes do replay: o que chegar na fila e também vier no replay é pulado pelo seq
+            replayed = 0
+            if last_event_id is not None:
+                replayed, messages = self.replay(last_event_id)
+                yield from messages
+            while True:
+                try:
+                    item = q.get(timeout=heartbeat)
+                except queue.Empty:
+                    # comentário SSE mantém a conexão viva em proxies
+                    yield ': ping\n\n'
+                    continue
+
+                if item is None:
+                    break
+                seq, message = item
+                if seq and seq <= replayed:
+                    continue
+                yield message
+        finally:
+            self.unsubscribe(q)
+
+
+broker = EventBroker()
+
+
+# um broker por liga (leagues.py); o `broker` acima é o do banco padrão
+_league_brokers = {}
+_league_brokers_lock = threading.Lock()
+_clients_lock = threading.Lock()
+
+
+def get_broker(league: Optional[str] = None) -> EventBroker:
+    """broker dos clientes conectados numa liga (None = banco padrão)"""
+    if league is None:
+        return broker
+    with _league_brokers_lock:
+        if league not in _league_brokers:
+            _league_brokers[league] = EventBroker(leagues.league_path(league))
+        return _league_brokers[league]
+
+
+def subscriber_count() -> int:
+    """clientes SSE conectados somando todas as ligas"""
+    with _league_brokers_lock:
+        league_brokers = list(_league_brokers.values())
+    return broker.subscriber_count() + sum(b.subscriber_count() for b in league_brokers)
+
+
+def open_client(event_broker: EventBroker) -> Optional[queue.Queue]:
+    """inscreve um cliente novo; None se o processo já tem STREAM_MAX_CLIENTS conectados"""
+    with _clients_lock:
+        if STREAM_MAX_CLIENTS and subscriber_count() >= STREAM_MAX_CLIENTS:
+            return None
+        return event_broker.subscribe()
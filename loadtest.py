@@ -0,0 +1,273 @@
+"""
+teste de carga local com clientes concorrentes e percentis de latência
+sobe o app num servidor WSGI com threads, dispara tráfego misto de leitura e
+escrita com vários clientes ao mesmo tempo e mostra throughput, p50/p95/p99
+por rota e a contagem de erros/locks do SQLite em cada nível de concorrência
+
+Como usar:
+    python loadtest.py                                  # concorrência 1,4,16,32 por 10s cada
+    python loadtest.py --concurrency 8,64 --duration 30
+    python loadtest.py --seed-matches 100000 --json loadtest.json
+"""
+
+import argparse
+import http.client
+import json
+import logging
+import os
+import random
+import sqlite3
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlencode
+
+import database
+import generate_data
+from utils import TEKKEN_CHARS
+
+DEFAULT_DB = 'data/loadtest.db'
+
+# (rota agrupada, método, peso); as rotas com parâmetro são sorteadas na hora
+TRAFFIC_MIX = [
+    ('/', 'GET', 20),
+    ('/add', 'GET', 3),
+    ('/add', 'POST', 10),
+    ('/matchups', 'GET', 10),
+    ('/players', 'GET', 5),
+    ('/api/stats', 'GET', 15),
+    ('/api/used-characters', 'GET', 5),
+    ('/api/character-usage', 'GET', 10),
+    ('/api/dashboard', 'GET', 10),
+    ('/render/<name>', 'GET', 12),
+]
+
+
+def percentile(sorted_values: List[float], pct: float) -> Optional[float]:
+    """percentil por nearest-rank numa lista já ordenada"""
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(pct / 100 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class LockCounter:
+    """conta exceções de 'database is locked' levantadas dentro do app"""
+
+    def __init__(self):
+        self.locks = 0
+        self.exceptions = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, sender, exception, **extra):
+        with self._lock:
+            self.exceptions += 1
+            if isinstance(exception, sqlite3.OperationalError) and 'locked' in str(exception):
+                self.locks += 1
+
+    def snapshot(self) -> Tuple[int, int]:
+        with self._lock:
+            return self.locks, self.exceptions
+
+
+def start_server(app, host: str = '127.0.0.1'):
+    """sobe o app num servidor com threads numa porta livre"""
+    from werkzeug.serving import make_server
+
+    server = make_server(host, 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def build_request(route: str, method: str, rng: random.Random):
+    """monta (path, body, headers) pra uma rota do mix"""
+    if route == '/render/<name>':
+        char = rng.choice(TEKKEN_CHARS)
+        return f"/render/{char.lower().replace(' ', '_').replace('-', '_')}", None, {}
+
+    if method == 'POST':
+        p1_char, p2_char = rng.choice(TEKKEN_CHARS), rng.choice(TEKKEN_CHARS)
+        body = urlencode({
+            'player1': p1_char,
+            'player2': p2_char,
+            'winner': rng.choice([p1_char, p2_char]),
+        })
+        return route, body, {'Content-Type': 'application/x-www-form-urlencoded'}
+
+    return route, None, {}
+
+
+def client_worker(port: int, deadline: float, seed: int, samples: Dict, errors: Dict, lock: threading.Lock):
+    rng = random.Random(seed)
+    routes = [(route, method) for route, method, _ in TRAFFIC_MIX]
+    weights = [weight for _, _, weight in TRAFFIC_MIX]
+
+    local_samples = defaultdict(list)
+    local_errors = defaultdict(int)
+
+    while time.perf_counter() < deadline:
+        route, method = rng.choices(routes, weights=weights)[0]
+        path, body, headers = build_request(route, method, rng)
+        label = f"{method} {route}"
+
+        start = time.perf_counter()
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            conn.close()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            status = None
+        elapsed = time.perf_counter() - start
+
+        local_samples[label].append(elapsed)
+        if status is None or status >= 500:
+            local_errors[label] += 1
+
+    with lock:
+        for label, values in local_samples.items():
+            samples[label].extend(values)
+        for label, count in local_errors.items():
+            errors[label] += count
+
+
+def run_level(port: int, concurrency: int, duration: float, lock_counter: LockCounter, seed: int) -> Dict:
+    samples = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+    locks_before, exceptions_before = lock_counter.snapshot()
+
+    deadline = time.perf_counter() + duration
+    started = time.perf_counter()
+    threads = [
+        threading.Thread(target=client_worker,
+                         args=(port, deadline, seed * 1000 + i, samples, errors, lock))
+        for i in range(concurrency)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - started
+
+    locks_after, exceptions_after = lock_counter.snapshot()
+
+    routes = {}
+    total = 0
+    for label, values in sorted(samples.items()):
+        values.sort()
+        total += len(values)
+        routes[label] = {
+            'requests': len(values),
+            'rps': round(len(values) / wall, 2),
+            'p50_ms': round(percentile(values, 50) * 1000, 2),
+            'p95_ms': round(percentile(values, 95) * 1000, 2),
+            'p99_ms': round(percentile(values, 99) * 1000, 2),
+            'errors': errors.get(label, 0),
+        }
+
+    return {
+        'concurrency': concurrency,
+        'seconds': round(wall, 2),
+        'requests': total,
+        'throughput_rps': round(total / wall, 2),
+        'errors': sum(errors.values()),
+        'lock_errors': locks_after - locks_before,
+        'app_exceptions': exceptions_after - exceptions_before,
+        'routes': routes,
+    }
+
+
+def print_level(result: Dict):
+    print(f"\nConcorrência {result['concurrency']}: {result['requests']} req em {result['seconds']}s "
+          f"= {result['throughput_rps']} req/s | erros {result['errors']} | "
+          f"locks {result['lock_errors']}")
+    print(f"  {'rota':<28} {'req':>6} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'erros':>6}")
+    for label, r in result['routes'].items():
+        print(f"  {label:<28} {r['requests']:>6} {r['rps']:>8} {r['p50_ms']:>9} "
+              f"{r['p95_ms']:>9} {r['p99_ms']:>9} {r['errors']:>6}")
+
+
+def find_contention(results: List[Dict]) -> Optional[int]:
+    """
+    primeiro nível com erro de lock, ou onde o p95 da escrita piora o dobro do que
+    o p95 das leituras piorou (fila só na escrita = disputa pelo lock do SQLite)
+    """
+    baseline = None
+    for result in results:
+        if result['lock_errors'] > 0:
+            return result['concurrency']
+
+        write = result['routes'].get('POST /add')
+        read = result['routes'].get('GET /api/stats')
+        if not write or not read or not read['p95_ms']:
+            continue
+
+        ratio = write['p95_ms'] / read['p95_ms']
+        if baseline is None:
+            baseline = ratio
+        elif ratio > baseline * 2:
+            return result['concurrency']
+    return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Teste de carga local do Tekken Stats')
+    parser.add_argument('--concurrency', default='1,4,16,32', help='níveis de concorrência')
+    parser.add_argument('--duration', type=float, default=10, help='segundos por nível')
+    parser.add_argument('--db', default=DEFAULT_DB, help='banco usado no teste')
+    parser.add_argument('--seed-matches', type=int, default=10000,
+                        help='partidas geradas se o banco não existir')
+    parser.add_argument('--seed', type=int, default=generate_data.DEFAULT_SEED)
+    parser.add_argument('--json', help='salva os resultados em JSON')
+    args = parser.parse_args(argv)
+
+    database.DATABASE_PATH = args.db
+    if not os.path.exists(args.db):
+        summary = generate_data.populate(args.seed_matches, 200, args.seed)
+        print(f"Banco de teste gerado com {summary['matches']:,} partidas em {args.db}")
+
+    # importa depois de apontar o banco pra não tocar no banco real
+    import tekkenapp
+    from flask import got_request_exception
+
+    lock_counter = LockCounter()
+    got_request_exception.connect(lock_counter, tekkenapp.app, weak=False)
+
+    # o log de acesso do werkzeug por requisição distorce a medição
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+    server = start_server(tekkenapp.app)
+    print(f"App rodando em 127.0.0.1:{server.server_port}")
+
+    results = []
+    try:
+        for concurrency in [int(c) for c in args.concurrency.split(',') if c.strip()]:
+            result = run_level(server.server_port, concurrency, args.duration, lock_counter, args.seed)
+            print_level(result)
+            results.append(result)
+    finally:
+        server.shutdown()
+
+    contention = find_contention(results)
+    if contention:
+        print(f"\nContenção do SQLite começa por volta de {contention} clientes concorrentes")
+    else:
+        print("\nNenhuma contenção detectada nos níveis testados")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'db': args.db, 'duration': args.duration, 'contention_at': contention,
+                       'levels': results}, f, indent=2)
+        print(f"Resultados salvos em {args.json}")
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
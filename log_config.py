@@ -0,0 +1,160 @@
+"""
+configuração de logging sem bloqueio pro Tekken Stats Tracker
+a thread da requisição só coloca o registro numa fila (QueueHandler); quem escreve
+no disco e no console é a thread do QueueListener, então um warning nunca trava
+a requisição esperando I/O. suporta rotação por tamanho e registros em JSON
+com o método, a rota e o tempo da requisição
+"""
+
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import time
+from datetime import datetime, timezone
+
+from flask import g, has_request_context, request
+
+LOG_FILE = os.getenv('LOG_FILE', 'app.log')
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text').lower()  # text ou json
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', 0))  # 0 = sem rotação
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', 5))
+LOG_REQUESTS = os.getenv('LOG_REQUESTS', 'False').lower() == 'true'
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# campos da requisição copiados pro registro antes de entrar na fila
+REQUEST_FIELDS = ('request_method', 'request_path', 'request_elapsed_ms', 'status', 'duration_ms')
+
+_listener = None
+
+
+class RequestContextFilter(logging.Filter):
+    """anexa método, rota e tempo decorrido da requisição atual no registro"""
+
+    def filter(self, record):
+        if has_request_context():
+            record.request_method = request.method
+            record.request_path = request.path
+            started = g.get('request_started')
+            if started is not None:
+                record.request_elapsed_ms = round((time.perf_counter() - started) * 1000, 2)
+        return True
+
+
+class ExceptionQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler que manda o traceback em exc_text, separado da mensagem (o prepare()
+    padrão junta tudo no texto e apaga a exceção, o JsonFormatter não a veria)
+    """
+
+    _exception_formatter = logging.Formatter()
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.message = record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            # vira texto já na thread de quem logou: a exceção prende os frames da requisição
+            record.exc_text = record.exc_text or self._exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """um objeto JSON por linha"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for field in REQUEST_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            # já formatada no ExceptionQueueHandler
+            entry['exception'] = record.exc_text
+        if record.stack_info:
+            entry['stack'] = record.stack_info
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def _build_file_handler():
+    if LOG_MAX_BYTES > 0:
+        return logging.handlers.RotatingFileHandler(
+            LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8')
+    return logging.FileHandler(LOG_FILE, encoding='utf-8')
+
+
+def configure_logging():
+    """troca os handlers do root por QueueHandler -> QueueListener(arquivo, console)"""
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    formatter = JsonFormatter() if LOG_FORMAT == 'json' else logging.Formatter(TEXT_FORMAT)
+
+    handlers = [_build_file_handler(), logging.StreamHandler()]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = ExceptionQueueHandler(log_queue)
+    queue_handler.addFilter(RequestContextFilter())
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(LOG_LEVEL)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    # esvazia a fila antes do processo sair
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def restart_logging_listener():
+    """recria a thread do listener (threads não sobrevivem a um fork)"""
+    if _listener is not None:
+        _listener._thread = None
+        _listener.start()
+
+
+def _mark_request_start():
+    g.request_started = time.perf_counter()
+
+
+def _log_request(response):
+    started = g.get('request_started')
+    if started is not None:
+        logging.getLogger('tekken.access').info(
+            f"{request.method} {request.path} {response.status_code}",
+            extra={'status': response.status_code,
+                   'duration_ms': round((time.perf_counter() - started) * 1000, 2)})
+    return response
+
+
+def init_request_logging(app):
+    """marca o início de cada requisição e, com LOG_REQUESTS=true, loga o acesso com o tempo"""
+    app.before_request(_mark_request_start)
+    if LOG_REQUESTS:
+        app.after_request(_log_request)
@@ -0,0 +1,247 @@
+"""
+manutenção automática do banco SQLite
+roda PRAGMA optimize/ANALYZE, incremental_vacuum e checkpoint do WAL quando os
+limites são atingidos (páginas livres, tamanho do WAL, tempo desde o último
+optimize). tudo em passos pequenos com pausa entre eles e busy_timeout curto:
+se o app estiver gravando, a manutenção espera a próxima rodada em vez de travar
+
+Como usar:
+    python maintenance.py                 # roda o que os limites pedirem
+    python maintenance.py --status
+    python maintenance.py --all           # roda tudo agora
+    python maintenance.py --analyze       # ANALYZE completo
+    python maintenance.py --enable-incremental-vacuum   # converte banco antigo (VACUUM, bloqueia)
+"""
+
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from typing import Dict
+
+import database
+import leagues
+
+logger = logging.getLogger(__name__)
+
+MAINTENANCE_INTERVAL_SECONDS = int(os.getenv('MAINTENANCE_INTERVAL_SECONDS', 600))  # 0 = desligado
+MAINTENANCE_BUSY_TIMEOUT_MS = int(os.getenv('MAINTENANCE_BUSY_TIMEOUT_MS', 250))
+VACUUM_STEP_PAGES = int(os.getenv('VACUUM_STEP_PAGES', 256))
+VACUUM_PAUSE = float(os.getenv('VACUUM_PAUSE', 0.05))
+VACUUM_FREELIST_RATIO = float(os.getenv('VACUUM_FREELIST_RATIO', 0.1))
+VACUUM_MIN_PAGES = int(os.getenv('VACUUM_MIN_PAGES', 1000))
+WAL_CHECKPOINT_PAGES = int(os.getenv('WAL_CHECKPOINT_PAGES', 1000))
+OPTIMIZE_INTERVAL_SECONDS = int(os.getenv('OPTIMIZE_INTERVAL_SECONDS', 3600))
+
+# linhas que o PRAGMA optimize olha por índice (ANALYZE aproximado, bem mais barato)
+ANALYSIS_LIMIT = 400
+
+AUTO_VACUUM_MODES = {0: 'none', 1: 'full', 2: 'incremental'}
+
+
+def _connect() -> sqlite3.Connection:
+    # conexão própria, fora do pool: o busy_timeout curto não pode vazar pro app.
+    # espera pouco pelo lock: com o app ocupado é melhor pular a rodada
+    return sqlite3.connect(database.get_database_path(), timeout=MAINTENANCE_BUSY_TIMEOUT_MS / 1000)
+
+
+def database_health() -> Dict:
+    """tamanho, páginas livres, modo do journal e tamanho do WAL"""
+    conn = _connect()
+    try:
+        page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+        health = {
+            'page_size': page_size,
+            'page_count': conn.execute('PRAGMA page_count').fetchone()[0],
+            'freelist_count': conn.execute('PRAGMA freelist_count').fetchone()[0],
+            'auto_vacuum': AUTO_VACUUM_MODES.get(conn.execute('PRAGMA auto_vacuum').fetchone()[0]),
+            'journal_mode': conn.execute('PRAGMA journal_mode').fetchone()[0],
+        }
+    finally:
+        conn.close()
+
+    wal_path = database.get_database_path() + '-wal'
+    health['wal_pages'] = os.path.getsize(wal_path) // page_size if os.path.exists(wal_path) else 0
+    return health
+
+
+def optimize(full: bool = False):
+    """atualiza as estatísticas do planner: PRAGMA optimize (limitado) ou ANALYZE completo"""
+    conn = _connect()
+    try:
+        if full:
+            conn.execute('ANALYZE')
+        else:
+            conn.execute(f'PRAGMA analysis_limit = {ANALYSIS_LIMIT}')
+            conn.execute('PRAGMA optimize')
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def incremental_vacuum(max_pages: int = None, step_pages: int = VACUUM_STEP_PAGES,
+                       pause: float = VACUUM_PAUSE) -> int:
+    """devolve páginas livres pro disco em passos de step_pages, com pausa entre eles"""
+    conn = _connect()
+    freed = 0
+    try:
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+            logger.info('incremental_vacuum ignorado: banco sem auto_vacuum=INCREMENTAL')
+            return 0
+
+        free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        while free and (max_pages is None or freed < max_pages):
+            step = step_pages if max_pages is None else min(step_pages, max_pages - freed)
+            # cada passo é uma transação curta. o execute() do sqlite3 dá um step só no pragma
+            # (libera 1 página); o executescript roda ele até o fim
+            conn.executescript(f'PRAGMA incremental_vacuum({step})')
+            remaining = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            if remaining >= free:
+                break
+            freed += free - remaining
+            free = remaining
+            if pause > 0:
+                time.sleep(pause)
+    finally:
+        conn.close()
+
+    return freed
+
+
+def checkpoint(mode: str = 'PASSIVE') -> Dict:
+    """checkpoint do WAL; PASSIVE não espera leitores nem escritores"""
+    if mode.upper() not in ('PASSIVE', 'FULL', 'RESTART', 'TRUNCATE'):
+        raise ValueError(f"modo de checkpoint inválido: {mode}")
+
+    conn = _connect()
+    try:
+        busy, log_pages, checkpointed = conn.execute(f'PRAGMA wal_checkpoint({mode.upper()})').fetchone()
+    finally:
+        conn.close()
+
+    return {'busy': bool(busy), 'wal_pages': log_pages, 'checkpointed': checkpointed}
+
+
+def enable_incremental_vacuum():
+    """liga auto_vacuum=INCREMENTAL num banco antigo (precisa de um VACUUM completo, que bloqueia)"""
+    conn = sqlite3.connect(database.get_database_path())
+    try:
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('VACUUM')
+    finally:
+        conn.close()
+
+
+class MaintenanceScheduler:
+    """thread que confere os limites de cada liga a cada `interval` segundos e roda só o que for preciso"""
+
+    def __init__(self, interval: int = MAINTENANCE_INTERVAL_SECONDS):
+        self.interval = interval
+        # {banco: último optimize}; o primeiro só depois de um intervalo, como no start
+        self.last_optimize = {}
+        self.last_report = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run_once(self, force: bool = False) -> Dict:
+        """roda no banco de cada liga (leagues.py); devolve {liga: relatório} das que fizeram algo"""
+        reports = {}
+        # a thread não tem a liga da requisição (ContextVar): passa por todas explicitamente
+        for key in leagues.list_leagues():
+            path = leagues.league_path(key)
+            if not os.path.exists(path):
+                continue
+            with database.use_database(path):
+                report = self.run_database(force)
+            if report:
+                reports[key] = report
+        self.last_report = reports
+        return reports
+
+    def run_database(self, force: bool = False) -> Dict:
+        """roda o que os limites pedirem no banco em uso (database.get_database_path())"""
+        path = database.get_database_path()
+        last_optimize = self.last_optimize.setdefault(path, time.monotonic())
+        report = {}
+        try:
+            health = database_health()
+
+            if force or health['wal_pages'] >= WAL_CHECKPOINT_PAGES:
+                report['checkpoint'] = checkpoint()
+
+            free = health['freelist_count']
+            if health['auto_vacuum'] == 'incremental' and free and (
+                    force or free >= VACUUM_MIN_PAGES
+                    or free >= health['page_count'] * VACUUM_FREELIST_RATIO):
+                report['vacuumed_pages'] = incremental_vacuum()
+
+            if force or time.monotonic() - last_optimize >= OPTIMIZE_INTERVAL_SECONDS:
+                optimize()
+                self.last_optimize[path] = time.monotonic()
+                report['optimized'] = True
+        except sqlite3.OperationalError as e:
+            # banco ocupado: tenta de novo na próxima rodada
+            logger.info(f"Maintenance skipped: {e}")
+            report['skipped'] = str(e)
+
+        if report:
+            logger.info(f"Maintenance of {path}: {report}")
+        return report
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self.run_once()
+
+    def start(self):
+        if self.interval <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='db-maintenance', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+
+scheduler = MaintenanceScheduler()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Manutenção do banco do Tekken Stats')
+    parser.add_argument('--db', default=database.DATABASE_PATH, help='arquivo do banco')
+    parser.add_argument('--status', action='store_true', help='só mostra o estado do banco')
+    parser.add_argument('--all', action='store_true', help='roda tudo, ignorando os limites')
+    parser.add_argument('--analyze', action='store_true', help='ANALYZE completo')
+    parser.add_argument('--vacuum', action='store_true', help='incremental_vacuum até zerar as páginas livres')
+    parser.add_argument('--checkpoint', choices=['PASSIVE', 'FULL', 'RESTART', 'TRUNCATE'],
+                        help='checkpoint do WAL no modo escolhido')
+    parser.add_argument('--enable-incremental-vacuum', action='store_true',
+                        help='converte o banco pra auto_vacuum=INCREMENTAL (roda VACUUM)')
+    args = parser.parse_args(argv)
+
+    database.DATABASE_PATH = args.db
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.enable_incremental_vacuum:
+        enable_incremental_vacuum()
+    if args.analyze:
+        optimize(full=True)
+    if args.vacuum:
+        print(f"{incremental_vacuum():,} páginas liberadas")
+    if args.checkpoint:
+        print(checkpoint(args.checkpoint))
+    if not (args.status or args.enable_incremental_vacuum or args.analyze or args.vacuum or args.checkpoint):
+        MaintenanceScheduler().run_database(force=args.all)
+
+    print(json.dumps(database_health(), indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,56 @@
+"""
+exportação do histórico de partidas em CSV e NDJSON
+os geradores consomem database.iter_matches e vão soltando pedaços de texto,
+então a resposta sai em streaming e a memória não cresce com o tamanho da tabela
+"""
+
+import csv
+import io
+import json
+from typing import Dict, Iterable, Iterator
+
+EXPORT_COLUMNS = ['id', 'timestamp', 'player1', 'player2', 'winner',
+                  'player1_char', 'player2_char', 'winner_char',
+                  'player1_id', 'player2_id', 'winner_id']
+
+# quantas linhas juntar antes de mandar um pedaço pro cliente
+CHUNK_ROWS = 500
+
+
+def iter_csv(matches: Iterable[Dict], chunk_rows: int = CHUNK_ROWS) -> Iterator[str]:
+    """gera o CSV (com cabeçalho) em pedaços de chunk_rows linhas"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+
+    pending = 0
+    for match in matches:
+        writer.writerow([match.get(column, '') for column in EXPORT_COLUMNS])
+        pending += 1
+        if pending >= chunk_rows:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+            pending = 0
+
+    yield buffer.getvalue()
+
+
+def iter_ndjson(matches: Iterable[Dict], chunk_rows: int = CHUNK_ROWS) -> Iterator[str]:
+    """gera um objeto JSON por linha, em pedaços de chunk_rows linhas"""
+    lines = []
+    for match in matches:
+        lines.append(json.dumps({column: match.get(column) for column in EXPORT_COLUMNS},
+                                ensure_ascii=False))
+        if len(lines) >= chunk_rows:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+EXPORT_FORMATS = {
+    'csv': (iter_csv, 'text/csv'),
+    'ndjson': (iter_ndjson, 'application/x-ndjson'),
+}
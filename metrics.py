@@ -0,0 +1,236 @@
+"""
+métricas de requisição, SQL e cálculos de estatísticas no formato texto do Prometheus
+liga com METRICS_ENABLED=true; desligado nenhum hook é registrado e os
+decorators devolvem as funções originais, então o custo é zero
+"""
+
+import os
+import threading
+import time
+from functools import wraps
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from flask import Response, abort, g, has_request_context, request
+
+import database
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'False').lower() == 'true'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250)
+
+
+def _escape_label(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple, extra: str = '') -> str:
+    parts = [f'{name}="{_escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    """contador monotônico com labels"""
+
+    type_name = 'counter'
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *label_values):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        for label_values, value in items:
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}"
+
+
+class Histogram:
+    """histograma com buckets cumulativos no estilo do Prometheus"""
+
+    type_name = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = tuple(buckets) + (float('inf'),)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            items = sorted((k, ([*v[0]], v[1], v[2])) for k, v in self._series.items())
+        for label_values, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labels, label_values, le)} {cumulative}"
+            labels = _format_labels(self.labels, label_values)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {count}"
+
+
+REQUEST_LATENCY = Histogram(
+    'tekken_http_request_duration_seconds', 'Latência das requisições por rota',
+    ('route', 'method'))
+REQUEST_COUNT = Counter(
+    'tekken_http_requests_total', 'Requisições atendidas por rota e status',
+    ('route', 'method', 'status'))
+REQUEST_SQL_QUERIES = Histogram(
+    'tekken_request_sql_queries', 'Quantidade de queries SQL por requisição',
+    ('route',), QUERY_COUNT_BUCKETS)
+REQUEST_SQL_SECONDS = Histogram(
+    'tekken_request_sql_duration_seconds', 'Tempo gasto em SQL por requisição',
+    ('route',))
+SQL_QUERIES = Counter('tekken_sql_queries_total', 'Statements SQL executados')
+SQL_SECONDS = Counter('tekken_sql_duration_seconds_total', 'Tempo total em SQL (execute + fetch)')
+STATS_SECONDS = Histogram(
+    'tekken_stats_compute_duration_seconds', 'Tempo dos cálculos de estatísticas',
+    ('function',))
+
+_metrics = [REQUEST_LATENCY, REQUEST_COUNT, REQUEST_SQL_QUERIES, REQUEST_SQL_SECONDS,
+            SQL_QUERIES, SQL_SECONDS, STATS_SECONDS]
+
+# coletores extras avaliados na hora de renderizar /metrics
+# cada um devolve [(nome, tipo, help, valor)]
+_collectors: List[Callable[[], List[Tuple[str, str, str, float]]]] = []
+
+
+def register_collector(collector: Callable[[], List[Tuple[str, str, str, float]]]):
+    _collectors.append(collector)
+
+
+def timed_stats(func):
+    """decorator que mede o tempo de um cálculo de estatística (no-op se desligado)"""
+    if not METRICS_ENABLED:
+        return func
+
+    name = func.__name__
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            STATS_SECONDS.observe(time.perf_counter() - start, name)
+
+    return wrapper
+
+
+def _observe_statement(sql, params, elapsed, phase, conn):
+    if phase == 'execute':
+        SQL_QUERIES.inc()
+    SQL_SECONDS.inc(elapsed)
+
+    if has_request_context() and 'metrics_sql_seconds' in g:
+        if phase == 'execute':
+            g.metrics_sql_queries += 1
+        g.metrics_sql_seconds += elapsed
+
+
+def _route_label() -> str:
+    # usa o padrão da rota pra não explodir a cardinalidade com IDs na URL
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+
+def _before_request():
+    g.metrics_start = time.perf_counter()
+    g.metrics_sql_queries = 0
+    g.metrics_sql_seconds = 0.0
+
+
+def _after_request(response):
+    start = g.pop('metrics_start', None)
+    if start is None:
+        return response
+
+    route = _route_label()
+    REQUEST_LATENCY.observe(time.perf_counter() - start, route, request.method)
+    REQUEST_COUNT.inc(1, route, request.method, response.status_code)
+    REQUEST_SQL_QUERIES.observe(g.pop('metrics_sql_queries', 0), route)
+    REQUEST_SQL_SECONDS.observe(g.pop('metrics_sql_seconds', 0.0), route)
+    return response
+
+
+def render_metrics() -> str:
+    """gera o texto de exposição do Prometheus"""
+    lines = []
+    for metric in _metrics:
+        lines.append(f"# HELP {metric.name} {metric.help_text}")
+        lines.append(f"# TYPE {metric.name} {metric.type_name}")
+        lines.extend(metric.samples())
+
+    for collector in _collectors:
+        for name, type_name, help_text, value in collector():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {type_name}")
+            lines.append(f"{name} {_format_value(value)}")
+
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_endpoint():
+    if not METRICS_ENABLED:
+        abort(404)
+    return Response(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def init_metrics(app):
+    """registra os hooks de instrumentação e a rota /metrics"""
+    app.add_url_rule('/metrics', 'metrics', metrics_endpoint)
+
+    if not METRICS_ENABLED:
+        return
+
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    database.add_statement_observer(_observe_statement)
+
+
+def cache_collector(prefix: str, stats_func: Callable[[], Dict]) -> Callable:
+    """adapta um stats() de cache (hits/misses/...) pra um coletor de métricas"""
+    def collect():
+        stats = stats_func()
+        samples = []
+        for key in ('hits', 'misses', 'evictions'):
+            if key in stats:
+                samples.append((f"{prefix}_{key}_total", 'counter', f"{prefix} {key}", stats[key]))
+        for key in ('entries', 'bytes'):
+            if key in stats:
+                samples.append((f"{prefix}_{key}", 'gauge', f"{prefix} {key}", stats[key]))
+        return samples
+    return collect
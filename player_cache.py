@@ -0,0 +1,166 @@
+"""
+cache em memória dos jogadores, com índice por ID
+os jogadores quase não mudam e são lidos em toda página; o database.py grava
+no banco e atualiza o cache na mesma hora (write-through), então as buscas
+por ID não precisam abrir conexão. um cache por arquivo de banco
+(DATABASE_PATH pode mudar em tempo de execução: benchmark, ligas)
+
+a lista completa (e a resposta "esse jogador não existe") só vale enquanto o
+data_version do banco for o mesmo de quando ela foi carregada: um jogador
+gravado por outro processo (outro worker, python database.py --import) aparece
+na hora. alterações em jogadores que já estão no cache feitas por outro
+processo só aparecem depois de PLAYER_CACHE_TTL segundos
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+PLAYER_CACHE_SIZE = int(os.getenv('PLAYER_CACHE_SIZE', 10000))  # 0 desliga
+PLAYER_CACHE_TTL = float(os.getenv('PLAYER_CACHE_TTL', 60))  # 0 = sem expiração
+
+PLAYER_FIELDS = ('id', 'name', 'main_char', 'rank', 'region')
+
+# devolvido pelo get() quando o cache não sabe a resposta (None = jogador não existe)
+MISS = object()
+
+
+class PlayerCache:
+    """LRU de jogadores por ID; quando cabe a tabela inteira também serve a lista completa"""
+
+    def __init__(self, max_entries: int = PLAYER_CACHE_SIZE, ttl: float = PLAYER_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._players = OrderedDict()
+        # True quando o cache tem todos os jogadores do banco (ausência = não existe)
+        self._complete = False
+        # data_version do banco quando a lista completa foi carregada
+        self._complete_version = None
+        self._sorted = None
+        self._filled_at = time.monotonic()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _expire(self):
+        if self.ttl and time.monotonic() - self._filled_at > self.ttl:
+            self._players.clear()
+            self._complete = False
+            self._sorted = None
+            self._filled_at = time.monotonic()
+
+    def _is_complete(self, version) -> bool:
+        # outra conexão gravou desde o fill (data_version mudou): pode ter jogador novo
+        return self._complete and version == self._complete_version
+
+    def get(self, player_id: str, version=None):
+        """jogador (cópia), None se sabidamente não existe, ou MISS; version = data_version atual"""
+        with self._lock:
+            self._expire()
+            player = self._players.get(player_id)
+            if player is not None:
+                self._players.move_to_end(player_id)
+                self.hits += 1
+                return dict(player)
+            if self._is_complete(version):
+                self.hits += 1
+                return None
+            self.misses += 1
+            return MISS
+
+    def all_players(self, version=None) -> Optional[List[Dict]]:
+        """todos os jogadores ordenados por nome, ou None se o cache não tem a tabela inteira"""
+        with self._lock:
+            self._expire()
+            if not self._is_complete(version):
+                self.misses += 1
+                return None
+            if self._sorted is None:
+                self._sorted = sorted(self._players.values(), key=lambda p: p['name'])
+            self.hits += 1
+            return [dict(player) for player in self._sorted]
+
+    def fill(self, players: List[Dict], version=None):
+        """guarda a tabela inteira (se couber), lida com o banco no data_version `version`"""
+        if len(players) > self.max_entries:
+            return
+        with self._lock:
+            self._players = OrderedDict((p['id'], {field: p.get(field) for field in PLAYER_FIELDS})
+                                        for p in players)
+            self._complete = True
+            self._complete_version = version
+            self._sorted = None
+            self._filled_at = time.monotonic()
+
+    def put(self, player: Dict):
+        """grava ou atualiza um jogador (chamado depois do commit no banco)"""
+        with self._lock:
+            self._players[player['id']] = {field: player.get(field) for field in PLAYER_FIELDS}
+            self._players.move_to_end(player['id'])
+            self._sorted = None
+            while len(self._players) > self.max_entries:
+                self._players.popitem(last=False)
+                self.evictions += 1
+                # saiu alguém: a lista deixa de ser completa
+                self._complete = False
+
+    def discard(self, player_id: str):
+        with self._lock:
+            self._players.pop(player_id, None)
+            self._sorted = None
+
+    def clear(self):
+        with self._lock:
+            self._players.clear()
+            self._complete = False
+            self._sorted = None
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'entries': len(self._players),
+                'max_entries': self.max_entries,
+                'complete': self._complete,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+class PlayerCaches:
+    """um PlayerCache por arquivo de banco"""
+
+    def __init__(self, max_entries: int = PLAYER_CACHE_SIZE, ttl: float = PLAYER_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._caches = {}
+        self._lock = threading.Lock()
+
+    def get(self, path: str) -> Optional[PlayerCache]:
+        """cache do banco em `path`, ou None com o cache desligado"""
+        if self.max_entries <= 0:
+            return None
+        cache = self._caches.get(path)
+        if cache is None:
+            with self._lock:
+                cache = self._caches.setdefault(path, PlayerCache(self.max_entries, self.ttl))
+        return cache
+
+    def clear(self):
+        with self._lock:
+            for cache in self._caches.values():
+                cache.clear()
+
+    def stats(self) -> Dict:
+        totals = {'entries': 0, 'hits': 0, 'misses': 0, 'evictions': 0}
+        for cache in list(self._caches.values()):
+            stats = cache.stats()
+            for key in totals:
+                totals[key] += stats[key]
+        return totals
+
+
+player_caches = PlayerCaches()
@@ -0,0 +1,302 @@
+"""
+profiling de queries SQLite com log de queries lentas e EXPLAIN QUERY PLAN
+
+modo opt-in (QUERY_PROFILE=true): cada conexão ganha um trace callback, que marca
+o início de cada statement que o SQLite roda, e um progress handler, que conta as
+instruções da VM gastas nele; o tempo de execute/fetch vem dos statement observers
+do database.py. statements acima de SLOW_QUERY_MS entram no log de lentas junto
+com o plano, e tudo é agregado pelo SQL normalizado
+
+Como usar:
+    python query_profiler.py                 # roda as consultas do database.py e mostra o relatório
+    python query_profiler.py --threshold 5   # limite de query lenta em ms
+    python query_profiler.py --json          # relatório em JSON
+"""
+
+import argparse
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+import database
+
+logger = logging.getLogger(__name__)
+
+QUERY_PROFILE = os.getenv('QUERY_PROFILE', 'False').lower() == 'true'
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', 50))
+PROGRESS_OPS = int(os.getenv('QUERY_PROFILE_PROGRESS_OPS', 1000))
+SLOW_LOG_SIZE = 200
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN\s*\((?:\s*\?\s*,)*\s*\?\s*\)', re.IGNORECASE)
+_WHITESPACE = re.compile(r'\s+')
+
+# statements que não tem plano útil
+_NO_PLAN_PREFIXES = ('PRAGMA', 'BEGIN', 'COMMIT', 'ROLLBACK', 'CREATE', 'DROP', 'ALTER',
+                     'ATTACH', 'DETACH', 'VACUUM', 'ANALYZE', 'EXPLAIN', 'SAVEPOINT', 'RELEASE')
+
+
+def normalize_sql(sql: str) -> str:
+    """troca literais por ? e colapsa espaços pra agrupar queries iguais"""
+    sql = _STRING_LITERAL.sub('?', sql)
+    sql = _NUMBER_LITERAL.sub('?', sql)
+    sql = _WHITESPACE.sub(' ', sql).strip()
+    return _IN_LIST.sub('IN (...)', sql)
+
+
+def explain_query_plan(sql: str, params, conn: Optional[sqlite3.Connection] = None) -> Optional[List[str]]:
+    """
+    roda EXPLAIN QUERY PLAN e devolve as linhas do plano indentadas; na conexão que
+    rodou a query (`conn`, que tem os archiveN.matches anexados) ou numa separada
+    """
+    if params is None or sql.lstrip().upper().startswith(_NO_PLAN_PREFIXES):
+        return None
+
+    try:
+        if conn is not None:
+            # cursor comum: o EXPLAIN não passa pelos observers nem entra nas estatísticas
+            rows = conn.cursor(sqlite3.Cursor).execute('EXPLAIN QUERY PLAN ' + sql, params).fetchall()
+        else:
+            own = sqlite3.connect(database.get_database_path())
+            try:
+                rows = own.execute('EXPLAIN QUERY PLAN ' + sql, params).fetchall()
+            finally:
+                own.close()
+    except sqlite3.Error as e:
+        return [f"<plano indisponível: {e}>"]
+
+    # cada linha é (id, parent, notused, detail); indenta pela profundidade
+    depth = {0: -1}
+    plan = []
+    for node_id, parent, _, detail in rows:
+        depth[node_id] = depth.get(parent, -1) + 1
+        plan.append('  ' * depth[node_id] + detail)
+    return plan
+
+
+def has_full_scan(plan: Optional[List[str]]) -> bool:
+    """SCAN sem índice = tabela lida inteira"""
+    if not plan:
+        return False
+    return any(line.strip().startswith('SCAN') and 'INDEX' not in line for line in plan)
+
+
+class QueryProfiler:
+    """agrega tempos por SQL normalizado e guarda as execuções lentas"""
+
+    def __init__(self, threshold_ms: float = SLOW_QUERY_MS, progress_ops: int = PROGRESS_OPS):
+        self.threshold_ms = threshold_ms
+        self.progress_ops = progress_ops
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._plans = {}
+        self._traced = {}
+        self.slow_log = deque(maxlen=SLOW_LOG_SIZE)
+        self.enabled = False
+
+    # ---- callbacks do sqlite3 ----
+
+    def _on_trace(self, statement: str):
+        # chamado pelo SQLite no início de cada statement, inclusive BEGIN/COMMIT implícitos
+        if getattr(self._local, 'explaining', False):
+            # o EXPLAIN do próprio profiler
+            return
+        self._local.vm_steps = 0
+        key = normalize_sql(statement)
+        with self._lock:
+            self._traced[key] = self._traced.get(key, 0) + 1
+
+    def _on_progress(self) -> int:
+        self._local.vm_steps = getattr(self._local, 'vm_steps', 0) + self.progress_ops
+        return 0  # 0 = continua a execução
+
+    def _install(self, conn):
+        conn.set_trace_callback(self._on_trace)
+        conn.set_progress_handler(self._on_progress, self.progress_ops)
+
+    def _observe(self, sql, params, elapsed, phase, conn):
+        elapsed_ms = elapsed * 1000
+        key = normalize_sql(sql)
+        vm_steps = getattr(self._local, 'vm_steps', 0)
+
+        with self._lock:
+            entry = self._stats.get(key)
+            if entry is None:
+                entry = self._stats[key] = {
+                    'sql': key,
+                    'calls': 0,
+                    'total_ms': 0.0,
+                    'max_ms': 0.0,
+                    'slow_count': 0,
+                    'max_vm_steps': 0,
+                }
+            if phase == 'execute':
+                entry['calls'] += 1
+            entry['total_ms'] += elapsed_ms
+            entry['max_ms'] = max(entry['max_ms'], elapsed_ms)
+            entry['max_vm_steps'] = max(entry['max_vm_steps'], vm_steps)
+
+        if elapsed_ms < self.threshold_ms:
+            return
+
+        plan = self._plan_for(key, sql, params, conn)
+        with self._lock:
+            entry['slow_count'] += 1
+        self.slow_log.append({
+            'sql': key,
+            'params': repr(params)[:200],
+            'phase': phase,
+            'elapsed_ms': round(elapsed_ms, 3),
+            'vm_steps': vm_steps,
+            'at': time.time(),
+            'plan': plan,
+        })
+        logger.warning(f"Slow query ({elapsed_ms:.1f} ms, {phase}): {key}")
+
+    def _plan_for(self, key, sql, params, conn):
+        # o plano depende só do SQL, então basta capturar uma vez por query
+        with self._lock:
+            if key in self._plans:
+                return self._plans[key]
+        self._local.explaining = True
+        try:
+            plan = explain_query_plan(sql, params, conn)
+        finally:
+            self._local.explaining = False
+        with self._lock:
+            self._plans[key] = plan
+        return plan
+
+    # ---- controle ----
+
+    def enable(self):
+        if self.enabled:
+            return
+        database.add_connection_hook(self._install)
+        database.add_statement_observer(self._observe)
+        self.enabled = True
+
+    def disable(self):
+        database.remove_connection_hook(self._install)
+        database.remove_statement_observer(self._observe)
+        self.enabled = False
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self._plans.clear()
+            self._traced.clear()
+            self.slow_log.clear()
+
+    def report(self) -> Dict:
+        """relatório agregado, ordenado pelo tempo total"""
+        with self._lock:
+            queries = []
+            for key, entry in self._stats.items():
+                item = dict(entry)
+                item['total_ms'] = round(item['total_ms'], 3)
+                item['max_ms'] = round(item['max_ms'], 3)
+                item['avg_ms'] = round(item['total_ms'] / item['calls'], 3) if item['calls'] else 0.0
+                item['plan'] = self._plans.get(key)
+                item['full_scan'] = has_full_scan(item['plan'])
+                queries.append(item)
+            traced = sorted(self._traced.items(), key=lambda x: x[1], reverse=True)
+
+        queries.sort(key=lambda x: x['total_ms'], reverse=True)
+        return {
+            'threshold_ms': self.threshold_ms,
+            'queries': queries,
+            'slow': list(self.slow_log),
+            'traced_statements': [{'sql': sql, 'count': count} for sql, count in traced],
+        }
+
+
+profiler = QueryProfiler()
+
+
+def debug_queries_endpoint():
+    """rota de debug com o relatório (só existe com QUERY_PROFILE ligado)"""
+    from flask import jsonify, request
+
+    if request.args.get('reset') == '1':
+        profiler.reset()
+    return jsonify(profiler.report())
+
+
+def init_query_profiler(app):
+    """liga o profiling e a rota /debug/queries quando QUERY_PROFILE=true"""
+    if not QUERY_PROFILE:
+        return
+    profiler.enable()
+    app.add_url_rule('/debug/queries', 'debug_queries', debug_queries_endpoint)
+
+
+def format_report(report: Dict) -> str:
+    """relatório em texto pro terminal"""
+    lines = [f"Limite de query lenta: {report['threshold_ms']} ms", '']
+    for item in report['queries']:
+        flag = '  [FULL SCAN]' if item['full_scan'] else ''
+        lines.append(f"{item['total_ms']:>10.2f} ms total | {item['calls']:>6} chamadas | "
+                     f"avg {item['avg_ms']:.2f} ms | max {item['max_ms']:.2f} ms | "
+                     f"lentas {item['slow_count']}{flag}")
+        lines.append(f"    {item['sql']}")
+        for plan_line in item['plan'] or []:
+            lines.append(f"      {plan_line}")
+        lines.append('')
+    return '\n'.join(lines)
+
+
+def run_workload():
+    """roda as consultas de leitura do database.py pra coletar os tempos"""
+    database.get_all_matches()
+    database.get_all_players()
+
+    stats = database.get_character_stats()
+    database.get_character_counters([char for char, _, _ in stats[:5]])
+
+    # confrontos entre os personagens mais jogados
+    top_chars = [char for char, _, _ in sorted(stats, key=lambda x: x[1], reverse=True)[:4]]
+    for i, char1 in enumerate(top_chars):
+        for char2 in top_chars[i + 1:]:
+            database.get_matchup_stats(char1, char2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Profiling das queries do Tekken Stats')
+    parser.add_argument('--threshold', type=float, default=SLOW_QUERY_MS,
+                        help='limite de query lenta em ms')
+    parser.add_argument('--db', default=database.DATABASE_PATH, help='arquivo do banco')
+    parser.add_argument('--json', action='store_true', help='imprime o relatório em JSON')
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.db):
+        print(f"ERRO: banco não encontrado em {args.db}")
+        return 1
+
+    database.DATABASE_PATH = args.db
+    profiler.threshold_ms = args.threshold
+    profiler.enable()
+    try:
+        run_workload()
+    finally:
+        profiler.disable()
+
+    report = profiler.report()
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(format_report(report))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,279 @@
+"""
+relatórios pesados pré-calculados em segundo plano
+as páginas de confrontos, ranking de jogadores e estatísticas de personagem
+recalculavam tudo dentro da requisição, e o primeiro visitante depois de uma
+partida nova pagava a conta inteira. aqui cada relatório registrado vira um
+snapshot, recalculado por uma thread quando o banco muda (com debounce, pra
+uma rajada de partidas gerar um recálculo só) ou a cada intervalo; as rotas
+servem o último snapshot pronto e mostram a idade dele
+
+um conjunto de snapshots por arquivo de banco (cada liga tem o seu)
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+import database
+
+logger = logging.getLogger(__name__)
+
+REPORTS_INTERVAL_SECONDS = int(os.getenv('REPORTS_INTERVAL_SECONDS', 300))  # 0 = só quando o banco muda
+REPORTS_DEBOUNCE_SECONDS = float(os.getenv('REPORTS_DEBOUNCE_SECONDS', 2))
+# com gravações sem parar o debounce nunca fecharia; recalcula no máximo com esse atraso
+REPORTS_MAX_DELAY_SECONDS = float(os.getenv('REPORTS_MAX_DELAY_SECONDS', 30))
+REPORTS_POLL_SECONDS = float(os.getenv('REPORTS_POLL_SECONDS', 1))
+# bancos sem nenhum acesso há esse tempo saem da lista (ligas que ninguém abre)
+REPORTS_IDLE_SECONDS = int(os.getenv('REPORTS_IDLE_SECONDS', 3600))
+
+
+class Snapshot:
+    """
+    resultado de um relatório num momento, com a versão dos dados usada e o seq
+    da fila match_events na hora (o stream da página continua dali)
+    """
+
+    __slots__ = ('name', 'value', 'data_version', 'event_seq', 'built_at', 'seconds', '_derived')
+
+    def __init__(self, name: str, value, data_version: int, seconds: float, event_seq: int = 0):
+        self.name = name
+        self.value = value
+        self.data_version = data_version
+        self.event_seq = event_seq
+        self.built_at = time.time()
+        self.seconds = seconds
+        self._derived = {}
+
+    def derive(self, key: str, func: Callable):
+        """
+        func(value) calculado uma vez e guardado junto com este snapshot (índices,
+        ordenações); o próximo recálculo cria um snapshot novo, sem nada guardado
+        """
+        try:
+            return self._derived[key]
+        except KeyError:
+            # duas requisições podem calcular juntas; o resultado é o mesmo
+            result = self._derived[key] = func(self.value)
+            return result
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.built_at
+
+    @property
+    def key(self) -> str:
+        # muda a cada recálculo; entra na chave do cache de fragmentos
+        return f"{self.name}@{self.built_at:.6f}"
+
+
+def format_age(seconds: float) -> str:
+    """idade curta pra mostrar na página ('just now', '42s ago', '5 min ago', '2 h ago')"""
+    if seconds < 1:
+        return 'just now'
+    if seconds < 60:
+        return f"{int(seconds)}s ago"
+    if seconds < 3600:
+        return f"{int(seconds // 60)} min ago"
+    return f"{int(seconds // 3600)} h ago"
+
+
+class _DatabaseReports:
+    """snapshots e estado do debounce de um arquivo de banco"""
+
+    def __init__(self):
+        self.snapshots = {}
+        self.built_version = None
+        self.built_at = 0.0
+        self.seen_version = None
+        self.changed_at = None      # última mudança vista (debounce)
+        self.pending_since = None   # primeira mudança ainda não recalculada (atraso máximo)
+        self.accessed_at = time.monotonic()
+        self.lock = threading.Lock()
+
+
+class ReportScheduler:
+    """thread que mantém os snapshots dos relatórios registrados em dia"""
+
+    def __init__(self, interval: int = REPORTS_INTERVAL_SECONDS, debounce: float = REPORTS_DEBOUNCE_SECONDS,
+                 max_delay: float = REPORTS_MAX_DELAY_SECONDS, poll: float = REPORTS_POLL_SECONDS):
+        self.interval = interval
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.poll = poll
+        self.reports = {}
+        self._databases = {}
+        self._databases_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self.rebuilds = 0
+
+    def register(self, name: str, func: Optional[Callable] = None):
+        """registra um relatório: func() calcula o valor no banco em uso (também serve de decorator)"""
+        if func is None:
+            return lambda f: self.register(name, f)
+        self.reports[name] = func
+        return func
+
+    def _state(self, path: str) -> _DatabaseReports:
+        state = self._databases.get(path)
+        if state is None:
+            with self._databases_lock:
+                state = self._databases.setdefault(path, _DatabaseReports())
+        return state
+
+    def _build(self, state: _DatabaseReports, names=None):
+        """
+        recalcula os relatórios no banco em uso: todos (thread, erro só vai pro log)
+        ou só `names` (requisição sem snapshot, erro sobe pra requisição)
+        """
+        with state.lock:
+            version = database.get_data_version()
+            # lido antes de calcular: evento gravado no meio volta no replay do stream
+            event_seq = database.get_last_event_seq()
+            if names and all(name in state.snapshots and state.snapshots[name].data_version == version
+                             for name in names):
+                # outra requisição calculou enquanto a gente esperava o lock
+                return
+            for name in names or list(self.reports):
+                started = time.perf_counter()
+                try:
+                    value = self.reports[name]()
+                except Exception:
+                    if names:
+                        raise
+                    # mantém o snapshot anterior; tenta de novo na próxima mudança
+                    logger.exception(f"Report {name} failed")
+                    continue
+                state.snapshots[name] = Snapshot(name, value, version, time.perf_counter() - started,
+                                                 event_seq)
+            if not names:
+                state.built_version = version
+                state.built_at = time.monotonic()
+                state.pending_since = None
+            self.rebuilds += 1
+
+    def get(self, name: str) -> Snapshot:
+        """
+        último snapshot do relatório no banco em uso; sem nenhum ainda (app acabou
+        de subir, liga nova) calcula na hora. desatualizado, serve mesmo assim e
+        deixa a thread recalcular
+        """
+        state = self._state(database.get_database_path())
+        state.accessed_at = time.monotonic()
+
+        snapshot = state.snapshots.get(name)
+        if snapshot is None or (
+                # sem a thread (testes, scripts) recalcula na requisição quando o banco mudou
+                (self._thread is None or not self._thread.is_alive())
+                and snapshot.data_version != database.get_data_version()):
+            self._build(state, [name])
+            snapshot = state.snapshots[name]
+        return snapshot
+
+    def get_all(self, *names: str) -> List[Snapshot]:
+        """
+        get() de vários relatórios, todos da mesma versão dos dados (quem junta
+        relatórios numa resposta não mistura dois recálculos)
+        """
+        snapshots = [self.get(name) for name in names]
+        if len({snapshot.data_version for snapshot in snapshots}) > 1:
+            # um deles foi recalculado sozinho no meio: recalcula todos juntos
+            state = self._state(database.get_database_path())
+            self._build(state, list(names))
+            with state.lock:
+                snapshots = [state.snapshots[name] for name in names]
+        return snapshots
+
+    def notify(self):
+        """avisa que o banco em uso mudou (a thread também percebe sozinha pelo data_version)"""
+        state = self._state(database.get_database_path())
+        now = time.monotonic()
+        state.changed_at = now
+        if state.pending_since is None:
+            state.pending_since = now
+        self._wake.set()
+
+    def run_once(self, path: str, now: Optional[float] = None):
+        """confere um banco e recalcula se o debounce, o atraso máximo ou o intervalo pedirem"""
+        now = time.monotonic() if now is None else now
+        state = self._state(path)
+        with database.use_database(path):
+            version = database.get_data_version()
+            if version != state.seen_version:
+                state.seen_version = version
+                if version != state.built_version:
+                    state.changed_at = now
+                    if state.pending_since is None:
+                        state.pending_since = now
+
+            due = False
+            if state.pending_since is not None:
+                due = (now - state.changed_at >= self.debounce
+                       or now - state.pending_since >= self.max_delay)
+            if self.interval > 0 and now - state.built_at >= self.interval:
+                due = True
+            if due:
+                self._build(state)
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.poll)
+            self._wake.clear()
+            now = time.monotonic()
+            with self._databases_lock:
+                paths = list(self._databases.items())
+            for path, state in paths:
+                if REPORTS_IDLE_SECONDS and now - state.accessed_at > REPORTS_IDLE_SECONDS:
+                    with self._databases_lock:
+                        self._databases.pop(path, None)
+                    continue
+                try:
+                    self.run_once(path, now)
+                except Exception:
+                    logger.exception(f"Report refresh failed for {path}")
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='report-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def after_fork(self):
+        """
+        num processo filho (worker com preload): os snapshots herdados continuam
+        servindo, mas o data_version deles era da conexão do pai e não vale aqui,
+        então a thread do filho recalcula tudo logo que subir
+        """
+        self._thread = None
+        self._databases_lock = threading.Lock()
+        with self._databases_lock:
+            for state in self._databases.values():
+                state.lock = threading.Lock()
+                state.built_version = state.seen_version = None
+                state.accessed_at = time.monotonic()
+                for snapshot in state.snapshots.values():
+                    snapshot.data_version = None
+
+    def stats(self) -> Dict:
+        with self._databases_lock:
+            states = list(self._databases.values())
+        ages = [snapshot.age for state in states for snapshot in state.snapshots.values()]
+        return {
+            'databases': len(states),
+            'snapshots': len(ages),
+            'rebuilds': self.rebuilds,
+            'max_age_seconds': round(max(ages), 3) if ages else 0,
+        }
+
+
+scheduler = ReportScheduler()
@@ -0,0 +1,438 @@
+"""
+contadores de estatísticas em memória compartilhada entre processos
+com vários workers cada processo teria a própria cópia (e os caches de um não
+enxergam as gravações do outro); aqui os contadores por personagem e por
+confronto ficam num bloco de multiprocessing.shared_memory com layout fixo,
+atualizado pelo database.py junto com cada gravação, e todo worker lê o
+/api/stats direto dele sem abrir conexão com o SQLite
+
+layout (int64):
+    [MAGIC, N, seq, estado, montado_em, remontagem, total_partidas,
+     partidas[N], vitórias[N], vitórias_no_confronto[N][N] (vencedor x perdedor),
+     confrontos_durante_a_remontagem[N][N]]
+
+remontar (rebuild) varre o banco inteiro, então isso roda sem o flock: com ele
+na mão a remontagem só abre a leitura do banco (fixa no WAL) e marca o bloco;
+as gravações que vierem depois caem também na área de remontagem, e no fim,
+de novo com o flock, o resultado da varredura + essa área é copiado pro bloco
+
+escrita: flock num arquivo .lock ao lado do banco (um escritor por vez, entre
+processos) + seqlock (seq ímpar = escrita em andamento), então a leitura não
+trava e nunca vê um retrato pela metade. um escritor morto no meio (SIGKILL do
+gunicorn) deixa o seq ímpar: a leitura desiste depois de SHARED_STATS_READ_TIMEOUT
+e cai pro SQLite, e o próximo a pegar o flock conserta o seq e marca o bloco
+pra remontar
+
+gravações de processos sem SHARED_STATS ligado não atualizam os contadores;
+eles são remontados do banco a cada SHARED_STATS_MAX_AGE segundos
+
+Como usar:
+    python shared_stats.py --status
+    python shared_stats.py --rebuild
+    python shared_stats.py --unlink      # remove o bloco (o próximo acesso cria de novo)
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from array import array
+from contextlib import ExitStack, contextmanager
+from multiprocessing import resource_tracker, shared_memory
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:
+    # sem flock (Windows) não dá pra garantir um escritor por vez entre processos
+    fcntl = None
+
+from utils import TEKKEN_CHARS
+
+logger = logging.getLogger(__name__)
+
+SHARED_STATS = os.getenv('SHARED_STATS', 'False').lower() == 'true'
+SHARED_STATS_MAX_AGE = int(os.getenv('SHARED_STATS_MAX_AGE', 300))  # 0 = nunca remonta sozinho
+# quanto a leitura espera um seq ímpar voltar a par antes de cair pro SQLite
+SHARED_STATS_READ_TIMEOUT = float(os.getenv('SHARED_STATS_READ_TIMEOUT', 0.05))
+
+# segundos até uma remontagem sem fim (processo morto no meio) ser abandonada
+SHARED_STATS_REBUILD_TIMEOUT = int(os.getenv('SHARED_STATS_REBUILD_TIMEOUT', 120))
+
+LAYOUT_VERSION = 2  # entra no nome do bloco: layout novo não lê um bloco antigo
+MAGIC = 0x54454B4B454E5354  # 'TEKKENST'
+SLOT = 8  # bytes por contador (int64)
+
+# posições do cabeçalho; H_REBUILD = time_ns() do início da remontagem em andamento (0 = nenhuma)
+H_MAGIC, H_CHARS, H_SEQ, H_STATE, H_BUILT_AT, H_REBUILD, H_TOTAL = range(7)
+HEADER_SLOTS = 7
+
+STATE_EMPTY = 0   # precisa remontar do banco
+STATE_READY = 1
+
+# loader(pinned=...): {(vencedor, perdedor): partidas} de todo o banco; chama pinned()
+# assim que a leitura da tabela principal estiver fixa (ver database.get_matchup_totals)
+MatchupLoader = Callable[..., Dict[Tuple[str, str], int]]
+
+
+def segment_name(path: str, characters: Iterable[str] = TEKKEN_CHARS) -> str:
+    """nome do bloco: um por banco e por lista de personagens (mudou a lista, muda o layout)"""
+    key = f"{LAYOUT_VERSION}\0{os.path.abspath(path)}\0" + '\0'.join(characters)
+    return 'tekken_' + hashlib.sha1(key.encode()).hexdigest()[:16]
+
+
+class SharedStats:
+    """contadores de um banco num bloco de memória compartilhada"""
+
+    def __init__(self, path: str, characters: Iterable[str] = TEKKEN_CHARS):
+        self.path = path
+        self.characters = list(characters)
+        self.index = {char: i for i, char in enumerate(self.characters)}
+        n = len(self.characters)
+        self.n = n
+        self.matches_at = HEADER_SLOTS
+        self.wins_at = HEADER_SLOTS + n
+        self.matchups_at = HEADER_SLOTS + 2 * n
+        # leitores copiam só até aqui; a área de remontagem é só dos escritores
+        self.data_slots = HEADER_SLOTS + 2 * n + n * n
+        self.deltas_at = self.data_slots
+        self.slots = self.data_slots + n * n
+        self.name = segment_name(path, self.characters)
+        self.lock_path = path + '.stats.lock'
+
+        self.shm = self._open()
+        self.counters = self.shm.buf.cast('q')
+        self._local_lock = threading.Lock()
+
+    def _open(self) -> shared_memory.SharedMemory:
+        try:
+            shm = shared_memory.SharedMemory(self.name, create=True, size=self.slots * SLOT)
+            # o bloco novo vem zerado (STATE_EMPTY); o MAGIC marca que o layout já foi escrito
+            counters = shm.buf.cast('q')
+            counters[H_CHARS] = self.n
+            counters[H_MAGIC] = MAGIC
+            counters.release()
+        except FileExistsError:
+            shm = shared_memory.SharedMemory(self.name)
+        # o bloco é de todos os workers: sem isso o resource_tracker apaga ele quando
+        # o primeiro processo que abriu sai
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+    @contextmanager
+    def _flock(self, blocking: bool = True):
+        """flock do arquivo .lock; sem bloquear devolve False se outro escritor estiver com ele"""
+        if not self._local_lock.acquire(blocking):
+            yield False
+            return
+        try:
+            os.makedirs(os.path.dirname(self.lock_path) or '.', exist_ok=True)
+            with open(self.lock_path, 'a') as lock_file:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    yield False
+                    return
+                try:
+                    yield True
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+        finally:
+            self._local_lock.release()
+
+    @contextmanager
+    def locked(self):
+        """um escritor por vez (threads deste processo + outros processos)"""
+        with self._flock():
+            self._heal()
+            yield self
+
+    def _heal(self):
+        """
+        com o flock na mão ninguém está escrevendo, então seq ímpar = escritor que
+        morreu no meio da escrita. volta o seq pra par direto (passar pelo _writing
+        só inverteria a paridade e deixaria os leitores lendo no meio de uma escrita)
+        e marca os contadores, que podem estar pela metade, pra remontar
+        """
+        counters = self.counters
+        seq = counters[H_SEQ]
+        if seq % 2:
+            counters[H_STATE] = STATE_EMPTY
+            counters[H_SEQ] = seq + 1
+            logger.warning(f"Shared stats {self.name}: writer died mid-update, counters marked for rebuild")
+
+    def repair(self, blocking: bool = True) -> bool:
+        """conserta um seq deixado ímpar; sem bloquear não faz nada se houver um escritor ativo"""
+        with self._flock(blocking) as acquired:
+            if acquired:
+                self._heal()
+            return acquired
+
+    @contextmanager
+    def _writing(self):
+        # seqlock: ímpar enquanto escreve; o leitor tenta de novo se pegou ímpar ou mudou
+        counters = self.counters
+        counters[H_SEQ] += 1
+        try:
+            yield counters
+        finally:
+            counters[H_SEQ] += 1
+
+    @property
+    def ready(self) -> bool:
+        return self.counters[H_MAGIC] == MAGIC and self.counters[H_STATE] == STATE_READY
+
+    def record(self, matches: Iterable[Tuple[str, str, str]]):
+        """soma partidas (p1_char, p2_char, winner_char); chamar com locked()"""
+        ready = self.ready
+        rebuilding = self.counters[H_REBUILD] != 0
+        if not ready and not rebuilding:
+            # ainda não montado: a próxima leitura remonta do banco, já com essas partidas
+            return
+        index = self.index
+        with self._writing() as counters:
+            for p1_char, p2_char, winner_char in matches:
+                p1, p2, winner = index.get(p1_char), index.get(p2_char), index.get(winner_char)
+                if p1 is None or p2 is None or winner not in (p1, p2):
+                    continue
+                loser = p2 if winner == p1 else p1
+                if ready:
+                    counters[H_TOTAL] += 1
+                    counters[self.matches_at + p1] += 1
+                    counters[self.matches_at + p2] += 1
+                    counters[self.wins_at + winner] += 1
+                    counters[self.matchups_at + winner * self.n + loser] += 1
+                if rebuilding:
+                    # a varredura em andamento não enxerga esta partida; entra no fim da remontagem
+                    counters[self.deltas_at + winner * self.n + loser] += 1
+
+    def reset(self):
+        """zera tudo (banco esvaziado); chamar com locked()"""
+        with self._writing() as counters:
+            for i in range(H_TOTAL, self.slots):
+                counters[i] = 0
+            # uma remontagem em andamento leu o banco de antes: o resultado dela é descartado
+            counters[H_REBUILD] = 0
+            counters[H_BUILT_AT] = int(time.time())
+            counters[H_STATE] = STATE_READY
+
+    def invalidate(self):
+        """força remontar do banco na próxima leitura"""
+        with self.locked():
+            with self._writing() as counters:
+                counters[H_REBUILD] = 0
+                counters[H_STATE] = STATE_EMPTY
+
+    def _stale(self, values) -> bool:
+        return (values[H_MAGIC] != MAGIC or values[H_STATE] != STATE_READY
+                or (SHARED_STATS_MAX_AGE > 0 and time.time() - values[H_BUILT_AT] > SHARED_STATS_MAX_AGE))
+
+    def _rebuilding(self, values) -> bool:
+        """tem uma remontagem em andamento (e não abandonada) noutro processo ou thread"""
+        started = values[H_REBUILD]
+        return started != 0 and time.time_ns() - started < SHARED_STATS_REBUILD_TIMEOUT * 1_000_000_000
+
+    def rebuild(self, loader: MatchupLoader, force: bool = True) -> bool:
+        """
+        remonta os contadores a partir do banco. o flock só fica na mão até o loader
+        fixar a leitura (pinned) e de novo pra copiar o resultado, então as gravações
+        não esperam a varredura. False = outra remontagem passou na frente
+        """
+        with ExitStack() as held:
+            held.enter_context(self.locked())
+            # outro worker pode ter remontado (ou estar remontando) enquanto a gente esperava o lock
+            values = self._read()
+            if not force and values is not None and (not self._stale(values) or self._rebuilding(values)):
+                return not self._stale(values)
+
+            ticket = time.time_ns()
+            with self._writing() as counters:
+                self.shm.buf[self.deltas_at * SLOT:self.slots * SLOT] = bytes((self.slots - self.deltas_at) * SLOT)
+                counters[H_REBUILD] = ticket
+            try:
+                # gravações depois do pinned() ficam fora da leitura e caem na área de remontagem
+                matchups = loader(pinned=held.close)
+            except BaseException:
+                held.close()
+                with self.locked():
+                    if self.counters[H_REBUILD] == ticket:
+                        with self._writing() as counters:
+                            counters[H_REBUILD] = 0
+                raise
+
+        with self.locked():
+            if self.counters[H_REBUILD] != ticket:
+                # reset/invalidate ou uma remontagem forçada no meio: esta leitura já não vale
+                return False
+            deltas = array('q')
+            deltas.frombytes(self.shm.buf[self.deltas_at * SLOT:self.slots * SLOT])
+
+            values = array('q', bytes((self.data_slots - H_TOTAL) * SLOT))
+            n = self.n
+            for winner in range(n):
+                for loser in range(n):
+                    if deltas[winner * n + loser]:
+                        key = (self.characters[winner], self.characters[loser])
+                        matchups[key] = matchups.get(key, 0) + deltas[winner * n + loser]
+            for (winner_char, loser_char), count in matchups.items():
+                winner, loser = self.index.get(winner_char), self.index.get(loser_char)
+                if winner is None or loser is None:
+                    continue
+                values[0] += count
+                values[1 + winner] += count
+                values[1 + loser] += count
+                values[1 + n + winner] += count
+                values[1 + 2 * n + winner * n + loser] += count
+            with self._writing() as counters:
+                self.shm.buf[H_TOTAL * SLOT:self.data_slots * SLOT] = values.tobytes()
+                counters[H_MAGIC] = MAGIC
+                counters[H_REBUILD] = 0
+                counters[H_BUILT_AT] = int(time.time())
+                counters[H_STATE] = STATE_READY
+            return True
+
+    def _read(self) -> Optional[array]:
+        """
+        cópia consistente de todos os contadores (seqlock); None se o seq não voltar
+        a par em SHARED_STATS_READ_TIMEOUT (escritor morto: tenta consertar sem bloquear)
+        """
+        counters = self.counters
+        deadline = time.monotonic() + SHARED_STATS_READ_TIMEOUT
+        while True:
+            seq = counters[H_SEQ]
+            if seq % 2 == 0:
+                values = array('q')
+                values.frombytes(self.shm.buf[:self.data_slots * SLOT])
+                if counters[H_SEQ] == seq:
+                    return values
+            if time.monotonic() >= deadline:
+                self.repair(blocking=False)
+                return None
+            time.sleep(0)
+
+    def snapshot(self, loader: MatchupLoader) -> Optional[array]:
+        """contadores prontos pra leitura, ou None (quem chamou lê do banco)"""
+        values = self._read()
+        if values is not None and self._stale(values) and not self._rebuilding(values):
+            self.rebuild(loader, force=False)
+            values = self._read()
+        if values is None or values[H_STATE] != STATE_READY:
+            return None
+        return values
+
+    def character_totals(self, loader: MatchupLoader) -> Optional[Dict]:
+        """mesmo formato do database.get_character_totals(); None = contadores indisponíveis"""
+        values = self.snapshot(loader)
+        return self._character_totals(values) if values is not None else None
+
+    def matchup_totals(self, loader: MatchupLoader) -> Optional[Dict[Tuple[str, str], int]]:
+        """{(vencedor, perdedor): partidas}; None = contadores indisponíveis"""
+        values = self.snapshot(loader)
+        return self._matchup_totals(values) if values is not None else None
+
+    def totals(self, loader: MatchupLoader) -> Optional[Tuple[Dict, Dict[Tuple[str, str], int]]]:
+        """(character_totals, matchup_totals) da mesma leitura, batendo entre si; None = indisponíveis"""
+        values = self.snapshot(loader)
+        if values is None:
+            return None
+        return self._character_totals(values), self._matchup_totals(values)
+
+    def _character_totals(self, values: array) -> Dict:
+        characters = {}
+        for i, char in enumerate(self.characters):
+            matches = values[self.matches_at + i]
+            if matches:
+                characters[char] = {'matches': matches, 'wins': values[self.wins_at + i]}
+        return {'total_matches': values[H_TOTAL], 'characters': characters}
+
+    def _matchup_totals(self, values: array) -> Dict[Tuple[str, str], int]:
+        matchups = {}
+        for winner, winner_char in enumerate(self.characters):
+            row = self.matchups_at + winner * self.n
+            for loser, loser_char in enumerate(self.characters):
+                if values[row + loser]:
+                    matchups[(winner_char, loser_char)] = values[row + loser]
+        return matchups
+
+    def status(self) -> Dict:
+        values = self._read()
+        if values is None:
+            return {'name': self.name, 'bytes': self.slots * SLOT, 'ready': False, 'torn': True}
+        return {
+            'name': self.name,
+            'bytes': self.slots * SLOT,
+            'ready': values[H_STATE] == STATE_READY,
+            'rebuilding': self._rebuilding(values),
+            'built_at': values[H_BUILT_AT],
+            'total_matches': values[H_TOTAL],
+        }
+
+    def close(self):
+        self.counters.release()
+        self.shm.close()
+
+    def unlink(self):
+        # o unlink() tira o bloco do resource_tracker, que não tem ele desde o _open
+        resource_tracker.register(self.shm._name, 'shared_memory')
+        self.shm.unlink()
+        self.close()
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+_warned = False
+
+
+def get_store(path: str) -> Optional[SharedStats]:
+    """contadores do banco em `path`, ou None com SHARED_STATS desligado"""
+    global _warned
+    if not SHARED_STATS:
+        return None
+    if fcntl is None:
+        if not _warned:
+            logger.warning("SHARED_STATS needs fcntl (POSIX); shared counters disabled")
+            _warned = True
+        return None
+    store = _stores.get(path)
+    if store is None:
+        with _stores_lock:
+            store = _stores.get(path)
+            if store is None:
+                store = _stores[path] = SharedStats(path)
+    return store
+
+
+def main(argv=None):
+    import database
+
+    parser = argparse.ArgumentParser(description='Contadores em memória compartilhada do Tekken Stats')
+    parser.add_argument('--db', default=database.DATABASE_PATH, help='arquivo do banco')
+    parser.add_argument('--status', action='store_true', help='mostra o estado do bloco')
+    parser.add_argument('--rebuild', action='store_true', help='remonta os contadores do banco')
+    parser.add_argument('--unlink', action='store_true', help='remove o bloco de memória')
+    args = parser.parse_args(argv)
+
+    if fcntl is None:
+        print('SHARED_STATS precisa de fcntl (POSIX)', file=sys.stderr)
+        return 1
+
+    database.DATABASE_PATH = args.db
+    store = SharedStats(args.db)
+    if args.unlink:
+        store.unlink()
+        print(f"{store.name} removido")
+        return 0
+    if args.rebuild:
+        database.init_db()
+        store.rebuild(database.get_matchup_totals)
+    print(json.dumps(store.status(), indent=2))
+    store.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,39 +1,177 @@
-from flask import Flask, render_template, request, redirect, url_for, send_from_directory, abort, jsonify
+from flask import (Flask, render_template, request, redirect, url_for, send_from_directory, abort, jsonify,
+                   Response, stream_with_context)
+import io
 import os
 import logging
+import sqlite3
+import threading
+import time
+import uuid
 from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:
+    # Sem flock (Windows): backups e manutenção rodam em todo processo
+    fcntl = None
 from dotenv import load_dotenv
-from utils import (TEKKEN_CHARS, TEKKEN_RANKS, REGIONS, calculate_stats,
+from utils import (TEKKEN_CHARS, TEKKEN_RANKS, REGIONS,
                    calculate_matchup_stats, calculate_player_stats,
                    get_used_characters, get_used_character_stats,
-                   get_character_image_url)
+                   sort_used_character_stats, stats_from_totals, get_character_image_url,
+                   CHARACTER_SORTS, build_character_index, query_character_index)
 # Importar funções do SQLite Database
-from database import (init_db, get_all_matches, add_match as db_add_match,
+import database
+from database import (init_db, get_all_matches, insert_match as db_insert_match,
                      get_all_players, add_player as db_add_player,
-                     get_player_by_id, clear_all_matches)
+                     get_player_by_id, clear_all_matches, get_data_token, iter_matches, search_players,
+                     get_head_to_head, get_character_totals, get_shared_character_totals,
+                     get_last_event_seq, IdempotencyKeyConflict)
+from compression import init_compression, payload_cache
+from fragment_cache import init_fragment_cache, fragment_cache
+from live_stream import get_broker, open_client, subscriber_count
+from metrics import init_metrics, register_collector, cache_collector, timed_stats
+from query_profiler import init_query_profiler
+from log_config import configure_logging, init_request_logging, restart_logging_listener
+from match_export import EXPORT_FORMATS
+from csv_import import import_matches_csv
+from backup import scheduler as backup_scheduler
+from player_cache import player_caches
+from maintenance import scheduler as maintenance_scheduler
+from reports import scheduler as report_scheduler, format_age
+from leagues import init_leagues, current_league, league_exists, fan_out, merge_character_totals
 
 # Carregar variáveis de ambiente
 load_dotenv()
 
-# Configurar o logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('app.log'),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
-app = Flask(__name__)
-app.config['DEBUG'] = os.getenv('FLASK_DEBUG', 'False').lower() == 'true'
+# Páginas que cada worker pede pra si mesmo antes de atender (caches e conexões daquele processo)
+WARMUP_PATHS = [path.strip() for path in os.getenv(
+    'WARMUP_PATHS', '/,/players,/matchups,/character-stats,/api/stats,/api/dashboard').split(',') if path.strip()]
+# Conexões abertas no pool de cada worker no aquecimento
+WARMUP_CONNECTIONS = int(os.getenv('WARMUP_CONNECTIONS', 2))
+
+# Rotas ficam guardadas aqui e são registradas em cada app do create_app
+_routes = []
+
+def route(rule, **options):
+    """Same as @app.route, but registers the view on every app built by create_app"""
+    def decorator(view_func):
+        _routes.append((rule, view_func, options))
+        return view_func
+    return decorator
+
+# Backups e manutenção rodam num processo só: com vários workers, no que pegar este lock
+# (vazio = background_jobs.lock ao lado do banco)
+JOBS_LOCK_FILE = os.getenv('JOBS_LOCK_FILE', '')
+_jobs_lock_file = None
+
+def _acquire_jobs_lock():
+    """True in the one process that runs backups and maintenance; the flock lives as long as the process"""
+    global _jobs_lock_file
+    if _jobs_lock_file is not None:
+        return True
+    if fcntl is None:
+        return True
+    path = JOBS_LOCK_FILE or os.path.join(os.path.dirname(database.DATABASE_PATH) or '.', 'background_jobs.lock')
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    lock_file = open(path, 'a')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        # Outro worker já roda os jobs; se ele morrer, o worker que o gunicorn sobe no lugar pega o lock
+        lock_file.close()
+        return False
+    _jobs_lock_file = lock_file
+    return True
+
+# Inicialização preguiçosa: o import fica leve (workers e testes sobem rápido);
+# as migrações e os agendadores rodam na primeira requisição
+_app_ready = False
+_app_ready_lock = threading.Lock()
+
+def ensure_app_ready():
+    global _app_ready
+    if _app_ready:
+        return
+    with _app_ready_lock:
+        if _app_ready:
+            return
+        init_db()
+        if _acquire_jobs_lock():
+            # Snapshot periódico do banco com a API de backup do SQLite (BACKUP_INTERVAL_SECONDS > 0)
+            backup_scheduler.start()
+            # optimize, incremental_vacuum e checkpoint do WAL quando os limites pedirem
+            maintenance_scheduler.start()
+        # Relatórios pesados recalculados em segundo plano quando o banco muda
+        report_scheduler.start()
+        _app_ready = True
+
+# Medir o tempo dos cálculos de estatísticas (não faz nada com métricas desligadas)
+calculate_matchup_stats = timed_stats(calculate_matchup_stats)
+calculate_player_stats = timed_stats(calculate_player_stats)
+get_used_characters = timed_stats(get_used_characters)
+get_used_character_stats = timed_stats(get_used_character_stats)
+
+# Coletores do /metrics (valem pro processo inteiro, não pra cada app)
+register_collector(cache_collector('tekken_fragment_cache', fragment_cache.stats))
+register_collector(cache_collector('tekken_compression_cache', payload_cache.stats))
+register_collector(cache_collector('tekken_player_cache', player_caches.stats))
+register_collector(lambda: [('tekken_sse_subscribers', 'gauge', 'Clientes conectados em /api/stream',
+                             subscriber_count())])
+register_collector(lambda: [('tekken_report_rebuilds_total', 'counter', 'Recálculos dos relatórios em segundo plano',
+                             report_scheduler.stats()['rebuilds']),
+                            ('tekken_report_max_age_seconds', 'gauge', 'Idade do snapshot mais velho',
+                             report_scheduler.stats()['max_age_seconds'])])
+
+
+def create_app(config=None):
+    """
+    Build the Flask app with its extensions, routes and template helpers
+
+    `config` is applied over the defaults read from the environment; a
+    DATABASE_PATH entry also points the database module at that file
+    """
+    # Configurar o logging (fila + listener, a requisição nunca espera o disco)
+    configure_logging()
+
+    app = Flask(__name__)
+    app.config['DEBUG'] = os.getenv('FLASK_DEBUG', 'False').lower() == 'true'
+    if config:
+        app.config.update(config)
+    if app.config.get('DATABASE_PATH'):
+        database.DATABASE_PATH = app.config['DATABASE_PATH']
+
+    app.before_request(ensure_app_ready)
+
+    # Uma liga por arquivo SQLite: /league/<liga>/... usa o banco (e o pool) da liga
+    init_leagues(app)
+
+    # Marcar o início das requisições pros logs (e logar o acesso com LOG_REQUESTS=true)
+    init_request_logging(app)
 
-# Inicializar o database
-init_db()
+    # Métricas em /metrics (registradas antes da compressão pra medir o tempo dela também)
+    init_metrics(app)
+
+    # Log de queries lentas com EXPLAIN QUERY PLAN em /debug/queries (QUERY_PROFILE=true)
+    init_query_profiler(app)
+
+    # Comprimir respostas HTML/JSON grandes
+    init_compression(app)
+
+    # Cache dos fragmentos pesados dos templates, invalidado pela versão do banco (por liga)
+    init_fragment_cache(app, get_data_token)
+
+    # adiciona url de imagens ao jinja
+    app.jinja_env.globals.update(get_character_image_url=get_character_image_url)
+    app.jinja_env.filters['age'] = format_age
+
+    for rule, view_func, options in _routes:
+        app.add_url_rule(rule, view_func=view_func, **options)
+
+    return app
 
-# adiciona url de imagens ao jinja
-app.jinja_env.globals.update(get_character_image_url=get_character_image_url)
 
 # Embrulhar funções à interface antiga
 def load_matches():
@@ -45,24 +183,57 @@ def load_players():
     return get_all_players()
 
 
-@app.route('/')
+@route('/')
 def index():
-    matches = load_matches()
-    stats = calculate_stats(matches)
-
-    return render_template('index.html', matches=matches, stats=stats, chars=TEKKEN_CHARS)
-
-
-@app.route('/add', methods=['GET', 'POST'])
+    # A página inicial não relê as partidas a cada requisição (mesmas fontes do /api/stats).
+    # O stream da página continua do seq lido antes dos números: nada gravado no meio se perde
+    event_seq = get_last_event_seq()
+    totals = get_shared_character_totals()
+    if totals is not None:
+        # SHARED_STATS=true: contadores em memória compartilhada, sempre em dia
+        snapshot = None
+        stats = sort_used_character_stats(stats_from_totals(totals['characters']))
+        total_matches = totals['total_matches']
+    else:
+        snapshot = report_scheduler.get('character_stats')
+        stats = snapshot.value
+        event_seq = snapshot.event_seq
+        # Cada partida conta uma vez pra cada lado (mirror também)
+        total_matches = sum(char_stats['matches'] for char_stats in stats.values()) // 2
+
+    return render_template('index.html', stats=stats, total_matches=total_matches,
+                           chars=TEKKEN_CHARS, snapshot=snapshot, event_seq=event_seq)
+
+
+@route('/add', methods=['GET', 'POST'])
 def add_match():
     if request.method == 'POST':
-        # Pegar a seleção de personagens
-        p1_char = request.form['player1']
-        p2_char = request.form['player2']
-        winner_char = request.form['winner']
+        player_ids = {}
+        if 'player1_char' in request.form:
+            # Formulário: jogadores pelo ID + personagem de cada um, vencedor pelo ID
+            p1_char = request.form['player1_char']
+            p2_char = request.form['player2_char']
+            p1_id = request.form['player1_id']
+            p2_id = request.form['player2_id']
+            winner_id = request.form['winner_id']
+
+            if not p1_id or not p2_id or p1_id == p2_id:
+                return "Pick two different players!", 400
+            if winner_id not in (p1_id, p2_id):
+                return "Winner must be one of the players!", 400
+
+            winner_char = p1_char if winner_id == p1_id else p2_char
+            player_ids = {'player1_id': p1_id, 'player2_id': p2_id, 'winner_id': winner_id}
+        else:
+            # Formato antigo: só os personagens
+            p1_char = request.form['player1']
+            p2_char = request.form['player2']
+            winner_char = request.form['winner']
+
+        if p1_char not in TEKKEN_CHARS or p2_char not in TEKKEN_CHARS or winner_char not in (p1_char, p2_char):
+            return "Invalid characters!", 400
 
         new_match = {
-            "id": int(datetime.now().timestamp() * 1000),
             "timestamp": datetime.now().isoformat(),
             "player1": p1_char,
             "player2": p2_char,
@@ -70,22 +241,58 @@ def add_match():
             # Manter ambos os formatos para compatibilidade
             "player1_char": p1_char,
             "player2_char": p2_char,
-            "winner_char": winner_char
+            "winner_char": winner_char,
+            # Reenvio do mesmo formulário (ou retry do cliente) não duplica a partida
+            "idempotency_key": request.headers.get('Idempotency-Key') or request.form.get('idempotency_key'),
+            **player_ids
         }
 
         # Save to database instead of JSON Salvar no database ao invés de JSON
-        db_add_match(new_match)
+        try:
+            new_match['id'], created = db_insert_match(new_match)
+        except IdempotencyKeyConflict as e:
+            # Só o reenvio com os mesmos dados vale como repetição
+            logger.warning(f"Rejected match: {e}")
+            return "Idempotency key already used for a different match!", 422
+        if not created:
+            return redirect(url_for('index'))
+
+        # Recalcular os relatórios em segundo plano (com debounce)
+        report_scheduler.notify()
+
+        # Os espectadores conectados (em qualquer worker) recebem a partida pela fila
+        # match_events, gravada junto com ela (ver live_stream.py)
         return redirect(url_for('index'))
 
-    return render_template("add_match.html", chars=TEKKEN_CHARS)
-
-
+    return render_template("add_match.html", chars=TEKKEN_CHARS, idempotency_key=uuid.uuid4().hex)
 
 
 RENDER_PATHS = [
     "static/renders",
     "static/renders/tekken7",
 ]
+RENDER_EXTENSIONS = ['.png', '.jpg', '.jpeg']
+
+# nome -> (pasta, arquivo) das imagens que existiam quando o índice foi montado
+_render_index = {}
+
+def build_render_index():
+    """Scan RENDER_PATHS once so /render/<name> does not stat the disk for known images"""
+    global _render_index
+    index = {}
+    for path in RENDER_PATHS:
+        try:
+            filenames = os.listdir(path)
+        except OSError:
+            continue
+        # Mesma ordem de busca do get_render: pasta, depois extensão
+        for ext in RENDER_EXTENSIONS:
+            for filename in filenames:
+                stem, file_ext = os.path.splitext(filename)
+                if file_ext == ext and stem == stem.lower():
+                    index.setdefault(stem, (path, filename))
+    _render_index = index
+    return index
 
 def generate_placeholder_image(character_name):
     """Gerar um placeholder para o personagem primeiro"""
@@ -131,7 +338,7 @@ def generate_placeholder_image(character_name):
         logger.error(f"Failed to generate placeholder image for {character_name}: {str(e)}")
         return None
 
-@app.route("/render/<name>")
+@route("/render/<name>")
 def get_render(name):
     """
     Serve character render images with intelligent fallback
@@ -145,9 +352,14 @@ def get_render(name):
     """
     name_lower = name.lower()
 
+    # Imagens conhecidas saem do índice montado no warm_up, sem tocar no disco
+    indexed = _render_index.get(name_lower)
+    if indexed:
+        return send_from_directory(*indexed)
+
     # Tenta encontrar a imagem primeiro
     for path in RENDER_PATHS:
-        for ext in ['.png', '.jpg', '.jpeg']:
+        for ext in RENDER_EXTENSIONS:
             filename = name_lower + ext
             full_path = os.path.join(path, filename)
             if os.path.exists(full_path):
@@ -172,8 +384,8 @@ def get_render(name):
         logger.error(f"Error serving default.png: {e}")
         abort(404)
 
-@app.route('/players')
-def players_list():
+@report_scheduler.register('player_rankings')
+def build_player_rankings():
     players = load_players()
     matches = load_matches()
 
@@ -188,11 +400,17 @@ def players_list():
 
     # Ordenar por vitórias e depois por taxa de vitória
     player_rankings.sort(key=lambda x: (x['stats']['wins'], float(x['stats']['winrate'].rstrip('%'))), reverse=True)
+    return player_rankings
+
 
-    return render_template('players.html', player_rankings=player_rankings)
+@route('/players')
+def players_list():
+    # Último snapshot do ranking (recalculado em segundo plano quando o banco muda)
+    snapshot = report_scheduler.get('player_rankings')
+    return render_template('players.html', player_rankings=snapshot.value, snapshot=snapshot)
 
 
-@app.route('/player/add', methods=['GET', 'POST'])
+@route('/player/add', methods=['GET', 'POST'])
 def add_player():
     if request.method == 'POST':
         new_player = {
@@ -209,71 +427,138 @@ def add_player():
             logger.warning(f"Attempt to add duplicate player ID: {new_player['id']}")
             return "Player ID already exists!", 400
 
-        # Salvar no database
-        db_add_player(new_player)
+        # Salvar no database (o cache pode não saber de um jogador gravado por outro worker)
+        try:
+            db_add_player(new_player)
+        except sqlite3.IntegrityError:
+            logger.warning(f"Attempt to add duplicate player ID: {new_player['id']}")
+            return "Player ID already exists!", 400
         return redirect(url_for('players_list'))
 
     return render_template('add_player.html', chars=TEKKEN_CHARS, ranks=TEKKEN_RANKS, regions=REGIONS)
 
 
-@app.route('/player/<player_id>')
+@route('/player/<player_id>')
 def player_profile(player_id):
-    players = load_players()
-    matches = load_matches()
-
-    player = next((p for p in players if p['id'] == player_id), None)
+    # busca O(1) no cache de jogadores, sem carregar a lista inteira
+    player = get_player_by_id(player_id)
     if not player:
         abort(404)
 
-    stats = calculate_player_stats(player_id, matches, players)
+    matches = load_matches()
+    stats = calculate_player_stats(player_id, matches, [player])
 
     return render_template('player_profile.html', player=player, stats=stats)
 
 
-@app.route('/matchups')
-def matchups():
+@report_scheduler.register('matchups')
+def build_matchups():
     matches = load_matches()
     matchup_stats = calculate_matchup_stats(matches)
 
     # Ordenar pelas matchups mais jogadas
     matchup_list = list(matchup_stats.values())
     matchup_list.sort(key=lambda x: x['total'], reverse=True)
+    return matchup_list
+
 
-    return render_template('matchups.html', matchups=matchup_list)
+@report_scheduler.register('character_stats')
+def build_character_stats():
+    return get_used_character_stats(load_matches())
 
 
-@app.route('/character-stats')
+@route('/matchups')
+def matchups():
+    snapshot = report_scheduler.get('matchups')
+    return render_template('matchups.html', matchups=snapshot.value, snapshot=snapshot,
+                           event_seq=snapshot.event_seq)
+
+
+@route('/character-stats')
 def character_stats():
-    # Página de estátiscas dos personagens
-    return render_template('character_stats.html')
+    # Página de estátiscas dos personagens (os dados vêm do /api/dashboard)
+    snapshot = report_scheduler.get('character_stats')
+    return render_template('character_stats.html', snapshot=snapshot)
 
 
-@app.route('/clear')
+@route('/clear')
 def clear_data():
     #  Limpar todas as partidas do database
     clear_all_matches()
+    report_scheduler.notify()
     return redirect(url_for('index'))
 
 
-@app.route('/api/stats')
-def api_stats():
-    # Retornar dados de apenas personagens usados
-    matches = load_matches()
-
-    used_stats = get_used_character_stats(matches)
-
+def format_char_data(used_stats):
     # Formato para as tabelas
-    char_data = {
+    return {
         'labels': list(used_stats.keys()),
         'wins': [stats['wins'] for stats in used_stats.values()],
         'matches': [stats['matches'] for stats in used_stats.values()],
         'winrates': [float(stats['winRate'].rstrip('%')) for stats in used_stats.values()]
     }
 
-    return jsonify(char_data)
 
+def format_usage_data(used_stats):
+    usage_data = []
+    for char, stats in used_stats.items():
+        usage_data.append({
+            'character': char,
+            'wins': stats['wins'],
+            'matches': stats['matches'],
+            'usage': stats['usage'],
+            'winRate': stats['winRate']
+        })
+    return usage_data
+
+
+@route('/api/stats')
+def api_stats():
+    # Retornar dados de apenas personagens usados
+    totals = get_shared_character_totals()
+    if totals is not None:
+        # SHARED_STATS=true: contadores em memória compartilhada, sem tocar no banco
+        used_stats = sort_used_character_stats(stats_from_totals(totals['characters']))
+    else:
+        used_stats = report_scheduler.get('character_stats').value
+
+    return jsonify(format_char_data(used_stats))
+
+
+@route('/api/leagues/stats')
+def api_leagues_stats():
+    """
+    Character stats across every league, queried in parallel (one thread per league DB)
+
+    Query params:
+    - league: restrict to these leagues (repeatable)
+    - start/end: ISO 8601 time range
+    """
+    leagues = request.args.getlist('league') or None
+    if leagues and any(not league_exists(key) for key in leagues):
+        abort(404)
+    start = _parse_time_param('start')
+    end = _parse_time_param('end')
+
+    def league_totals():
+        # sem intervalo dá pra usar os contadores compartilhados da liga (SHARED_STATS=true)
+        totals = get_shared_character_totals() if not (start or end) else None
+        return totals if totals is not None else get_character_totals(start, end)
 
-@app.route('/api/used-characters')
+    results = fan_out(league_totals, leagues)
+    merged = merge_character_totals(results)
+
+    # mesma ordem do /api/stats: taxa de vitória e depois partidas
+    used_stats = sort_used_character_stats(stats_from_totals(merged['characters']))
+
+    return jsonify({
+        'leagues': {key: totals['total_matches'] for key, totals in results.items()},
+        'total_matches': merged['total_matches'],
+        **format_char_data(used_stats)
+    })
+
+
+@route('/api/used-characters')
 def api_used_characters():
     # Retornar lista dos personagens que foram usados
     matches = load_matches()
@@ -285,26 +570,313 @@ def api_used_characters():
     })
 
 
-@app.route('/api/character-usage')
+@route('/api/character-usage')
 def api_character_usage():
-    # Retornar estatisticas de uso dos personagens
-    matches = load_matches()
-    used_stats = get_used_character_stats(matches)
+    """
+    Character usage stats, filtered, sorted and paginated on the server
+
+    Query params:
+    - min_matches: only characters with at least this many matches (default: 0)
+    - sort: one of CHARACTER_SORTS (default: winrate)
+    - order: asc or desc (default: desc, asc for name)
+    - offset/limit: page of the result (default: everything); the total
+      before paging goes in the X-Total-Count header
+    """
+    sort = request.args.get('sort', 'winrate')
+    if sort not in CHARACTER_SORTS:
+        return jsonify({'error': f"Unknown sort: {sort}", 'allowed': list(CHARACTER_SORTS)}), 400
+    order = request.args.get('order')
+    if order not in (None, 'asc', 'desc'):
+        return jsonify({'error': f"Unknown order: {order}", 'allowed': ['asc', 'desc']}), 400
 
-    usage_data = []
-    for char, stats in used_stats.items():
-        usage_data.append({
-            'character': char,
-            'wins': stats['wins'],
-            'matches': stats['matches'],
-            'usage': stats['usage'],
-            'winRate': stats['winRate']
-        })
+    min_matches = max(request.args.get('min_matches', 0, type=int), 0)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    limit = request.args.get('limit', type=int)
+    if limit is not None:
+        limit = max(limit, 0)
+
+    # As ordens ficam prontas no snapshot (uma vez por versão dos dados), não por requisição
+    index = report_scheduler.get('character_stats').derive('usage_index', build_character_index)
+    rows, total = query_character_index(index, sort, order, min_matches, offset, limit)
+
+    response = jsonify(rows)
+    response.headers['X-Total-Count'] = str(total)
+    return response
+
+
+PLAYER_SEARCH_MAX_LIMIT = 50
+
+@route('/api/players/search')
+def api_search_players():
+    """
+    Player autocomplete backed by the players_fts index
+
+    Query params:
+    - q: prefix search over name, ID, main character and region
+    - limit: max results (default: 10, max: 50)
+    """
+    query = request.args.get('q', '').strip()
+    limit = min(max(request.args.get('limit', 10, type=int), 1), PLAYER_SEARCH_MAX_LIMIT)
+
+    players = search_players(query, limit) if query else []
+
+    return jsonify({'query': query, 'players': players})
+
+
+@route('/api/stream')
+def api_stream():
+    """Server-sent events stream with live deltas for every new match"""
+    broker = get_broker(current_league())
+    # Cada cliente segura uma thread do worker: acima do limite ele tenta de novo depois
+    q = open_client(broker)
+    if q is None:
+        response = Response('Too many live stream clients', status=503, mimetype='text/plain')
+        response.headers['Retry-After'] = '30'
+        return response
+
+    # Reconexão do EventSource: manda antes o que foi gravado enquanto ele estava fora.
+    # Na primeira conexão o seq vem na URL, o do snapshot que montou a página
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id', '')
+    last_event_id = int(last_event_id) if last_event_id.isdigit() else None
+
+    response = Response(stream_with_context(broker.stream(q, last_event_id)), mimetype='text/event-stream')
+    # Se a resposta fechar antes do gerador começar, a inscrição não fica pendurada
+    response.call_on_close(lambda: broker.unsubscribe(q))
+    response.headers['Cache-Control'] = 'no-cache'
+    # Desligar o buffer de proxies como o nginx
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def _parse_time_param(name):
+    """Validate an ISO date/datetime query param, returning it normalized or aborting with 400"""
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value).isoformat()
+    except ValueError:
+        abort(400, description=f"Invalid {name}: expected an ISO date or datetime")
+
+
+@route('/api/export/matches.<fmt>')
+def api_export_matches(fmt):
+    """
+    Stream the match history as CSV or NDJSON straight from a DB cursor
+
+    Query params:
+    - start / end: ISO date or datetime range (start inclusive, end exclusive)
+    - character: only matches where this character played
+    """
+    if fmt not in EXPORT_FORMATS:
+        abort(404)
+
+    start = _parse_time_param('start')
+    end = _parse_time_param('end')
+    character = request.args.get('character')
+    if character and character not in TEKKEN_CHARS:
+        abort(400, description=f"Unknown character: {character}")
+
+    serializer, mimetype = EXPORT_FORMATS[fmt]
+    rows = iter_matches(start=start, end=end, character=character)
+
+    response = Response(stream_with_context(serializer(rows)), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=matches.{fmt}'
+    return response
+
+
+HEAD_TO_HEAD_MAX_RECENT = 100
+
+@route('/api/head-to-head/<player1_id>/<player2_id>')
+def api_head_to_head(player1_id, player2_id):
+    """
+    Record between two players from the (pair_lo, pair_hi, timestamp) index
+
+    Query params:
+    - start / end: ISO date or datetime range (start inclusive, end exclusive)
+    - recent: how many recent matches to return (default: 20, max: 100)
+    """
+    if player1_id == player2_id:
+        abort(400, description="Pick two different players")
+
+    player1 = get_player_by_id(player1_id)
+    player2 = get_player_by_id(player2_id)
+    if not player1 or not player2:
+        abort(404)
+
+    start = _parse_time_param('start')
+    end = _parse_time_param('end')
+    recent = min(max(request.args.get('recent', 20, type=int), 0), HEAD_TO_HEAD_MAX_RECENT)
+
+    record = get_head_to_head(player1_id, player2_id, start=start, end=end, recent=recent)
+    total = record['total_matches']
+    winrate = f"{record['player1_wins'] / total * 100:.1f}%" if total else '0%'
+
+    return jsonify({
+        'player1': player1,
+        'player2': player2,
+        'totals': {
+            'matches': total,
+            'player1_wins': record['player1_wins'],
+            'player2_wins': record['player2_wins'],
+            'player1_winrate': winrate
+        },
+        'characters': record['characters'],
+        'recent_matches': record['recent_matches']
+    })
+
+
+@route('/api/import/matches.csv', methods=['POST'])
+def api_import_matches():
+    """
+    Bulk import matches from CSV, parsed incrementally from the request stream
+
+    Send the CSV as the raw body (Content-Type: text/csv) to avoid any buffering,
+    or as a multipart upload in the 'file' field. With an Idempotency-Key header,
+    retrying the same upload skips the rows that were already imported.
+    """
+    batch_size = request.args.get('batch_size', 5000, type=int)
+
+    if 'file' in request.files:
+        raw = request.files['file'].stream
+    elif request.mimetype == 'text/csv':
+        raw = request.stream
+    else:
+        abort(400, description="Send the CSV as a text/csv body or in a 'file' upload field")
+
+    stream = io.TextIOWrapper(io.BufferedReader(raw) if isinstance(raw, io.RawIOBase) else raw,
+                              encoding='utf-8', newline='')
+    report = import_matches_csv(stream, batch_size=max(batch_size, 1),
+                                idempotency_key=request.headers.get('Idempotency-Key'))
+    logger.info(f"CSV import: {report['inserted']} inserted, {report['duplicates']} duplicates, "
+                f"{report['rejected']} rejected ({report['rows_per_sec']} rows/s)")
+
+    if report['inserted']:
+        report_scheduler.notify()
+    ok = report['inserted'] or report['duplicates'] or not report['rejected']
+    return jsonify(report), 200 if ok else 400
+
+
+DASHBOARD_FIELDS = ['stats', 'usage', 'used_characters', 'top_matchups']
+
+
+@route('/api/dashboard')
+def api_dashboard():
+    """
+    Painel consolidado, lido dos snapshots dos relatórios (mesma versão dos dados)
+
+    Query params:
+    - fields: campos de DASHBOARD_FIELDS separados por vírgula (padrão: todos)
+    - top: quantos confrontos voltam em top_matchups (padrão: 10)
+    """
+    fields_param = request.args.get('fields', '')
+    fields = [f.strip() for f in fields_param.split(',') if f.strip()] or DASHBOARD_FIELDS
+
+    unknown = [f for f in fields if f not in DASHBOARD_FIELDS]
+    if unknown:
+        return jsonify({
+            'error': f"Unknown fields: {', '.join(unknown)}",
+            'allowed': DASHBOARD_FIELDS
+        }), 400
+
+    top = request.args.get('top', 10, type=int)
+
+    payload = {}
+
+    # Personagens e confrontos do mesmo recálculo, sem reler as partidas
+    char_snapshot, matchups_snapshot = report_scheduler.get_all('character_stats', 'matchups')
+    used_stats = char_snapshot.value
+
+    if 'stats' in fields:
+        payload['stats'] = format_char_data(used_stats)
+    if 'usage' in fields:
+        payload['usage'] = format_usage_data(used_stats)
+
+    if 'used_characters' in fields:
+        used_chars = sorted(name for name, char_stats in used_stats.items() if char_stats['matches'])
+        payload['used_characters'] = {
+            'total': len(used_chars),
+            'characters': used_chars
+        }
+
+    if 'top_matchups' in fields:
+        payload['top_matchups'] = matchups_snapshot.value[:max(top, 0)]
+
+    return jsonify(payload)
+
+
+def warm_up(app):
+    """
+    Load the shared read-only state before a preforking server forks: migrations,
+    compiled templates, the render index, players and the report snapshots.
+    Connections opened here are closed again, the workers must open their own
+    """
+    with app.app_context():
+        init_db()
+
+        # Compilar todos os templates uma vez só (os workers herdam o cache do Jinja)
+        for name in app.jinja_env.list_templates(filter_func=lambda name: name.endswith('.html')):
+            app.jinja_env.get_template(name)
+
+        build_render_index()
+        load_players()
+
+        for name in list(report_scheduler.reports):
+            report_scheduler.get(name)
+
+    # Conexão SQLite não pode atravessar um fork
+    database.close_pools()
+    database.close_version_connections()
+
+
+def after_fork():
+    """Reset the per-process state a forked worker inherited from the master"""
+    # Threads não sobrevivem ao fork
+    restart_logging_listener()
+    # Nenhuma conexão deveria ter sobrado do master (warm_up fecha); as que sobraram não voltam pro pool
+    database.close_pools()
+    # Fragmentos e jogadores em cache dependem do data_version, que só vale na conexão de quem leu
+    fragment_cache.clear()
+    player_caches.clear()
+    # Este é por ETag (conteúdo), continuaria certo: limpa só pra não copiar as páginas do master
+    payload_cache.clear()
+    report_scheduler.after_fork()
+
+
+def warm_worker(app):
+    """Prime this worker's connections and caches and start its background jobs"""
+    ensure_app_ready()
+
+    connections = [database.get_db_connection() for _ in range(WARMUP_CONNECTIONS)]
+    for conn in connections:
+        conn.close()
+    database.get_data_version()
+
+    client = app.test_client()
+    for path in WARMUP_PATHS:
+        started = time.perf_counter()
+        try:
+            status = client.get(path).status_code
+        except Exception:
+            logger.exception(f"Warmup request failed: {path}")
+            continue
+        logger.info(f"Warmup {path} -> {status} in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+
+_app_lock = threading.Lock()
 
-    return jsonify(usage_data)
+def __getattr__(name):
+    # `tekkenapp.app` continua funcionando (flask run, scripts), criado só no primeiro acesso
+    if name == 'app':
+        with _app_lock:
+            if 'app' not in globals():
+                globals()['app'] = create_app()
+        return globals()['app']
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 if __name__ == '__main__':
+    app = create_app()
     port = int(os.getenv('FLASK_PORT', 5000))
     host = os.getenv('FLASK_HOST', '127.0.0.1')
     logger.info(f"Iniciando Tekken Stats em {host}:{port}")
@@ -0,0 +1,85 @@
+"""
+testes do /api/character-usage: filtro, ordenação, paginação e o X-Total-Count
+rodam num banco temporário, sem as threads de segundo plano (o snapshot dos
+relatórios é recalculado na própria requisição quando o banco muda)
+"""
+
+import pytest
+
+import database
+
+# Kazuya 3/4, Jin 2/5, Law 0/3, Paul 2/2 (vitórias/partidas)
+MATCHES = [('Kazuya', 'Jin', 'Kazuya')] * 3 + [('Jin', 'Law', 'Jin')] * 2 + [
+    ('Law', 'Paul', 'Paul'),
+    ('Kazuya', 'Paul', 'Paul'),
+]
+
+
+def _match(p1, p2, winner):
+    return {'player1': p1, 'player2': p2, 'winner': winner,
+            'player1_char': p1, 'player2_char': p2, 'winner_char': winner}
+
+
+@pytest.fixture
+def client(client):
+    """cliente do conftest com as partidas de exemplo gravadas"""
+    database.add_matches([_match(*m) for m in MATCHES])
+    return client
+
+
+def _characters(response):
+    return [row['character'] for row in response.get_json()]
+
+
+def test_default_is_winrate_desc(client):
+    response = client.get('/api/character-usage')
+    assert response.status_code == 200
+    assert _characters(response) == ['Paul', 'Kazuya', 'Jin', 'Law']
+    assert response.headers['X-Total-Count'] == '4'
+
+    kazuya = response.get_json()[1]
+    assert kazuya == {'character': 'Kazuya', 'wins': 3, 'matches': 4, 'usage': 4, 'winRate': '75.0%'}
+
+
+@pytest.mark.parametrize('query, expected', [
+    ('sort=matches', ['Jin', 'Kazuya', 'Law', 'Paul']),
+    ('sort=matches&order=asc', ['Paul', 'Law', 'Kazuya', 'Jin']),
+    ('sort=winrate&order=asc', ['Law', 'Jin', 'Kazuya', 'Paul']),
+    ('sort=wins', ['Kazuya', 'Jin', 'Paul', 'Law']),
+    ('sort=name', ['Jin', 'Kazuya', 'Law', 'Paul']),
+    ('sort=name&order=desc', ['Paul', 'Law', 'Kazuya', 'Jin']),
+])
+def test_sorts(client, query, expected):
+    assert _characters(client.get(f'/api/character-usage?{query}')) == expected
+
+
+def test_min_matches_filters_before_counting(client):
+    response = client.get('/api/character-usage?min_matches=3')
+    assert _characters(response) == ['Kazuya', 'Jin', 'Law']
+    assert response.headers['X-Total-Count'] == '3'
+
+
+def test_pagination_keeps_the_total(client):
+    response = client.get('/api/character-usage?sort=matches&offset=1&limit=2')
+    assert _characters(response) == ['Kazuya', 'Law']
+    assert response.headers['X-Total-Count'] == '4'
+
+    past_the_end = client.get('/api/character-usage?offset=10')
+    assert past_the_end.get_json() == []
+    assert past_the_end.headers['X-Total-Count'] == '4'
+
+
+@pytest.mark.parametrize('query', ['sort=bogus', 'order=sideways'])
+def test_invalid_params_are_rejected(client, query):
+    response = client.get(f'/api/character-usage?{query}')
+    assert response.status_code == 400
+    assert 'allowed' in response.get_json()
+
+
+def test_new_matches_show_up(client):
+    client.get('/api/character-usage')
+    database.add_matches([_match('Law', 'Paul', 'Law')] * 4)
+
+    response = client.get('/api/character-usage?sort=matches&limit=1')
+    assert response.get_json()[0] == {'character': 'Law', 'wins': 4, 'matches': 7, 'usage': 7,
+                                      'winRate': '57.1%'}
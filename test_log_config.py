@@ -0,0 +1,65 @@
+"""
+testes do logging pela fila (log_config.py): o registro passa pelo QueueHandler
+e pelo listener antes de chegar no arquivo, em JSON ou texto
+"""
+
+import json
+import logging
+
+import pytest
+
+import log_config
+
+
+@pytest.fixture
+def log_file(tmp_path, monkeypatch):
+    """configure_logging() gravando num arquivo temporário; devolve o root como estava"""
+    path = tmp_path / 'app.log'
+    monkeypatch.setattr(log_config, 'LOG_FILE', str(path))
+    monkeypatch.setattr(log_config, 'LOG_MAX_BYTES', 0)
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    log_config.stop_logging()
+    yield path
+    log_config.stop_logging()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    for handler in handlers:
+        root.addHandler(handler)
+    root.setLevel(level)
+
+
+def _log_exception(logger):
+    try:
+        1 / 0
+    except ZeroDivisionError:
+        logger.exception('conta falhou: %s', 'divisão')
+
+
+def test_json_entry_keeps_the_exception(log_file, monkeypatch):
+    monkeypatch.setattr(log_config, 'LOG_FORMAT', 'json')
+    listener = log_config.configure_logging()
+    _log_exception(logging.getLogger('tekken.test'))
+    # para o listener: a fila é esvaziada no arquivo
+    log_config.stop_logging()
+    for handler in listener.handlers:
+        handler.close()
+
+    entry = json.loads(log_file.read_text(encoding='utf-8').splitlines()[-1])
+    assert entry['message'] == 'conta falhou: divisão'
+    assert entry['level'] == 'ERROR'
+    assert entry['exception'].startswith('Traceback')
+    assert 'ZeroDivisionError' in entry['exception']
+
+
+def test_text_line_still_has_the_traceback(log_file, monkeypatch):
+    monkeypatch.setattr(log_config, 'LOG_FORMAT', 'text')
+    listener = log_config.configure_logging()
+    _log_exception(logging.getLogger('tekken.test'))
+    log_config.stop_logging()
+    for handler in listener.handlers:
+        handler.close()
+
+    text = log_file.read_text(encoding='utf-8')
+    assert 'conta falhou: divisão' in text
+    assert 'ZeroDivisionError: division by zero' in text
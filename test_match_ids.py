@@ -0,0 +1,133 @@
+"""
+testes da sequência de IDs de partida (hi/lo) e da chave de idempotência
+rodam num banco temporário; os de vários processos usam fork (só POSIX)
+"""
+
+import multiprocessing
+import sqlite3
+import sys
+
+import pytest
+
+import archive
+import database
+
+MATCH = {'player1': 'Jin', 'player2': 'Law', 'winner': 'Jin',
+         'player1_char': 'Jin', 'player2_char': 'Law', 'winner_char': 'Jin'}
+
+fork_only = pytest.mark.skipif(sys.platform == 'win32', reason='precisa de fork')
+
+
+def _match(**fields):
+    return {**MATCH, **fields}
+
+
+def _allocate(path, count):
+    # processo filho: nada do pool do pai serve aqui
+    database.close_pools()
+    database.DATABASE_PATH = path
+    return database.allocate_match_ids(count)
+
+
+def _insert(path, count):
+    database.close_pools()
+    database.DATABASE_PATH = path
+    return [database.insert_match(_match())[0] for _ in range(count)]
+
+
+def _count_matches(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute('SELECT COUNT(*) FROM matches').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_ids_grow_inside_a_process(db, monkeypatch):
+    monkeypatch.setattr(database, 'ID_BLOCK_SIZE', 5)
+    ids = database.allocate_match_ids(3) + database.allocate_match_ids(12)
+    assert ids == sorted(ids)
+    assert len(set(ids)) == 15
+
+
+@fork_only
+def test_ids_are_unique_across_processes(db, monkeypatch):
+    # bloco pequeno: cada processo vai várias vezes na id_sequence, disputando com os outros
+    monkeypatch.setattr(database, 'ID_BLOCK_SIZE', 7)
+    with multiprocessing.get_context('fork').Pool(4) as pool:
+        results = pool.starmap(_allocate, [(db, 100)] * 4)
+
+    ids = [i for result in results for i in result]
+    assert len(ids) == 400
+    assert len(set(ids)) == 400
+
+
+@fork_only
+def test_concurrent_inserts_do_not_collide(db, monkeypatch):
+    monkeypatch.setattr(database, 'ID_BLOCK_SIZE', 3)
+    with multiprocessing.get_context('fork').Pool(4) as pool:
+        results = pool.starmap(_insert, [(db, 25)] * 4)
+
+    ids = [i for result in results for i in result]
+    assert len(set(ids)) == 100
+    assert _count_matches(db) == 100
+
+
+def test_repeated_key_returns_the_first_id(db):
+    first_id, created = database.insert_match(_match(idempotency_key='form-1'))
+    assert created
+
+    again_id, created = database.insert_match(_match(idempotency_key='form-1'))
+    assert not created
+    assert again_id == first_id
+    assert _count_matches(db) == 1
+
+
+def test_batch_skips_known_and_repeated_keys(db):
+    assert database.add_matches([_match(idempotency_key='a'), _match(idempotency_key='b')]) == 2
+    # reenvio do mesmo lote + uma chave repetida dentro do próprio lote
+    batch = [_match(idempotency_key='a'), _match(idempotency_key='c'), _match(idempotency_key='c')]
+    assert database.add_matches(batch) == 1
+    assert _count_matches(db) == 3
+
+
+def test_key_with_different_match_is_a_conflict(db):
+    database.insert_match(_match(idempotency_key='form-2'))
+
+    with pytest.raises(database.IdempotencyKeyConflict):
+        database.insert_match(_match(idempotency_key='form-2', winner='Law', winner_char='Law'))
+    # o timestamp não entra na conferência: o /add usa a hora de cada envio
+    _, created = database.insert_match(_match(idempotency_key='form-2', timestamp='2030-01-01T00:00:00'))
+    assert not created
+    assert _count_matches(db) == 1
+
+
+def test_batch_with_conflicting_key_writes_nothing(db):
+    database.add_matches([_match(idempotency_key='a')])
+
+    batch = [_match(idempotency_key='b'), _match(idempotency_key='a', player2_char='Paul')]
+    with pytest.raises(database.IdempotencyKeyConflict):
+        database.add_matches(batch)
+    assert _count_matches(db) == 1
+
+
+def test_key_survives_archiving(db):
+    match_id, _ = database.insert_match(_match(idempotency_key='old', timestamp='2020-01-05T10:00:00'))
+    assert archive.archive_matches(before='2021-01-01') == {'2020-01': 1}
+    assert _count_matches(db) == 0
+
+    again_id, created = database.insert_match(_match(idempotency_key='old', timestamp='2020-01-05T10:00:00'))
+    assert not created
+    assert again_id == match_id
+
+
+def test_id_written_outside_the_sequence_is_retried(db, monkeypatch):
+    monkeypatch.setattr(database, 'ID_BLOCK_SIZE', 10)
+    next_id = database.allocate_match_ids(1)[0] + 1
+    # alguém gravou com um id que está no bloco deste processo
+    database.insert_match(_match(id=next_id))
+
+    match_id, created = database.insert_match(_match())
+    assert created
+    assert match_id != next_id
+    assert _count_matches(db) == 2
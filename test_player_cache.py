@@ -0,0 +1,93 @@
+"""
+testes do cache de jogadores (player_cache.py) com mais de um processo gravando:
+a lista completa e o "não existe" só valem enquanto o data_version não muda,
+e ID repetido gravado por outro processo ainda vira 400 na rota
+"""
+
+import multiprocessing
+import sqlite3
+import sys
+
+import pytest
+
+import database
+from player_cache import player_caches
+
+fork_only = pytest.mark.skipif(sys.platform == 'win32', reason='precisa de fork')
+
+ALICE = {'id': 'p1', 'name': 'Alice', 'main_char': 'Jin', 'rank': 'Tekken King', 'region': 'EU'}
+BRUNO = {'id': 'p2', 'name': 'Bruno', 'main_char': 'Law', 'rank': 'Dan', 'region': 'SA'}
+
+
+@pytest.fixture
+def db(db, monkeypatch):
+    """banco do conftest com o cache de jogadores ligado"""
+    monkeypatch.setattr(player_caches, 'max_entries', 100)
+    return db
+
+
+def _add_in_other_process(path, player):
+    # outro worker: conexões e cache próprios
+    ctx = multiprocessing.get_context('fork')
+    child = ctx.Process(target=_add_player, args=(path, player))
+    child.start()
+    child.join()
+    assert child.exitcode == 0
+
+
+def _add_player(path, player):
+    database.close_pools()
+    database.close_version_connections()
+    player_caches.clear()
+    database.DATABASE_PATH = path
+    database.add_player(player)
+
+
+def test_complete_list_is_served_from_memory(db):
+    database.add_player(ALICE)
+    assert [p['id'] for p in database.get_all_players()] == ['p1']
+
+    hits = player_caches.get(db).hits
+    assert [p['id'] for p in database.get_all_players()] == ['p1']
+    assert database.get_player_by_id('nobody') is None
+    assert player_caches.get(db).hits == hits + 2
+
+
+@fork_only
+def test_player_added_by_another_process_is_found(db):
+    database.add_player(ALICE)
+    database.get_all_players()
+    # cache completo: até aqui "p2 não existe" é resposta do próprio cache
+    assert database.get_player_by_id('p2') is None
+
+    _add_in_other_process(db, BRUNO)
+
+    assert database.get_player_by_id('p2') == BRUNO
+    assert [p['id'] for p in database.get_all_players()] == ['p1', 'p2']
+
+
+@fork_only
+def test_list_loaded_before_another_write_is_not_reused(db):
+    database.get_all_players()
+    _add_in_other_process(db, ALICE)
+    assert [p['name'] for p in database.get_all_players()] == ['Alice']
+
+
+def test_duplicate_id_raises_and_keeps_the_first(db):
+    database.add_player(ALICE)
+    with pytest.raises(sqlite3.IntegrityError):
+        database.add_player({**BRUNO, 'id': 'p1'})
+    assert database.get_player_by_id('p1') == ALICE
+
+
+@fork_only
+def test_route_rejects_an_id_only_the_database_knows(db, client):
+    # este processo já leu a lista sem o p1; outro worker grava o p1 depois
+    database.get_all_players()
+    _add_in_other_process(db, ALICE)
+
+    form = {'player_id': 'p1', 'name': 'Outra', 'main_char': 'Paul', 'rank': 'Dan', 'region': 'NA'}
+    response = client.post('/player/add', data=form)
+    assert response.status_code == 400
+    assert response.get_data(as_text=True) == 'Player ID already exists!'
+    assert database.get_player_by_id('p1') == ALICE
@@ -0,0 +1,156 @@
+"""
+testes dos contadores em memória compartilhada (shared_stats.py): leitura pelo
+seqlock sem retrato pela metade, escritor morto no meio da escrita e gravações
+durante a remontagem. só POSIX (flock + fork)
+"""
+
+import multiprocessing
+import os
+import threading
+
+import pytest
+
+import database
+import shared_stats
+from shared_stats import H_SEQ, H_STATE, H_TOTAL, STATE_EMPTY, STATE_READY, SharedStats
+
+pytestmark = pytest.mark.skipif(shared_stats.fcntl is None, reason='precisa de flock (POSIX)')
+
+CHARACTERS = ['Jin', 'Law', 'Paul']
+
+
+@pytest.fixture
+def store(tmp_path):
+    """bloco próprio do teste, já montado e vazio"""
+    stats = SharedStats(str(tmp_path / 'tekken_stats.db'), CHARACTERS)
+    with stats.locked():
+        stats.reset()
+    yield stats
+    stats.unlink()
+
+
+@pytest.fixture
+def db(db, monkeypatch):
+    """banco do conftest com SHARED_STATS ligado"""
+    monkeypatch.setattr(shared_stats, 'SHARED_STATS', True)
+    yield db
+    shared_stats.get_store(db).unlink()
+    shared_stats._stores.pop(db, None)
+
+
+def _consistent(store, values) -> bool:
+    # cada partida soma 1 no total, 2 em partidas, 1 em vitórias e 1 em confrontos
+    n = store.n
+    total = values[H_TOTAL]
+    return (sum(values[store.matches_at:store.matches_at + n]) == 2 * total
+            and sum(values[store.wins_at:store.wins_at + n]) == total
+            and sum(values[store.matchups_at:store.matchups_at + n * n]) == total)
+
+
+def _write_many(path, rounds):
+    stats = SharedStats(path, CHARACTERS)
+    for _ in range(rounds):
+        with stats.locked():
+            stats.record([('Jin', 'Law', 'Jin'), ('Law', 'Paul', 'Paul'), ('Paul', 'Paul', 'Paul')])
+    stats.close()
+
+
+def _die_mid_write(path, characters=CHARACTERS):
+    stats = SharedStats(path, characters)
+    with stats.locked():
+        with stats._writing() as counters:
+            counters[H_TOTAL] += 1
+            # SIGKILL do gunicorn no meio da escrita: seq fica ímpar, nada de finally
+            os._exit(0)
+
+
+def _loader(matchups):
+    def load(pinned=None):
+        if pinned:
+            pinned()
+        return dict(matchups)
+    return load
+
+
+def test_readers_never_see_a_torn_update(store):
+    writer = multiprocessing.get_context('fork').Process(target=_write_many, args=(store.path, 2000))
+    writer.start()
+
+    reads = 0
+    while writer.is_alive() or reads == 0:
+        values = store._read()
+        if values is not None:
+            assert _consistent(store, values)
+            reads += 1
+    writer.join()
+
+    assert writer.exitcode == 0
+    assert store.character_totals(_loader({}))['total_matches'] == 6000
+
+
+def test_writers_in_the_same_process_share_the_lock(store):
+    threads = [threading.Thread(target=_write_many, args=(store.path, 200)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    totals = store.character_totals(_loader({}))
+    assert totals['total_matches'] == 2400
+    assert totals['characters']['Paul'] == {'matches': 2400, 'wins': 1600}
+
+
+def test_dead_writer_is_healed_and_rebuilt(store):
+    child = multiprocessing.get_context('fork').Process(target=_die_mid_write, args=(store.path,))
+    child.start()
+    child.join()
+    assert store.counters[H_SEQ] % 2 == 1
+
+    # a leitura desiste no prazo e conserta o seq (o flock morreu junto com o processo)
+    assert store._read() is None
+    assert store.counters[H_SEQ] % 2 == 0
+    assert store.counters[H_STATE] == STATE_EMPTY
+
+    # a próxima leitura remonta do banco, sem o +1 que ficou pela metade
+    totals = store.character_totals(_loader({('Jin', 'Law'): 2}))
+    assert totals == {'total_matches': 2, 'characters': {'Jin': {'matches': 2, 'wins': 2},
+                                                         'Law': {'matches': 2, 'wins': 0}}}
+    assert store.counters[H_STATE] == STATE_READY
+
+
+def test_writes_during_a_rebuild_are_not_lost(store):
+    def load(pinned=None):
+        pinned()
+        # gravação de outro worker no meio da varredura: o flock já foi solto
+        with store.locked():
+            store.record([('Law', 'Paul', 'Law')])
+        return {('Jin', 'Paul'): 3}
+
+    assert store.rebuild(load)
+    assert store.matchup_totals(_loader({})) == {('Jin', 'Paul'): 3, ('Law', 'Paul'): 1}
+
+
+def test_invalidate_during_a_rebuild_discards_it(store):
+    def load(pinned=None):
+        pinned()
+        store.invalidate()
+        return {('Jin', 'Paul'): 3}
+
+    assert not store.rebuild(load)
+    assert store.counters[H_STATE] == STATE_EMPTY
+
+
+def test_counters_follow_the_database(db):
+    database.add_matches([{'player1': p1, 'player2': p2, 'winner': w,
+                           'player1_char': p1, 'player2_char': p2, 'winner_char': w}
+                          for p1, p2, w in [('Jin', 'Law', 'Jin'), ('Paul', 'Paul', 'Paul')] * 5])
+    assert database.get_shared_character_totals() == database.get_character_totals()
+
+    # escritor morto: a leitura cai pro SQLite e continua certa
+    child = multiprocessing.get_context('fork').Process(target=_die_mid_write,
+                                                        args=(db, shared_stats.TEKKEN_CHARS))
+    child.start()
+    child.join()
+    assert database.get_shared_character_totals() == database.get_character_totals()
+    # e depois do conserto os contadores voltam a ser servidos da memória
+    assert shared_stats.get_store(db).character_totals(database.get_matchup_totals) == database.get_character_totals()
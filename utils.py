@@ -156,10 +156,26 @@ def get_used_characters(matches):
     return sorted(list(used_chars))
 
 
+def stats_from_totals(characters):
+    # mesmo formato do calculate_stats a partir de contadores já somados ({char: {matches, wins}})
+    stats = {char: {"wins": 0, "matches": 0, "usage": 0, "winRate": "0%"} for char in TEKKEN_CHARS}
+
+    for char, counts in characters.items():
+        entry = stats.setdefault(char, {"wins": 0, "matches": 0, "usage": 0, "winRate": "0%"})
+        entry["matches"] = entry["usage"] = counts["matches"]
+        entry["wins"] = counts["wins"]
+        if counts["matches"] > 0:
+            entry["winRate"] = f"{counts['wins'] / counts['matches'] * 100:.1f}%"
+
+    return stats
+
+
 def get_used_character_stats(matches):
     # retorna estatísticas só dos personagens que já foram usados
-    all_stats = calculate_stats(matches)
+    return sort_used_character_stats(calculate_stats(matches))
 
+
+def sort_used_character_stats(all_stats):
     # filtra personagens com 0 partidas
     used_stats = {
         char: stats
@@ -167,11 +183,54 @@ def get_used_character_stats(matches):
         if stats['matches'] > 0
     }
 
-    # ordena por taxa de vitória e depois por partidas
+    # ordena por taxa de vitória e depois por partidas (números, sem reler a string do winRate)
     sorted_stats = dict(sorted(
         used_stats.items(),
-        key=lambda x: (float(x[1]['winRate'].rstrip('%')), x[1]['matches']),
+        key=lambda x: (x[1]['wins'] / x[1]['matches'], x[1]['matches']),
         reverse=True
     ))
 
-    return sorted_stats
\ No newline at end of file
+    return sorted_stats
+
+
+# critérios de ordenação do /api/character-usage: chave crescente e a ordem padrão
+CHARACTER_SORTS = {
+    'winrate': (lambda row: (row['wins'] / row['matches'], row['matches']), 'desc'),
+    'matches': (lambda row: (row['matches'], row['wins']), 'desc'),
+    'usage': (lambda row: (row['usage'], row['wins']), 'desc'),
+    'wins': (lambda row: (row['wins'], row['matches']), 'desc'),
+    'name': (lambda row: row['character'].lower(), 'asc'),
+}
+
+
+def build_character_index(used_stats):
+    # linhas de uso dos personagens + uma lista de posições já ordenada (crescente) por critério
+    # montado uma vez por snapshot; cada requisição só percorre a lista na ordem pedida
+    rows = [
+        {
+            'character': char,
+            'wins': stats['wins'],
+            'matches': stats['matches'],
+            'usage': stats['usage'],
+            'winRate': stats['winRate']
+        }
+        for char, stats in used_stats.items()
+        if stats['matches'] > 0
+    ]
+    orders = {
+        sort: sorted(range(len(rows)), key=lambda i, key=key: key(rows[i]))
+        for sort, (key, _) in CHARACTER_SORTS.items()
+    }
+    return rows, orders
+
+
+def query_character_index(index, sort='winrate', order=None, min_matches=0, offset=0, limit=None):
+    # filtra e pagina seguindo a ordem pronta; devolve (linhas, total que passou no filtro)
+    rows, orders = index
+    positions = orders[sort]
+    if (order or CHARACTER_SORTS[sort][1]) == 'desc':
+        positions = reversed(positions)
+
+    selected = [rows[i] for i in positions if rows[i]['matches'] >= min_matches]
+    end = None if limit is None else offset + limit
+    return selected[offset:end], len(selected)
\ No newline at end of file
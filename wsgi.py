@@ -0,0 +1,23 @@
+"""
+entrada WSGI de produção do Tekken Stats
+com o gunicorn em preload este arquivo é importado uma vez só, no master:
+o app é criado e o warm_up carrega antes do fork o que é só leitura
+(migrações, templates compilados, índice de renders, jogadores e snapshots
+dos relatórios), então todo worker já nasce com isso na memória
+(copy-on-write). o que não atravessa o fork fica nos hooks do gunicorn.conf.py
+
+Como usar:
+    gunicorn -c gunicorn.conf.py
+    WARMUP=false gunicorn -c gunicorn.conf.py    # sobe sem aquecer
+"""
+
+import os
+
+from tekkenapp import create_app, warm_up
+
+WARMUP = os.getenv('WARMUP', 'True').lower() == 'true'
+
+app = create_app()
+
+if WARMUP:
+    warm_up(app)